@@ -0,0 +1,156 @@
+"""
+Concurrent-client load driver for the webform endpoint.
+
+Opens N keep-alive connections and posts leads as fast as each connection
+allows for a fixed duration, then reports throughput and latency. Run it
+against the WSGI and ASGI deployments to compare them (see
+benchmarks/README.md).
+
+Usage:
+    python -m benchmarks.bench_concurrency --url http://127.0.0.1:8000/api/v1/leads/webform \\
+        --lo-slug john-smith --concurrency 50 200 500 --duration 30
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+from urllib.parse import urlsplit
+
+
+async def _post(reader, writer, host, path, body):
+    writer.write(
+        (
+            f"POST {path} HTTP/1.1\r\n"
+            f"Host: {host}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "\r\n"
+        ).encode() + body
+    )
+    await writer.drain()
+
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("Server closed connection")
+    status = int(status_line.split()[1])
+
+    length = 0
+    chunked = False
+    close = False
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        name = name.strip().lower()
+        if name == "content-length":
+            length = int(value)
+        elif name == "transfer-encoding" and "chunked" in value.lower():
+            chunked = True
+        elif name == "connection" and value.strip().lower() == "close":
+            close = True
+    if chunked:
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            await reader.readexactly(size + 2)  # chunk data + CRLF
+            if size == 0:
+                break
+    else:
+        await reader.readexactly(length)
+    return status, close
+
+
+async def _client(url, lo_slug, deadline, latencies, statuses):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    reader = writer = None
+
+    while time.monotonic() < deadline:
+        if writer is None:
+            reader, writer = await asyncio.open_connection(host, port)
+        body = json.dumps({
+            "lo_slug": lo_slug,
+            "first_name": "Load",
+            "last_name": "Test",
+            "email": f"load-{uuid.uuid4().hex[:12]}@example.com",
+            "phone": "555-0100",
+        }).encode()
+
+        start = time.perf_counter()
+        try:
+            status, close = await _post(reader, writer, parts.netloc, parts.path, body)
+        except (ConnectionError, asyncio.IncompleteReadError, OSError):
+            statuses["error"] = statuses.get("error", 0) + 1
+            writer.close()
+            writer = None
+            continue
+        latencies.append((time.perf_counter() - start) * 1000)
+        statuses[status] = statuses.get(status, 0) + 1
+
+        if close:
+            writer.close()
+            writer = None
+
+    if writer is not None:
+        writer.close()
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+async def run(url, lo_slug, concurrency, duration):
+    latencies, statuses = [], {}
+    deadline = time.monotonic() + duration
+    started = time.monotonic()
+    await asyncio.gather(*(
+        _client(url, lo_slug, deadline, latencies, statuses) for _ in range(concurrency)
+    ))
+    elapsed = time.monotonic() - started
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "mean_ms": round(statistics.mean(latencies), 2) if latencies else 0.0,
+        "statuses": {str(k): v for k, v in statuses.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default="http://127.0.0.1:8000/api/v1/leads/webform")
+    parser.add_argument("--lo-slug", required=True)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[50, 200, 500])
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--label", default="", help="Name of the deployment under test (e.g. wsgi, asgi)")
+    parser.add_argument("--output", help="Append JSON results to this file")
+    args = parser.parse_args()
+
+    results = []
+    for concurrency in args.concurrency:
+        result = asyncio.run(run(args.url, args.lo_slug, concurrency, args.duration))
+        result["label"] = args.label
+        results.append(result)
+        print(
+            f"{args.label:<6} c={concurrency:<4} rps={result['rps']:<8} "
+            f"p50={result['p50_ms']}ms p95={result['p95_ms']}ms p99={result['p99_ms']}ms "
+            f"statuses={result['statuses']}"
+        )
+
+    if args.output:
+        with open(args.output, "a") as f:
+            for result in results:
+                f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,514 @@
+"""
+End-to-end load test: webform -> outbox relay -> Service Bus -> worker -> Total Expert.
+
+Starts the Django app (a threaded WSGI server in a child process) on a
+throwaway SQLite database, the outbox relay and the lead worker (threads or
+asyncio mode) in this process against FakeServiceBusTransport, and the
+worker's Total Expert calls against FakeTotalExpertServer. Both fakes take
+latency and error injection; the Total Expert fake can also answer 429s.
+
+Posts --leads leads to /api/v1/leads/webform at --rate leads/sec (0 = as
+fast as --concurrency clients allow), waits until every lead is SYNCED or
+FAILED (or --timeout), and reports:
+
+- webform throughput and p50/p95/p99 latency (with --rate, measured from
+  each request's scheduled start, so a server falling behind shows up)
+- p50/p95/p99 from submission to queued and to synced, and synced leads/sec
+- SQL statements per lead for the web app, the relay and the worker
+  (BEGIN/COMMIT excluded, as in bench_worker_batch)
+
+--output writes the results as JSON; --compare prints the change between
+two result files, e.g. before and after a commit. Everything shares one
+machine (and this process's GIL for the relay, worker and fakes), so
+compare runs from the same host and settings, not absolute numbers.
+
+Usage:
+    python -m benchmarks.bench_e2e --leads 500 --rate 100 --output before.json
+    python -m benchmarks.bench_e2e --leads 500 --rate 100 --te-latency-ms 80 \\
+        --te-error-rate 0.05 --te-throttle-rate 0.02 --worker-mode asyncio --output after.json
+    python -m benchmarks.bench_e2e --compare before.json after.json
+"""
+
+import argparse
+import http.client
+import itertools
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from benchmarks import django_env
+from benchmarks.bench_concurrency import percentile
+from leads.testing import (
+    FakeAsyncAutoLockRenewer,
+    FakeAutoLockRenewer,
+    FakeServiceBusTransport,
+    FakeTotalExpertServer,
+)
+
+WEBFORM_PATH = "/api/v1/leads/webform"
+RELAY_THREAD = "outbox-relay"
+TRANSACTION_STATEMENTS = {"BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE"}
+
+
+class QueryCounter:
+    """
+    Counts the SQL data statements of every DB connection opened after
+    install(), by the role of the thread that runs them (None = not counted).
+
+    Also starts SQLite transactions with BEGIN IMMEDIATE. With the default
+    deferred BEGIN, a transaction that reads and then writes (the relay's
+    claim, the web app's idempotency check) fails at once with "database is
+    locked" when another process wrote in between, instead of waiting like
+    MySQL's row locks do.
+    """
+
+    def __init__(self, role):
+        self.role = role  # callable returning the current thread's role
+        self.lock = threading.Lock()
+        self.counts = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql == "BEGIN":
+            sql = "BEGIN IMMEDIATE"
+        elif sql.split(None, 1)[0].upper() not in TRANSACTION_STATEMENTS:
+            role = self.role()
+            if role is not None:
+                with self.lock:
+                    self.counts[role] = self.counts.get(role, 0) + 1
+        return execute(sql, params, many, context)
+
+    def install(self):
+        from django.db.backends.signals import connection_created
+
+        connection_created.connect(self._connection_created, weak=False)
+
+    def _connection_created(self, sender, connection, **kwargs):
+        connection.execute_wrappers.append(self)
+
+
+# ---------------------------------------------------------------------------
+# Web app (child process)
+# ---------------------------------------------------------------------------
+
+def serve_web(db_path):
+    """
+    Serve the Django app on a free port until stdin closes. Prints the port,
+    then, on exit, the number of SQL statements it ran.
+    """
+    from socketserver import ThreadingMixIn
+    from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+    queries = QueryCounter(lambda: "web")
+    queries.install()
+    django_env.setup(db_path)
+
+    from django.core.wsgi import get_wsgi_application
+
+    class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+        daemon_threads = True
+        request_queue_size = 1024
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+    server = make_server("127.0.0.1", 0, get_wsgi_application(), ThreadingWSGIServer, QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(server.server_address[1], flush=True)
+
+    sys.stdin.read()
+    server.shutdown()
+    print(json.dumps(queries.counts), flush=True)
+
+
+def start_web(db_path):
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.bench_e2e", "--serve-web", db_path],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    port = process.stdout.readline().strip()
+    if not port:
+        process.kill()
+        raise RuntimeError("Web server did not start")
+    return process, int(port)
+
+
+def stop_web(process):
+    """Stop the web app; returns its SQL statement count."""
+    process.stdin.close()
+    counts = json.loads(process.stdout.readline() or "{}")
+    process.wait(timeout=30)
+    return counts.get("web", 0)
+
+
+# ---------------------------------------------------------------------------
+# Load
+# ---------------------------------------------------------------------------
+
+def post_leads(port, lo_slug, total, rate, concurrency):
+    """Post `total` leads from `concurrency` client threads; returns (latencies in ms, statuses, seconds)."""
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+    slots = itertools.count()
+    started = time.perf_counter()
+
+    def client():
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        while True:
+            slot = next(slots)
+            if slot >= total:
+                break
+            if rate:
+                scheduled = started + slot / rate
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            else:
+                scheduled = time.perf_counter()
+            body = json.dumps({
+                "lo_slug": lo_slug,
+                "first_name": "Load",
+                "last_name": "Test",
+                "email": f"e2e-{uuid.uuid4().hex[:12]}@example.com",
+                "phone": "555-0100",
+            })
+            try:
+                connection.request("POST", WEBFORM_PATH, body, {"Content-Type": "application/json"})
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                status = "error"
+            elapsed = (time.perf_counter() - scheduled) * 1000
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+        connection.close()
+
+    threads = [threading.Thread(target=client, name=f"load-{i}") for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, statuses, time.perf_counter() - started
+
+
+def run_relay(stop, batch_size, poll_interval, errors):
+    """The relay_lead_outbox loop, until `stop` is set."""
+    from django.db import close_old_connections, connection
+    from leads.outbox import relay_batch
+
+    while not stop.is_set():
+        close_old_connections()
+        try:
+            relayed = relay_batch(batch_size)
+        except Exception as e:
+            errors.append(str(e))
+            stop.wait(poll_interval * 5)
+            continue
+        if relayed < batch_size:
+            stop.wait(poll_interval)
+    connection.close()
+
+
+def watch_leads(worker, expected, load_done, deadline, result):
+    """Stop the worker once `expected` leads are SYNCED or FAILED, or at `deadline`."""
+    from django.db import connection
+    from leads.models import LeadStatus, LeadSubmission
+
+    while time.monotonic() < deadline:
+        if load_done.is_set():
+            finished = LeadSubmission.objects.filter(status__in=[LeadStatus.SYNCED, LeadStatus.FAILED]).count()
+            if finished >= expected:
+                break
+        time.sleep(0.2)
+    else:
+        result["timed_out"] = True
+    connection.close()
+    worker.shutdown_requested.set()
+
+
+# ---------------------------------------------------------------------------
+# Results
+# ---------------------------------------------------------------------------
+
+def latency_summary(samples, prefix=""):
+    return {
+        f"{prefix}p50_ms": round(percentile(samples, 50), 2),
+        f"{prefix}p95_ms": round(percentile(samples, 95), 2),
+        f"{prefix}p99_ms": round(percentile(samples, 99), 2),
+    }
+
+
+def pipeline_summary():
+    from leads.models import LeadStatus, LeadSubmission
+
+    rows = list(LeadSubmission.objects.values_list("status", "submitted_at", "queued_at", "synced_at"))
+    counts = {}
+    for status, *_ in rows:
+        counts[status] = counts.get(status, 0) + 1
+    to_queued = [(queued - submitted).total_seconds() * 1000 for _, submitted, queued, _ in rows if queued]
+    synced = [(submitted, synced) for status, submitted, _, synced in rows if status == LeadStatus.SYNCED and synced]
+    to_synced = [(synced_at - submitted).total_seconds() * 1000 for submitted, synced_at in synced]
+
+    span = 0.0
+    if synced:
+        span = (max(s for _, s in synced) - min(s for s, _ in synced)).total_seconds()
+    return {
+        "statuses": counts,
+        "synced": len(synced),
+        "synced_per_second": round(len(synced) / span, 1) if span else 0.0,
+        **latency_summary(to_queued, "to_queued_"),
+        **latency_summary(to_synced, "to_synced_"),
+    }
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+    return commit + ("-dirty" if dirty else "")
+
+
+def flatten(value, prefix=""):
+    """Numeric leaves of a result as {"a.b.c": number}."""
+    if isinstance(value, dict):
+        items = {}
+        for key, child in value.items():
+            items.update(flatten(child, f"{prefix}{key}."))
+        return items
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {prefix.rstrip("."): value}
+    return {}
+
+
+def compare(old_path, new_path):
+    """Print every numeric result of two runs side by side with the change."""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"{'metric':<44} {old.get('commit') or old_path:>14} {new.get('commit') or new_path:>14}   change")
+    old_values = flatten({k: v for k, v in old.items() if k != "config"})
+    new_values = flatten({k: v for k, v in new.items() if k != "config"})
+    for key in sorted(old_values.keys() | new_values.keys()):
+        before, after = old_values.get(key), new_values.get(key)
+        change = ""
+        if before and after is not None:
+            change = f"{(after - before) / before * 100:+.1f}%"
+        print(f"{key:<44} {'-' if before is None else before:>14} {'-' if after is None else after:>14}   {change}")
+    changed = {k for k in old.get("config", {}) if old["config"].get(k) != new.get("config", {}).get(k)}
+    if changed:
+        print(f"Note: runs differ in config: {', '.join(sorted(changed))}")
+
+
+# ---------------------------------------------------------------------------
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--leads", type=int, default=200, help="Leads to post")
+    parser.add_argument("--rate", type=float, default=50.0, help="Leads/sec to post (0 = as fast as possible)")
+    parser.add_argument("--concurrency", type=int, default=16, help="HTTP client threads")
+    parser.add_argument("--worker-mode", choices=["threads", "asyncio"], default="threads")
+    parser.add_argument("--worker-concurrency", type=int, default=8)
+    parser.add_argument("--relay-batch-size", type=int, default=100)
+    parser.add_argument("--relay-poll-seconds", type=float, default=1.0, help="Relay wait when the outbox is empty")
+    parser.add_argument("--te-latency-ms", type=float, default=50.0)
+    parser.add_argument("--te-connect-ms", type=float, default=20.0, help="Extra latency of a new Total Expert connection")
+    parser.add_argument("--te-error-rate", type=float, default=0.0, help="Fraction of Total Expert calls answered 503")
+    parser.add_argument("--te-throttle-rate", type=float, default=0.0, help="Fraction of Total Expert calls answered 429")
+    parser.add_argument("--te-retry-after", type=int, default=1, help="Retry-After seconds on injected 429s")
+    parser.add_argument("--te-rate-limit", type=float, default=0.0, help="Worker TE_RATE_LIMIT (calls/sec, 0 = off)")
+    parser.add_argument("--sb-send-ms", type=float, default=5.0, help="Service Bus send/schedule latency")
+    parser.add_argument("--sb-settle-ms", type=float, default=2.0, help="Service Bus complete/abandon latency")
+    parser.add_argument("--sb-error-rate", type=float, default=0.0, help="Fraction of Service Bus sends that fail")
+    parser.add_argument("--retry-base-seconds", type=float, default=0.25, help="Worker WORKER_RETRY_BASE_SECONDS")
+    parser.add_argument("--retry-max-seconds", type=float, default=2.0, help="Worker WORKER_RETRY_MAX_SECONDS")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Seconds to wait for every lead to finish")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the fakes' error injection")
+    parser.add_argument("--label", default="")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two result files and exit")
+    parser.add_argument("--serve-web", metavar="DB", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.serve_web:
+        return serve_web(args.serve_web)
+    if args.compare:
+        return compare(*args.compare)
+
+    server = FakeTotalExpertServer(
+        latency=args.te_latency_ms / 1000,
+        connect_latency=args.te_connect_ms / 1000,
+        error_rate=args.te_error_rate,
+        throttle_rate=args.te_throttle_rate,
+        retry_after=args.te_retry_after,
+        seed=args.seed,
+    ).start()
+    # Read by workers.process_leads at import
+    os.environ.update(
+        TE_API_URL=server.url,
+        TE_CLIENT_ID="bench",
+        TE_CLIENT_SECRET="bench",
+        TE_RATE_LIMIT=str(args.te_rate_limit),
+        WORKER_MODE=args.worker_mode,
+        WORKER_CONCURRENCY=str(args.worker_concurrency),
+        WORKER_RETRY_BASE_SECONDS=str(args.retry_base_seconds),
+        WORKER_RETRY_MAX_SECONDS=str(args.retry_max_seconds),
+        WORKER_RECEIVE_WAIT_SECONDS="0.2",
+        WORKER_METRICS_PORT="0",
+        WORKER_METRICS_INTERVAL="3600",
+        SERVER_TIMING="0",
+    )
+
+    roles = {RELAY_THREAD: "relay", "watch": None}
+    queries = QueryCounter(lambda: roles.get(threading.current_thread().name, "worker"))
+    queries.install()
+    db_path = django_env.setup(os.path.join(tempfile.mkdtemp(prefix="dml-e2e-"), "e2e.sqlite3"))
+
+    from django.db import connection
+
+    with connection.cursor() as cursor:
+        # Readers no longer block the writer (and the mode sticks to the file)
+        cursor.execute("PRAGMA journal_mode=WAL")
+    lo_slug = django_env.ensure_loan_officer().slug
+    connection.close()
+    queries.counts.clear()  # migrations and setup
+
+    from leads import servicebus
+    from workers import process_leads as worker
+
+    transport = FakeServiceBusTransport(
+        connect_latency=0.05,
+        send_latency=args.sb_send_ms / 1000,
+        settle_latency=args.sb_settle_ms / 1000,
+        error_rate=args.sb_error_rate,
+        seed=args.seed,
+    )
+    servicebus.ServiceBusClient = transport.client_class()
+    worker.ServiceBusClient = transport.client_class()
+    worker.AsyncServiceBusClient = transport.async_client_class()
+    worker.AutoLockRenewer = FakeAutoLockRenewer
+    worker.AsyncAutoLockRenewer = FakeAsyncAutoLockRenewer
+
+    web, port = start_web(db_path)
+    stop_relay = threading.Event()
+    relay_errors = []
+    relay = threading.Thread(
+        target=run_relay,
+        args=(stop_relay, args.relay_batch_size, args.relay_poll_seconds, relay_errors),
+        name=RELAY_THREAD,
+    )
+    relay.start()
+
+    load = {}
+    load_done = threading.Event()
+
+    def drive():
+        try:
+            load["latencies"], load["statuses"], load["seconds"] = post_leads(
+                port, lo_slug, args.leads, args.rate, args.concurrency
+            )
+        finally:
+            load_done.set()
+
+    run = {"timed_out": False}
+    started_at = datetime.now(timezone.utc)
+    started = time.monotonic()
+    threading.Thread(target=drive, name="load", daemon=True).start()
+    threading.Thread(
+        target=watch_leads,
+        args=(worker, args.leads, load_done, started + args.timeout, run),
+        name="watch",
+        daemon=True,
+    ).start()
+    # Signal handlers can only be installed from the main thread
+    worker.main()
+    elapsed = time.monotonic() - started
+
+    stop_relay.set()
+    relay.join()
+    servicebus.close_sender()
+    web_queries = stop_web(web)
+    server.stop()
+
+    latencies = load.get("latencies", [])
+    accepted = load.get("statuses", {}).get(201, 0) or 1
+    sms_queue = transport.queue(worker.SERVICEBUS_SMS_QUEUE_NAME)
+    lead_queue = transport.queue(worker.SERVICEBUS_QUEUE_NAME)
+    result = {
+        "label": args.label,
+        "commit": git_commit(),
+        "started_at": started_at.isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare", "serve_web", "label")},
+        "webform": {
+            "requests": len(latencies),
+            "rps": round(len(latencies) / load["seconds"], 1) if load.get("seconds") else 0.0,
+            "mean_ms": round(statistics.mean(latencies), 2) if latencies else 0.0,
+            **latency_summary(latencies),
+            "statuses": {str(k): v for k, v in load.get("statuses", {}).items()},
+        },
+        "pipeline": {
+            **pipeline_summary(),
+            "seconds": round(elapsed, 2),
+            "timed_out": run["timed_out"],
+            "relay_errors": len(relay_errors),
+        },
+        "queries_per_lead": {
+            "web": round(web_queries / accepted, 2),
+            "relay": round(queries.counts.get("relay", 0) / accepted, 2),
+            "worker": round(queries.counts.get("worker", 0) / accepted, 2),
+            "total": round((web_queries + sum(queries.counts.values())) / accepted, 2),
+        },
+        "total_expert": {
+            "requests": dict(server.requests),
+            "statuses": {str(k): v for k, v in server.statuses.items()},
+            "connections": len(server.connections),
+        },
+        "service_bus": {
+            "sends": transport.sends,
+            "send_errors": transport.send_errors,
+            "completed": lead_queue.completed,
+            "abandoned": lead_queue.abandoned,
+            "rescheduled": lead_queue.scheduled,
+            "sms_queued": len(sms_queue),
+        },
+    }
+
+    webform, pipeline, per_lead = result["webform"], result["pipeline"], result["queries_per_lead"]
+    print(
+        f"webform   requests={webform['requests']} rps={webform['rps']} p50={webform['p50_ms']}ms "
+        f"p95={webform['p95_ms']}ms p99={webform['p99_ms']}ms statuses={webform['statuses']}"
+    )
+    print(
+        f"pipeline  {pipeline['statuses']} synced/s={pipeline['synced_per_second']} "
+        f"to_synced p50={pipeline['to_synced_p50_ms']}ms p95={pipeline['to_synced_p95_ms']}ms "
+        f"p99={pipeline['to_synced_p99_ms']}ms{' TIMED OUT' if pipeline['timed_out'] else ''}"
+    )
+    print(f"queries   per lead web={per_lead['web']} relay={per_lead['relay']} worker={per_lead['worker']} total={per_lead['total']}")
+    print(f"te        {result['total_expert']['requests']} statuses={result['total_expert']['statuses']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
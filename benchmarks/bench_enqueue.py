@@ -0,0 +1,76 @@
+"""
+Microbenchmark: per-enqueue latency of leads.servicebus.enqueue_lead.
+
+Compares the old behaviour (a new ServiceBusClient and sender per call)
+against the long-lived per-process sender, using a fake transport with
+configurable connect/send latency.
+
+Usage:
+    python -m benchmarks.bench_enqueue [--iterations 200] [--connect-ms 50] [--send-ms 5]
+"""
+
+import argparse
+import statistics
+import time
+import uuid
+
+from django.conf import settings
+
+if not settings.configured:
+    settings.configure(
+        SERVICEBUS_CONNECTION_STRING="Endpoint=sb://fake/;SharedAccessKeyName=x;SharedAccessKey=y",
+        SERVICEBUS_QUEUE_NAME="webform-leads",
+    )
+
+from leads import servicebus
+from leads.testing import FakeServiceBusTransport
+
+
+def enqueue_per_call(client_class, submission_id):
+    """The pre-pooling implementation: connect, send, disconnect."""
+    with client_class.from_connection_string(settings.SERVICEBUS_CONNECTION_STRING) as client:
+        with client.get_queue_sender(queue_name=settings.SERVICEBUS_QUEUE_NAME) as sender:
+            sender.send_messages(servicebus.build_lead_message(submission_id))
+    return True
+
+
+def measure(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn(str(uuid.uuid4()))
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(label, samples, connections):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(
+        f"{label:<12} mean={statistics.mean(samples):7.2f}ms "
+        f"p50={statistics.median(samples):7.2f}ms p95={p95:7.2f}ms connections={connections}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--connect-ms", type=float, default=50.0)
+    parser.add_argument("--send-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    transport = FakeServiceBusTransport(args.connect_ms / 1000, args.send_ms / 1000)
+    client_class = transport.client_class()
+
+    before = measure(lambda sid: enqueue_per_call(client_class, sid), args.iterations)
+    report("per-call", before, transport.connections)
+
+    transport.connections = 0
+    servicebus.close_sender()
+    servicebus.ServiceBusClient = client_class
+    after = measure(servicebus.enqueue_lead, args.iterations)
+    report("long-lived", after, transport.connections)
+
+
+if __name__ == "__main__":
+    main()
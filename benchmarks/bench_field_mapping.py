@@ -0,0 +1,70 @@
+"""
+Microbenchmark: per-payload normalization cost for every configured form.
+
+Times the compiled extractor for each entry in leads.form_mappings, and the
+original hand-written extraction from webform_lead as a baseline.
+
+Usage:
+    python -m benchmarks.bench_field_mapping [--iterations 100000]
+"""
+
+import argparse
+import timeit
+
+from benchmarks import django_env
+
+django_env.setup()
+
+from leads.form_mappings import FORM_MAPPINGS
+from leads.mapping import EXTRACTORS, extract_lead_fields
+
+
+def legacy_extract(payload):
+    """Field extraction as webform_lead did it before the mapping engine."""
+    raw_opt_in = payload.get("comm_opt_in", "")
+    ok_to_email = raw_opt_in is not None and raw_opt_in != ""
+    return {
+        "source": "webform",
+        "page_url": (payload.get("page_url") or "").strip()[:200],
+        "referrer": (payload.get("referrer") or "").strip()[:200],
+        "first_name": (payload.get("first_name") or "").strip(),
+        "last_name": (payload.get("last_name") or "").strip(),
+        "email": (payload.get("email") or "").strip(),
+        "phone": (payload.get("phone") or "").strip(),
+        "ok_to_email": ok_to_email,
+        "ok_to_call": ok_to_email,
+    }
+
+
+def sample_payload(form_id, mapping):
+    """Build a representative payload with a value for every mapped key."""
+    payload = {"form_id": form_id, "lo_slug": "john-smith"}
+    for field_name, spec in mapping.get("fields", {}).items():
+        for key in spec.get("keys", [field_name]):
+            payload[key] = f"  {field_name} value  "
+    for key in mapping.get("opt_in", {}).get("keys", []):
+        payload[key] = "Yes"
+    return payload
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=100000)
+    args = parser.parse_args()
+    n = args.iterations
+
+    def report(label, seconds):
+        print(f"{label:<32} {seconds / n * 1e6:7.2f} us/payload")
+
+    default_payload = sample_payload("default", FORM_MAPPINGS["default"])
+    report("legacy (hand-written)", timeit.timeit(lambda: legacy_extract(default_payload), number=n))
+
+    for form_id, mapping in FORM_MAPPINGS.items():
+        payload = sample_payload(form_id, mapping)
+        extractor = EXTRACTORS[str(form_id)]
+        report(f"form {form_id} (extractor)", timeit.timeit(lambda: extractor(payload), number=n))
+        report(f"form {form_id} (with dispatch)", timeit.timeit(lambda: extract_lead_fields(payload), number=n))
+
+
+if __name__ == "__main__":
+    main()
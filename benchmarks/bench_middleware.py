@@ -0,0 +1,62 @@
+"""
+Benchmark: requests/sec for /health and the webform path with and without
+LeanApiMiddleware.
+
+Runs in-process through Django's request handler (no network), so the
+difference is the middleware stack alone. Uses the real settings against a
+throwaway SQLite database.
+
+Usage:
+    python -m benchmarks.bench_middleware [--requests 2000]
+"""
+
+import argparse
+import json
+import time
+
+from benchmarks import django_env
+
+django_env.setup()
+
+from django.conf import settings
+from django.test import Client, override_settings
+
+
+def rps(client, method, path, count, **kwargs):
+    call = getattr(client, method)
+    start = time.perf_counter()
+    for i in range(count):
+        if "data" in kwargs and callable(kwargs["data"]):
+            response = call(path, data=kwargs["data"](i), content_type="application/json")
+        else:
+            response = call(path, **kwargs)
+    elapsed = time.perf_counter() - start
+    assert response.status_code < 300, response.status_code
+    return count / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    django_env.ensure_loan_officer()
+    full_stack = [m for m in settings.MIDDLEWARE if m != "config.middleware.LeanApiMiddleware"]
+
+    def lead(i):
+        return json.dumps({"lo_slug": "bench-lo", "email": f"mw-{time.time_ns()}-{i}@example.com"})
+
+    cases = [
+        ("/health", "get", {}),
+        ("/api/v1/leads/webform", "post", {"data": lead}),
+    ]
+
+    for path, method, kwargs in cases:
+        with override_settings(MIDDLEWARE=full_stack):
+            before = rps(Client(), method, path, args.requests, **kwargs)
+        after = rps(Client(), method, path, args.requests, **kwargs)
+        print(f"{path:<24} full stack={before:9.1f} req/s  lean={after:9.1f} req/s  ({after / before:4.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Microbenchmark: per-lead latency of the Total Expert calls.
+
+Compares the old behaviour (a bare requests.post per call, so a new
+connection every time) against leads.totalexpert.TotalExpertClient's
+pooled keep-alive session, against a local fake API that charges
+--connect-ms for every new connection.
+
+Usage:
+    python -m benchmarks.bench_te_client [--iterations 200] [--connect-ms 30] [--latency-ms 5]
+"""
+
+import argparse
+import statistics
+import time
+
+import requests
+from django.conf import settings
+
+if not settings.configured:
+    settings.configure(USE_TZ=True)
+
+from leads.totalexpert import TotalExpertClient
+from leads.testing import FakeTotalExpertServer
+
+
+def fetch_token(base_url):
+    response = requests.post(f"{base_url}/v1/token", data={"grant_type": "client_credentials"}, timeout=30)
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+def sync_per_call(base_url, access_token):
+    """The pre-pooling implementation: one new connection per call."""
+    headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
+    response = requests.post(f"{base_url}/v1/contacts", json={"first_name": "Bench"}, headers=headers, timeout=30)
+    response.raise_for_status()
+    response = requests.post(f"{base_url}/v1/sms/opt-in", json={"status": "OPTED_IN"}, headers=headers, timeout=30)
+    response.raise_for_status()
+
+
+def sync_pooled(client):
+    client.create_contact({"first_name": "Bench"})
+    client.sms_opt_in({"status": "OPTED_IN"})
+
+
+def measure(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(label, samples, connections):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(
+        f"{label:<12} mean={statistics.mean(samples):7.2f}ms "
+        f"p50={statistics.median(samples):7.2f}ms p95={p95:7.2f}ms connections={connections}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--connect-ms", type=float, default=30.0)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    with FakeTotalExpertServer(latency=args.latency_ms / 1000, connect_latency=args.connect_ms / 1000) as server:
+        access_token = fetch_token(server.url)
+        before = measure(lambda: sync_per_call(server.url, access_token), args.iterations)
+        report("per-call", before, len(server.connections))
+
+        server.connections.clear()
+        client = TotalExpertClient(server.url, "bench", "bench")
+        client.get_access_token()
+        after = measure(lambda: sync_pooled(client), args.iterations)
+        report("pooled", after, len(server.connections))
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Benchmark: DB queries and wall time per received message batch in the worker.
+
+Runs workers.process_leads.process_batch (sequential mode) over a batch of
+queued leads against a throwaway SQLite database and a local fake Total
+Expert API, and counts every SQL statement it issues. The old per-message
+path (LeadSubmission.objects.get + lazy loan_officer) is counted alongside.
+
+Exits non-zero when --max-queries is given and the batch issues more data
+statements than that (transaction control such as BEGIN/COMMIT, which
+SQLite logs and MySQL does not, is not counted), so it can pin the
+per-batch query budget in CI.
+
+Usage:
+    python -m benchmarks.bench_worker_batch [--batch-size 50] [--max-queries N]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from benchmarks import django_env
+
+django_env.setup()
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from leads.testing import FakeTotalExpertServer
+from leads.models import LeadSubmission, LeadStatus
+
+
+class FakeMessage:
+    def __init__(self, submission_id):
+        self.body = json.dumps({"submission_id": str(submission_id), "action": "sync_to_crm"})
+
+    def __str__(self):
+        return self.body
+
+
+class FakeReceiver:
+    def __init__(self):
+        self.completed = 0
+        self.abandoned = 0
+
+    def complete_message(self, message):
+        self.completed += 1
+
+    def abandon_message(self, message):
+        self.abandoned += 1
+
+
+class FakeSender:
+    def __init__(self):
+        self.scheduled = 0
+
+    def schedule_messages(self, messages, schedule_time_utc):
+        self.scheduled += 1
+        return [self.scheduled]
+
+
+def queue_leads(loan_officer, count):
+    submissions = [
+        LeadSubmission(
+            loan_officer=loan_officer,
+            first_name="Bench",
+            email=f"bench{i}@example.com",
+            phone="5550100",
+            status=LeadStatus.QUEUED,
+            raw_payload={"lo_slug": loan_officer.slug, "note": "x" * 2000},
+        )
+        for i in range(count)
+    ]
+    LeadSubmission.objects.bulk_create(submissions)
+    return [FakeMessage(submission.id) for submission in submissions]
+
+
+def legacy_loads(messages):
+    """The old per-message loads: get() plus a lazy loan_officer fetch."""
+    for message in messages:
+        submission = LeadSubmission.objects.get(id=json.loads(str(message))["submission_id"])
+        submission.loan_officer.te_owner_id
+
+
+TRANSACTION_STATEMENTS = {"BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE"}
+
+
+def data_statements(queries):
+    return [query for query in queries if query["sql"].split(None, 1)[0].upper() not in TRANSACTION_STATEMENTS]
+
+
+def summarize(queries):
+    kinds = {}
+    for query in queries:
+        kind = query["sql"].split(None, 1)[0].upper()
+        kinds[kind] = kinds.get(kind, 0) + 1
+    return kinds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--max-queries", type=int, default=None)
+    args = parser.parse_args()
+
+    loan_officer = django_env.ensure_loan_officer()
+
+    with FakeTotalExpertServer() as server:
+        os.environ.update(TE_API_URL=server.url, TE_CLIENT_ID="bench", TE_CLIENT_SECRET="bench")
+        from workers import process_leads
+
+        process_leads.te_client.get_access_token()
+
+        messages = queue_leads(loan_officer, args.batch_size)
+        with CaptureQueriesContext(connection) as legacy:
+            legacy_loads(messages)
+        print(f"legacy loads  queries={len(legacy)} {summarize(legacy.captured_queries)}")
+
+        receiver = FakeReceiver()
+        sender = FakeSender()
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as batch:
+            process_leads.process_batch(receiver, sender, messages, None)
+        elapsed = (time.perf_counter() - start) * 1000
+
+    statements = len(data_statements(batch.captured_queries))
+    print(
+        f"process_batch queries={statements} {summarize(batch.captured_queries)} "
+        f"completed={receiver.completed} abandoned={receiver.abandoned} rescheduled={sender.scheduled} wall={elapsed:.1f}ms"
+    )
+
+    if args.max_queries is not None and statements > args.max_queries:
+        print(f"FAIL: {statements} queries for a batch of {args.batch_size} (budget {args.max_queries})")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
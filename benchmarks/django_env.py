@@ -0,0 +1,52 @@
+"""
+Boot the real project settings against a throwaway SQLite database.
+
+Benchmarks import this before anything that touches Django models. The
+required production environment variables get harmless defaults, the
+database is swapped for SQLite and migrations are applied.
+"""
+
+import os
+import sys
+import tempfile
+
+
+def setup(db_path=None):
+    """Configure and set up Django for a benchmark run. Returns the DB path."""
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+    os.environ.setdefault("DJANGO_SECRET_KEY", "benchmark-only")
+    for name in ("MYSQL_HOST", "MYSQL_DATABASE", "MYSQL_USER", "MYSQL_PASSWORD"):
+        os.environ.setdefault(name, "benchmark")
+    os.environ.setdefault("SERVICEBUS_CONNECTION_STRING", "Endpoint=sb://fake/;SharedAccessKeyName=x;SharedAccessKey=y")
+
+    from django.conf import settings
+
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix="dml-bench-"), "bench.sqlite3")
+    # bench_e2e writes from the web server, relay and worker at once: wait
+    # for SQLite's write lock instead of failing with "database is locked"
+    settings.DATABASES = {
+        "default": {"ENGINE": "django.db.backends.sqlite3", "NAME": db_path, "OPTIONS": {"timeout": 30}}
+    }
+    settings.ALLOWED_HOSTS = ["*"]
+    settings.LOGGING = {"version": 1, "disable_existing_loggers": False, "root": {"level": "ERROR"}}
+
+    import django
+    django.setup()
+
+    from django.core.management import call_command
+    call_command("migrate", verbosity=0)
+    return db_path
+
+
+def ensure_loan_officer(slug="bench-lo"):
+    """Create (or fetch) an active loan officer for benchmark traffic."""
+    from core.models import LoanOfficer
+
+    loan_officer, _ = LoanOfficer.objects.get_or_create(
+        slug=slug,
+        defaults={"first_name": "Bench", "last_name": "Mark", "te_owner_id": "BENCH_OWNER"},
+    )
+    return loan_officer
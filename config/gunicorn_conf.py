@@ -0,0 +1,13 @@
+"""
+Gunicorn settings, loaded by startup.sh with `--config config/gunicorn_conf.py`.
+"""
+
+import os
+
+from prometheus_client import multiprocess
+
+
+def child_exit(server, worker):
+    # Drop an exited worker's live gauges from /metrics (leads/metrics.py)
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,159 @@
+"""
+Non-blocking, structured logging for the web app and the worker.
+
+Records are put on an in-memory queue by QueueListenerHandler and written
+to stdout by a background QueueListener thread, so request threads never
+wait on the App Service log pipe. The caller only renders the message's
+%-args (they may change once it returns); JSON encoding and tracebacks
+are formatted on the listener thread.
+
+Wired up through LOGGING in config/settings.py; the worker picks it up via
+django.setup().
+"""
+
+import os
+import copy
+import json
+import queue
+import random
+import logging
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from leads import metrics
+
+# Attributes every LogRecord has; anything else was passed via extra=
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+# Payload keys that hold personal data and are never logged
+PII_FIELDS = {"first_name", "last_name", "email", "phone", "ip_address", "user_agent"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line."""
+
+    def format(self, record):
+        data = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                data[key] = value
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of high-volume records per logger.
+
+    `rates` maps logger name prefixes to the fraction of records kept
+    (e.g. {"leads.views": 0.1}). WARNING and above are never sampled.
+    """
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = dict(rates or {})
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        name = record.name
+        while name:
+            rate = self.rates.get(name)
+            if rate is not None:
+                return random.random() < rate
+            name = name.rpartition(".")[0]
+        return True
+
+
+class QueueListenerHandler(QueueHandler):
+    """
+    QueueHandler that owns its QueueListener and target StreamHandler.
+
+    The queue is bounded: when it is full, records are dropped (and counted
+    in log_records_dropped_total) rather than blocking the caller. The
+    listener is restarted after a fork, since the thread does not survive
+    into the child.
+    """
+
+    def __init__(self, stream=None, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self.maxsize = maxsize
+        self.target = logging.StreamHandler(stream)
+        self._listener = None
+        self._pid = None
+        self._start()
+
+    def _start(self):
+        if self._pid is not None:
+            # Forked child: the parent's listener thread is gone
+            self.queue = queue.Queue(self.maxsize)
+        self._listener = QueueListener(self.queue, self.target)
+        self._listener.start()
+        self._pid = os.getpid()
+
+    def setFormatter(self, fmt):
+        super().setFormatter(fmt)
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Render the %-args now, as QueueHandler does: they can be mutable
+        # (PayloadSummary wraps the live request payload) and change before
+        # the listener gets to them. The rest of the formatting stays on the
+        # listener thread.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.LOG_RECORDS_DROPPED.inc()
+
+    def close(self):
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()  # Flushes queued records
+            self._listener = None
+        self.target.close()
+        super().close()
+
+
+class PayloadSummary:
+    """
+    Lazy, PII-free description of a form payload for log messages.
+
+    Rendered only if the record passes the level and sampling filters.
+    """
+
+    __slots__ = ("payload",)
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def __str__(self):
+        payload = self.payload if isinstance(self.payload, dict) else {}
+        present = sorted(key for key in PII_FIELDS if payload.get(key))
+        other = sorted(key for key in payload if key not in PII_FIELDS)
+        return (
+            f"lo_slug={payload.get('lo_slug', '')!r} form_id={payload.get('form_id', '')!r} "
+            f"pii_present={present} fields={other}"
+        )
+
+
+def parse_sample_rates(value):
+    """Parse "logger=rate,logger=rate" (LOG_SAMPLE_RATES) into a dict."""
+    rates = {}
+    for item in (value or "").split(","):
+        name, _, rate = item.partition("=")
+        if name.strip() and rate.strip():
+            rates[name.strip()] = float(rate)
+    return rates
@@ -0,0 +1,148 @@
+"""
+Project-level middleware for DML Marketing Middleware.
+"""
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.handlers.exception import convert_exception_to_response
+from django.urls import get_resolver
+
+from config import timing
+
+
+class LeanApiMiddleware:
+    """
+    Short-circuit the public JSON API past the rest of MIDDLEWARE.
+
+    Sessions, auth, messages, CSRF and clickjacking protection only matter
+    for the admin. Requests whose path starts with one of
+    LEAN_API_PATH_PREFIXES are resolved against API_URLCONF and dispatched
+    straight to the view; everything else continues down the full stack.
+
+    Must be first in MIDDLEWARE, after ServerTimingMiddleware. Works in both
+    WSGI (sync) and ASGI (async) mode without adapting the view to the other
+    mode.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefixes = tuple(settings.LEAN_API_PATH_PREFIXES)
+        self.resolver = get_resolver(settings.API_URLCONF)
+
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+            self.dispatch = convert_exception_to_response(self._dispatch_async)
+        else:
+            self.dispatch = convert_exception_to_response(self._dispatch)
+
+    @staticmethod
+    def _finalize(response):
+        # Content-Length is normally added by CommonMiddleware; without it
+        # ASGI servers fall back to chunked encoding
+        if not response.streaming and not response.has_header("Content-Length"):
+            response.headers["Content-Length"] = str(len(response.content))
+        return response
+
+    def _resolve(self, request):
+        # Host validation normally happens in CommonMiddleware
+        request.get_host()
+        match = self.resolver.resolve(request.path_info)
+        request.resolver_match = match
+        return match
+
+    def _dispatch(self, request):
+        match = self._resolve(request)
+        view = match.func
+        if iscoroutinefunction(view):
+            view = async_to_sync(view)
+        return view(request, *match.args, **match.kwargs)
+
+    async def _dispatch_async(self, request):
+        match = self._resolve(request)
+        view = match.func
+        if not iscoroutinefunction(view):
+            view = sync_to_async(view, thread_sensitive=True)
+        return await view(request, *match.args, **match.kwargs)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if request.path_info.startswith(self.prefixes):
+            return self._finalize(self.dispatch(request))
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if request.path_info.startswith(self.prefixes):
+            return self._finalize(await self.dispatch(request))
+        return await self.get_response(request)
+
+
+class ServerTimingMiddleware:
+    """
+    Time requests under SERVER_TIMING_PATH_PREFIXES phase by phase.
+
+    Views mark their phases with config.timing.phase(). The breakdown is
+    logged as a structured line (SERVER_TIMING), and goes out in a
+    Server-Timing header only to requests with a valid X-Debug-Profile
+    header (or to every request with SERVER_TIMING_HEADER). Every
+    PROFILE_SAMPLE_RATE-th request, and any request with a valid
+    X-Debug-Profile header, is profiled to PROFILE_DIR.
+
+    Goes before LeanApiMiddleware, so API requests are timed too.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefixes = tuple(settings.SERVER_TIMING_PATH_PREFIXES)
+        self.profiler = timing.Profiler(settings.PROFILE_SAMPLE_RATE, settings.PROFILE_DIR)
+
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def _is_debug_request(request):
+        return timing.is_valid_profile_token(
+            request.headers.get(timing.PROFILE_HEADER), settings.PROFILE_TOKEN_MAX_AGE
+        )
+
+    @staticmethod
+    def _profile_label(request):
+        return request.path_info.strip("/").replace("/", "_") or "root"
+
+    @staticmethod
+    def _finish(request, response, timings, debug):
+        if not settings.SERVER_TIMING:
+            return response
+        if debug or settings.SERVER_TIMING_HEADER:
+            response.headers["Server-Timing"] = timings.header()
+        timing.log_timings(
+            f"{request.method} {request.path_info} {response.status_code}", timings,
+            path=request.path_info, status=response.status_code,
+        )
+        return response
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not request.path_info.startswith(self.prefixes):
+            return self.get_response(request)
+        debug = self._is_debug_request(request)
+        with timing.measure() as timings, \
+                self.profiler.profile(self._profile_label(request), self.profiler.should_sample() or debug):
+            response = self.get_response(request)
+        return self._finish(request, response, timings, debug)
+
+    async def __acall__(self, request):
+        if not request.path_info.startswith(self.prefixes):
+            return await self.get_response(request)
+        debug = self._is_debug_request(request)
+        with timing.measure() as timings, \
+                self.profiler.profile(self._profile_label(request), self.profiler.should_sample() or debug):
+            response = await self.get_response(request)
+        return self._finish(request, response, timings, debug)
@@ -6,6 +6,8 @@ Configured for Azure MySQL Database.
 import os
 from pathlib import Path
 
+from config.log import parse_sample_rates
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -70,6 +72,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Server-Timing header, timing log line and sampled profiles for the API
+    "config.middleware.ServerTimingMiddleware",
+    # Dispatches the public JSON API past the rest of this list (admin keeps the full stack)
+    "config.middleware.LeanApiMiddleware",
     "django.middleware.security.SecurityMiddleware",
     'whitenoise.middleware.WhiteNoiseMiddleware',
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -82,6 +88,25 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = "config.urls"
 
+# Paths served by LeanApiMiddleware and the URLconf they are resolved against
+LEAN_API_PATH_PREFIXES = ["/api/", "/health", "/metrics"]
+API_URLCONF = "leads.urls"
+
+# Requests timed phase by phase by ServerTimingMiddleware (config/timing.py).
+# SERVER_TIMING=0 drops the timing log line and header. The Server-Timing
+# header only goes to requests with a valid X-Debug-Profile header, unless
+# SERVER_TIMING_HEADER=1: the phases are internal, and `dedup` tells a caller
+# whether its lead was a duplicate.
+SERVER_TIMING = os.getenv("SERVER_TIMING", "1") == "1"
+SERVER_TIMING_HEADER = os.getenv("SERVER_TIMING_HEADER", "0") == "1"
+SERVER_TIMING_PATH_PREFIXES = ["/api/"]
+# Profile every Nth timed request with cProfile (0 = off) into PROFILE_DIR;
+# requests with an X-Debug-Profile header from `manage.py profile_token`
+# are profiled too, for PROFILE_TOKEN_MAX_AGE seconds after it was issued
+PROFILE_SAMPLE_RATE = int(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/profiles")
+PROFILE_TOKEN_MAX_AGE = int(os.getenv("PROFILE_TOKEN_MAX_AGE", "3600"))
+
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
@@ -100,6 +125,10 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "config.wsgi.application"
 
+# Set DJANGO_ASGI=1 when serving config.asgi:application (see startup.sh);
+# the webform endpoint then uses its native async view.
+ASGI_MODE = os.getenv("DJANGO_ASGI", "0") == "1"
+
 
 # Database - Azure MySQL
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
@@ -110,6 +139,11 @@ MYSQL_PORT = os.getenv("MYSQL_PORT", "3306")
 MYSQL_DATABASE = os.getenv("MYSQL_DATABASE")
 MYSQL_USER = os.getenv("MYSQL_USER")
 MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD")
+# Seconds a DB connection is kept open for reuse (0 = close after each request).
+# Reused connections are pinged before use after an error or a new request.
+# The lead worker sets it from WORKER_CONN_MAX_AGE. Always 0 under ASGI, where
+# every executor thread would keep a connection of its own open.
+MYSQL_CONN_MAX_AGE = 0 if ASGI_MODE else int(os.getenv("MYSQL_CONN_MAX_AGE", "0"))
 
 # Validate required MySQL settings
 if not all([MYSQL_HOST, MYSQL_DATABASE, MYSQL_USER, MYSQL_PASSWORD]):
@@ -126,6 +160,8 @@ DATABASES = {
         "NAME": MYSQL_DATABASE,
         "USER": MYSQL_USER,
         "PASSWORD": MYSQL_PASSWORD,
+        "CONN_MAX_AGE": MYSQL_CONN_MAX_AGE,
+        "CONN_HEALTH_CHECKS": True,
         "OPTIONS": {
             "init_command": "SET sql_mode='STRICT_TRANS_TABLES'",
             "charset": "utf8mb4",
@@ -138,6 +174,22 @@ DATABASES = {
 }
 
 
+# Cache
+# "db" keeps entries in MySQL (table created by `manage.py createcachetable`),
+# shared by every process and container; the default "locmem" is per process.
+# The shared loan officer cache and Total Expert token need "db".
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "locmem")
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "django_cache",
+    } if CACHE_BACKEND == "db" else {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -180,6 +232,10 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 
 # Logging
+# Records go through config.log.QueueListenerHandler: callers render the
+# message and enqueue, a background thread formats and writes them. Set LOG_FORMAT=text for the
+# plain format, and LOG_SAMPLE_RATES (e.g. "leads.views=0.1") to keep only a
+# fraction of INFO/DEBUG records from noisy loggers.
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
@@ -188,11 +244,22 @@ LOGGING = {
             "format": "{levelname} {asctime} {module} {message}",
             "style": "{",
         },
+        "json": {
+            "()": "config.log.JsonFormatter",
+        },
+    },
+    "filters": {
+        "sampling": {
+            "()": "config.log.SamplingFilter",
+            "rates": parse_sample_rates(os.getenv("LOG_SAMPLE_RATES", "")),
+        },
     },
     "handlers": {
         "console": {
-            "class": "logging.StreamHandler",
-            "formatter": "verbose",
+            "()": "config.log.QueueListenerHandler",
+            "maxsize": int(os.getenv("LOG_QUEUE_SIZE", "10000")),
+            "formatter": "verbose" if os.getenv("LOG_FORMAT", "json") == "text" else "json",
+            "filters": ["sampling"],
         },
     },
     "root": {
@@ -215,6 +282,11 @@ LOGGING = {
             "level": "INFO",
             "propagate": False,
         },
+        "workers": {
+            "handlers": ["console"],
+            "level": "INFO",
+            "propagate": False,
+        },
     },
 }
 
@@ -222,6 +294,30 @@ LOGGING = {
 # Azure Service Bus Configuration
 SERVICEBUS_CONNECTION_STRING = os.getenv("SERVICEBUS_CONNECTION_STRING", "")
 SERVICEBUS_QUEUE_NAME = os.getenv("SERVICEBUS_QUEUE_NAME", "webform-leads")
+# SMS opt-ins for synced leads (consumed by the worker with WORKER_STAGE=sms)
+SERVICEBUS_SMS_QUEUE_NAME = os.getenv("SERVICEBUS_SMS_QUEUE_NAME", "webform-leads-sms")
+
+
+# Maximum number of leads accepted by /api/v1/leads/webform/batch
+LEAD_BATCH_MAX_ITEMS = int(os.getenv("LEAD_BATCH_MAX_ITEMS", "1000"))
+
+
+# Duplicate webform submissions (same LO + email + phone) inside this many
+# seconds are suppressed; the LRU of recent keys holds at most this many entries
+LEAD_DEDUP_WINDOW = int(os.getenv("LEAD_DEDUP_WINDOW", "600"))
+LEAD_DEDUP_CACHE_SIZE = int(os.getenv("LEAD_DEDUP_CACHE_SIZE", "10000"))
+
+
+# Prometheus scrape endpoint (/metrics), served only when this is set:
+# scrapers must send "Authorization: Bearer <token>". Values are summed across gunicorn
+# workers when PROMETHEUS_MULTIPROC_DIR is set (see leads/metrics.py)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+
+# Loan officer slug cache (core.lookups)
+LOAN_OFFICER_CACHE_TTL = int(os.getenv("LOAN_OFFICER_CACHE_TTL", "300"))
+# Share invalidations across processes through Django's cache framework
+LOAN_OFFICER_CACHE_SHARED = os.getenv("LOAN_OFFICER_CACHE_SHARED", "0") == "1"
 
 
 # Total Expert API Configuration
@@ -0,0 +1,157 @@
+"""
+Phase timing and sampled profiling for requests and worker batches.
+
+Code marks its phases with `with timing.phase("insert"):`. Outside a timed
+request or batch that is one ContextVar lookup. Inside one (`measure()`),
+each phase's duration is added to the current Timings, which
+ServerTimingMiddleware returns as a Server-Timing header and both the
+middleware and the worker log as one structured line (logger
+"config.timing", sampled with LOG_SAMPLE_RATES like any other).
+
+Profiling is opt-in. A Profiler runs every `sample_rate`-th request or batch
+(and, for requests, any carrying a valid signed X-Debug-Profile header from
+`manage.py profile_token`) under cProfile, and writes the stats to
+`directory` as a .prof file (`python -m pstats <file>`, or snakeviz). One
+profile runs at a time per process; cProfile only sees the thread that
+started it.
+"""
+
+import os
+import time
+import cProfile
+import logging
+import itertools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.core import signing
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "X-Debug-Profile"
+_PROFILE_SALT = "config.timing.profile"
+
+_current = ContextVar("timings", default=None)
+
+
+class Timings:
+    """Durations of the named phases of one request or batch, in seconds."""
+
+    __slots__ = ("phases", "started", "finished")
+
+    def __init__(self):
+        self.phases = {}
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def total(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    def as_ms(self):
+        """Phase durations and the total in milliseconds, for log records."""
+        timings = {name: round(seconds * 1000, 2) for name, seconds in self.phases.items()}
+        timings["total"] = round(self.total() * 1000, 2)
+        return timings
+
+    def header(self):
+        """Server-Timing header value, e.g. "parse;dur=0.21, insert;dur=3.80, total;dur=4.52"."""
+        return ", ".join(f"{name};dur={ms}" for name, ms in self.as_ms().items())
+
+
+@contextmanager
+def measure():
+    """Collect the phases timed inside this block; yields the Timings."""
+    timings = Timings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        timings.finished = time.perf_counter()
+        _current.reset(token)
+
+
+@contextmanager
+def phase(name):
+    """Time a block as phase `name` of the current request or batch, if one is being measured."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - started)
+
+
+def log_timings(message, timings, **fields):
+    """One structured INFO line with the phase breakdown in milliseconds."""
+    logger.info(
+        "%s in %.1fms", message, timings.total() * 1000,
+        extra={"timings": timings.as_ms(), **fields},
+    )
+
+
+def profile_token():
+    """A signed X-Debug-Profile header value (checked against max_age when used)."""
+    return signing.TimestampSigner(salt=_PROFILE_SALT).sign("profile")
+
+
+def is_valid_profile_token(value, max_age):
+    if not value:
+        return False
+    try:
+        signing.TimestampSigner(salt=_PROFILE_SALT).unsign(value, max_age=max_age)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+class Profiler:
+    """
+    Sampled cProfile runs.
+
+    Args:
+        sample_rate: Profile every Nth sampled call (0 = only when forced)
+        directory: Where .prof files are written
+    """
+
+    def __init__(self, sample_rate=0, directory="/tmp/profiles"):
+        self.sample_rate = sample_rate
+        self.directory = directory
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def should_sample(self):
+        return self.sample_rate > 0 and next(self._counter) % self.sample_rate == 0
+
+    @contextmanager
+    def profile(self, label, enabled=True):
+        """Profile the block if `enabled` and no other profile is running in this process."""
+        if not enabled or not self._lock.acquire(blocking=False):
+            yield
+            return
+        try:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+            self._dump(profiler, label)
+        finally:
+            self._lock.release()
+
+    def _dump(self, profiler, label):
+        path = os.path.join(self.directory, f"{label}-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}.prof")
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            profiler.dump_stats(path)
+        except OSError as e:
+            logger.warning("Could not write profile %s: %s", path, e)
+            return
+        logger.info("Profile written to %s", path)
@@ -4,11 +4,13 @@ Django admin configuration for core app.
 
 from django.contrib import admin
 from .models import LoanOfficer
+from .lookups import invalidate_loan_officer_cache
 
 
 def activate_loan_officers(modeladmin, request, queryset):
     """Bulk action to activate selected loan officers"""
     updated = queryset.update(is_active=True)
+    invalidate_loan_officer_cache()  # update() bypasses save signals
     modeladmin.message_user(request, f"{updated} loan officer(s) marked as active.")
 activate_loan_officers.short_description = "Mark selected as active"
 
@@ -16,6 +18,7 @@ activate_loan_officers.short_description = "Mark selected as active"
 def deactivate_loan_officers(modeladmin, request, queryset):
     """Bulk action to deactivate selected loan officers"""
     updated = queryset.update(is_active=False)
+    invalidate_loan_officer_cache()  # update() bypasses save signals
     modeladmin.message_user(request, f"{updated} loan officer(s) marked as inactive.")
 deactivate_loan_officers.short_description = "Mark selected as inactive"
 
@@ -0,0 +1,154 @@
+"""
+In-process cache of active loan officers keyed by slug.
+
+The webform endpoint resolves lo_slug on every POST. The table is a few
+hundred rows that rarely change, so each process keeps a warm slug ->
+LoanOfficer map and refreshes it when:
+
+- a LoanOfficer is saved or deleted (post_save/post_delete signals),
+- a bulk writer calls invalidate_loan_officer_cache() explicitly
+  (admin activate/deactivate actions, import_loan_officers),
+- the map is older than LOAN_OFFICER_CACHE_TTL seconds (covers any writer
+  we miss, and other processes when the shared version stamp is disabled).
+
+With LOAN_OFFICER_CACHE_SHARED=1 invalidations bump a version stamp in
+Django's cache framework, so every process sharing that cache reloads on
+its next lookup.
+"""
+
+import time
+import logging
+import threading
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import LoanOfficer
+
+logger = logging.getLogger(__name__)
+
+VERSION_CACHE_KEY = "core:loan_officers:version"
+
+_lock = threading.Lock()
+# (slug map, monotonic load time, shared version) swapped as one tuple so
+# readers never see a half-updated state
+_state = (None, 0.0, None)
+
+
+def _shared_version():
+    """Current shared version stamp, or None when sharing is disabled."""
+    if not settings.LOAN_OFFICER_CACHE_SHARED:
+        return None
+    return cache.get_or_set(VERSION_CACHE_KEY, time.time_ns(), timeout=None)
+
+
+def _fresh_map(version):
+    """Return the cached slug map if it is still valid, else None."""
+    by_slug, loaded_at, loaded_version = _state
+    if by_slug is None or loaded_version != version:
+        return None
+    if time.monotonic() - loaded_at >= settings.LOAN_OFFICER_CACHE_TTL:
+        return None
+    return by_slug
+
+
+def _load(version):
+    """Reload the slug map from the database."""
+    global _state
+
+    with _lock:
+        # Another thread may have reloaded while we waited
+        by_slug = _fresh_map(version)
+        if by_slug is not None:
+            return by_slug
+
+        by_slug = {lo.slug: lo for lo in LoanOfficer.objects.filter(is_active=True)}
+        _state = (by_slug, time.monotonic(), version)
+
+        logger.info("Loaded %s active loan officer(s) into slug cache", len(by_slug))
+        return by_slug
+
+
+def get_active_loan_officer(slug):
+    """
+    Return the active LoanOfficer for a (lowercased) slug, or None.
+
+    Misses fall through to an exact slug query, so an officer added in
+    another process is found before this process's map expires.
+    """
+    version = _shared_version()
+    by_slug = _fresh_map(version)
+    if by_slug is None:
+        by_slug = _load(version)
+
+    loan_officer = by_slug.get(slug)
+    if loan_officer is not None:
+        return loan_officer
+
+    loan_officer = LoanOfficer.objects.filter(slug=slug, is_active=True).first()
+    if loan_officer is not None:
+        # Map is stale; rebuild it on the next lookup
+        invalidate_loan_officer_cache(shared=False)
+    return loan_officer
+
+
+def get_active_loan_officers(slugs):
+    """
+    Resolve many (lowercased) slugs at once.
+
+    Returns a dict of slug -> active LoanOfficer; unknown or inactive slugs
+    are left out. Slugs missing from the map are fetched in one query.
+    """
+    version = _shared_version()
+    by_slug = _fresh_map(version)
+    if by_slug is None:
+        by_slug = _load(version)
+
+    found = {slug: by_slug[slug] for slug in slugs if slug in by_slug}
+    missing = set(slugs) - found.keys()
+    if missing:
+        extra = {lo.slug: lo for lo in LoanOfficer.objects.filter(slug__in=missing, is_active=True)}
+        if extra:
+            invalidate_loan_officer_cache(shared=False)
+        found.update(extra)
+    return found
+
+
+async def aget_active_loan_officer(slug):
+    """
+    Async variant of get_active_loan_officer.
+
+    Warm-cache hits are answered on the event loop; reloads and misses hop
+    to a thread because they take the reload lock and hit the database.
+    """
+    if settings.LOAN_OFFICER_CACHE_SHARED:
+        version = await cache.aget_or_set(VERSION_CACHE_KEY, time.time_ns(), timeout=None)
+    else:
+        version = None
+
+    by_slug = _fresh_map(version)
+    if by_slug is not None and slug in by_slug:
+        return by_slug[slug]
+
+    return await sync_to_async(get_active_loan_officer)(slug)
+
+
+def invalidate_loan_officer_cache(shared=True):
+    """
+    Drop the slug map so the next lookup reloads it.
+
+    Call this after any write that bypasses model signals (queryset.update(),
+    bulk_create, raw SQL). With shared=True and LOAN_OFFICER_CACHE_SHARED
+    enabled, other processes are told to reload as well.
+    """
+    global _state
+
+    with _lock:
+        _state = (None, 0.0, None)
+
+    if shared and settings.LOAN_OFFICER_CACHE_SHARED:
+        try:
+            cache.incr(VERSION_CACHE_KEY)
+        except ValueError:
+            # Key missing or evicted: any new value forces a reload
+            cache.set(VERSION_CACHE_KEY, time.time_ns(), timeout=None)
@@ -12,6 +12,7 @@ CSV Format:
 import csv
 from django.core.management.base import BaseCommand, CommandError
 from core.models import LoanOfficer
+from core.lookups import invalidate_loan_officer_cache
 
 
 class Command(BaseCommand):
@@ -87,6 +88,9 @@ class Command(BaseCommand):
                         )
                         created_count += 1
                 
+                # Make sure every process picks up the imported officers
+                invalidate_loan_officer_cache()
+
                 # Summary
                 self.stdout.write('')
                 self.stdout.write(self.style.SUCCESS('='* 50))
@@ -0,0 +1,22 @@
+"""
+Management command to issue an X-Debug-Profile header value.
+
+A request to an /api/ path carrying it is profiled with cProfile and the
+stats are written to PROFILE_DIR (see config/timing.py). The value is
+signed with SECRET_KEY and accepted for PROFILE_TOKEN_MAX_AGE seconds.
+
+Usage:
+    python manage.py profile_token
+    curl -H "X-Debug-Profile: $(python manage.py profile_token)" ...
+"""
+
+from django.core.management.base import BaseCommand
+
+from config import timing
+
+
+class Command(BaseCommand):
+    help = 'Print a signed X-Debug-Profile header value for profiling API requests'
+
+    def handle(self, *args, **options):
+        self.stdout.write(timing.profile_token())
@@ -0,0 +1,16 @@
+"""
+Signal handlers for core app.
+"""
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import LoanOfficer
+from .lookups import invalidate_loan_officer_cache
+
+
+@receiver(post_save, sender=LoanOfficer)
+@receiver(post_delete, sender=LoanOfficer)
+def loan_officer_changed(sender, **kwargs):
+    """Invalidate the slug cache whenever a loan officer is written."""
+    invalidate_loan_officer_cache()
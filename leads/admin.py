@@ -2,9 +2,15 @@
 Django admin configuration for leads app.
 """
 
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.utils.html import format_html
+from . import servicebus
 from .models import LeadSubmission, LeadStatus
+from .replay import select_leads, requeue_leads, requeue_sms_opt_ins, REQUEUEABLE_STATUSES
+
+# The requeue actions run inside the admin request; larger replays go
+# through `manage.py requeue_leads`
+ADMIN_REQUEUE_MAX_LEADS = 1000
 
 
 @admin.register(LeadSubmission)
@@ -18,18 +24,20 @@ class LeadSubmissionAdmin(admin.ModelAdmin):
         "status_badge",
         "attempt_count",
     )
-    list_filter = ("status", "submitted_at", "loan_officer", "source")
+    list_filter = ("status", "sms_status", "submitted_at", "loan_officer", "source")
     search_fields = ("first_name", "last_name", "email", "phone", "loan_officer__slug", "te_contact_id")
     readonly_fields = (
         "id",
         "submitted_at",
         "queued_at",
         "synced_at",
+        "sms_opted_in_at",
         "raw_payload_display",
         "ip_address",
         "user_agent",
     )
     date_hierarchy = "submitted_at"
+    actions = ("requeue_selected", "requeue_selected_sms")
 
     # so /admin shows the table by submitted at field!
     ordering = ("-submitted_at",)
@@ -41,6 +49,9 @@ class LeadSubmissionAdmin(admin.ModelAdmin):
         ("Sync Status", {
             "fields": ("status", "te_contact_id", "attempt_count", "last_error")
         }),
+        ("SMS Opt-In", {
+            "fields": ("ok_to_call", "sms_status", "sms_attempt_count", "sms_last_error")
+        }),
         ("Request Metadata", {
             "fields": ("page_url", "referrer", "ip_address", "user_agent"),
             "classes": ("collapse",)
@@ -50,7 +61,7 @@ class LeadSubmissionAdmin(admin.ModelAdmin):
             "classes": ("collapse",)
         }),
         ("Timestamps", {
-            "fields": ("id", "submitted_at", "queued_at", "synced_at"),
+            "fields": ("id", "submitted_at", "queued_at", "synced_at", "sms_opted_in_at"),
             "classes": ("collapse",)
         }),
     )
@@ -93,3 +104,50 @@ class LeadSubmissionAdmin(admin.ModelAdmin):
             )
         return "(empty)"
     raw_payload_display.short_description = "Raw Payload"
+
+    def _too_many(self, request, queryset):
+        """Refuse a requeue of more than ADMIN_REQUEUE_MAX_LEADS leads, pointing at the command."""
+        count = queryset.count()
+        if count <= ADMIN_REQUEUE_MAX_LEADS:
+            return False
+        self.message_user(
+            request,
+            f"{count} leads selected; the admin requeues at most {ADMIN_REQUEUE_MAX_LEADS}. "
+            "Use `python manage.py requeue_leads` for larger replays.",
+            messages.ERROR,
+        )
+        return True
+
+    @admin.action(description="Requeue selected leads to Service Bus")
+    def requeue_selected(self, request, queryset):
+        """Re-drive the selected FAILED/stuck leads; SYNCED ones are skipped."""
+        if not servicebus.is_configured():
+            self.message_user(request, "Service Bus is not configured", messages.ERROR)
+            return
+        if self._too_many(request, queryset):
+            return
+
+        try:
+            total = requeue_leads(select_leads(statuses=REQUEUEABLE_STATUSES, queryset=queryset))
+        except Exception as e:
+            self.message_user(request, f"Requeue failed: {e}", messages.ERROR)
+            return
+
+        self.message_user(request, f"Requeued {total} lead(s)", messages.SUCCESS)
+
+    @admin.action(description="Requeue SMS opt-in for selected leads")
+    def requeue_selected_sms(self, request, queryset):
+        """Re-drive the PENDING/FAILED SMS opt-ins of the selected synced leads."""
+        if not servicebus.is_configured():
+            self.message_user(request, "Service Bus is not configured", messages.ERROR)
+            return
+        if self._too_many(request, queryset):
+            return
+
+        try:
+            total = requeue_sms_opt_ins(queryset)
+        except Exception as e:
+            self.message_user(request, f"Requeue failed: {e}", messages.ERROR)
+            return
+
+        self.message_user(request, f"Requeued {total} SMS opt-in(s)", messages.SUCCESS)
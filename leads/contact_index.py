@@ -0,0 +1,156 @@
+"""
+Local index of contacts already created in Total Expert.
+
+Every lead the worker syncs records (loan officer, normalized email) and
+(loan officer, normalized phone) -> te_contact_id in TeContactIndex. Before
+syncing a batch, the worker looks its leads up in one query; a lead with a
+match synced within the freshness window updates (or skips) the known
+contact instead of POSTing /v1/contacts again, which would spend API quota
+and create a duplicate in the CRM.
+
+Lookups and upserts are one query per batch each. Hit/miss counts are kept
+per process in `stats`.
+"""
+
+import logging
+import threading
+from django.db import connection
+from django.utils import timezone
+
+from . import metrics
+from .models import LeadStatus, TeContactIndex
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_email(email):
+    return (email or "").strip().lower()
+
+
+def normalize_phone(phone):
+    """Digits only, without a leading US country code."""
+    digits = "".join(ch for ch in str(phone or "") if ch.isdigit())
+    if len(digits) == 11 and digits.startswith("1"):
+        digits = digits[1:]
+    return digits
+
+
+def contact_keys(email, phone):
+    """Index keys for a lead, most specific first."""
+    keys = []
+    email = normalize_email(email)
+    if email:
+        keys.append(f"email:{email}")
+    phone = normalize_phone(phone)
+    if phone:
+        keys.append(f"phone:{phone}")
+    return keys
+
+
+class IndexStats:
+    """Thread-safe lookup counters, also exported as te_contact_index_lookups_total."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # Matches whose contact was gone from Total Expert (404 on update)
+        self.stale = 0
+
+    def record(self, hits, misses):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+        if hits:
+            _lookup_hits.inc(hits)
+        if misses:
+            _lookup_misses.inc(misses)
+
+    def record_stale(self):
+        with self._lock:
+            self.stale += 1
+        _lookup_stale.inc()
+
+    def snapshot(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+        }
+
+
+stats = IndexStats()
+
+_lookup_hits = metrics.CONTACT_INDEX_LOOKUPS.labels("hit")
+_lookup_misses = metrics.CONTACT_INDEX_LOOKUPS.labels("miss")
+_lookup_stale = metrics.CONTACT_INDEX_LOOKUPS.labels("stale")
+
+
+def annotate_known_contacts(submissions, max_age):
+    """
+    Set `known_te_contact_id` on each submission: the Total Expert contact
+    of a fresh index match, or None. One query for the whole batch.
+
+    A lead is matched on its most specific key only: by email if it has
+    one, by phone otherwise. A household sharing a phone number is not
+    merged into one contact.
+
+    Args:
+        submissions: LeadSubmissions of a batch (already SYNCED ones are ignored)
+        max_age: Freshness window (timedelta); older matches are not used
+    """
+    pending = [submission for submission in submissions if submission.status != LeadStatus.SYNCED]
+    for submission in submissions:
+        submission.known_te_contact_id = None
+
+    keys = {}
+    for submission in pending:
+        submission_keys = contact_keys(submission.email, submission.phone)
+        if submission_keys:
+            keys[submission] = submission_keys[0]
+    if not keys:
+        stats.record(0, len(pending))
+        return
+
+    rows = TeContactIndex.objects.filter(
+        loan_officer_id__in={submission.loan_officer_id for submission in pending},
+        key__in=set(keys.values()),
+        synced_at__gte=timezone.now() - max_age,
+    ).values_list("loan_officer_id", "key", "te_contact_id")
+    index = {(loan_officer_id, key): te_contact_id for loan_officer_id, key, te_contact_id in rows}
+
+    hits = 0
+    for submission, key in keys.items():
+        te_contact_id = index.get((submission.loan_officer_id, key))
+        if te_contact_id:
+            submission.known_te_contact_id = te_contact_id
+            hits += 1
+    stats.record(hits, len(pending) - hits)
+
+
+def remember(submissions):
+    """Upsert index entries for leads just synced to Total Expert. One query for the batch."""
+    now = timezone.now()
+    entries = {}
+    for submission in submissions:
+        for key in contact_keys(submission.email, submission.phone):
+            # Last lead wins when one batch has the same person twice
+            entries[(submission.loan_officer_id, key)] = TeContactIndex(
+                loan_officer_id=submission.loan_officer_id,
+                key=key,
+                te_contact_id=submission.te_contact_id,
+                synced_at=now,
+            )
+    if not entries:
+        return
+
+    # MySQL's ON DUPLICATE KEY UPDATE takes no conflict target
+    unique_fields = ["loan_officer", "key"] if connection.features.supports_update_conflicts_with_target else None
+    TeContactIndex.objects.bulk_create(
+        entries.values(),
+        update_conflicts=True,
+        unique_fields=unique_fields,
+        update_fields=["te_contact_id", "synced_at"],
+    )
@@ -0,0 +1,41 @@
+"""
+Declarative field mappings for Formidable webforms.
+
+Each entry maps a Formidable form id (the payload's "form_id") to how its
+fields land on LeadSubmission. Payloads without a known form_id use
+"default". Adding a form means adding an entry here, not editing the view.
+
+Field spec keys:
+    keys        Payload keys to read, first non-empty value wins
+    value       Constant value instead of reading the payload
+    normalize   Names from leads.mapping.NORMALIZERS, applied in order
+                (default: ["strip"])
+    max_length  Truncate to this length (default: the model field's max_length)
+
+Opt-in spec keys:
+    keys        Payload keys that carry the consent checkbox
+    rule        Name from leads.mapping.OPT_IN_RULES
+    fields      Boolean LeadSubmission fields set from the result
+"""
+
+# LO bio page form (the original hand-written extraction in webform_lead)
+LO_BIO_PAGE_FORM = {
+    "fields": {
+        "source": {"value": "webform"},
+        "first_name": {"keys": ["first_name"]},
+        "last_name": {"keys": ["last_name"]},
+        "email": {"keys": ["email"]},
+        "phone": {"keys": ["phone"]},
+        "page_url": {"keys": ["page_url"]},
+        "referrer": {"keys": ["referrer"]},
+    },
+    "opt_in": {
+        "keys": ["comm_opt_in"],
+        "rule": "present",
+        "fields": ["ok_to_email", "ok_to_call"],
+    },
+}
+
+FORM_MAPPINGS = {
+    "default": LO_BIO_PAGE_FORM,
+}
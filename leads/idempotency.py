@@ -0,0 +1,67 @@
+"""
+Duplicate-submission suppression for the webform endpoint.
+
+Every lead gets an idempotency key: lo_slug + the client's Idempotency-Key
+header if sent, otherwise a fingerprint of lo_slug + email + phone + time
+bucket. Keys
+are stored on LeadSubmission under a unique constraint, and recently seen
+keys are kept in a bounded in-process LRU so most retries and double-clicks
+are answered without touching the database.
+"""
+
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from django.conf import settings
+
+_lock = threading.Lock()
+_recent = OrderedDict()  # key -> (submission_id, monotonic expiry)
+
+
+def _digest(value: str) -> str:
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+
+def idempotency_key(request, lo_slug, payload):
+    """
+    Return the idempotency key for a webform request, or None.
+
+    No fingerprint is made for leads without an email or phone; they could
+    not be told apart.
+    """
+    header = request.headers.get("Idempotency-Key", "").strip()
+    if header:
+        # Scoped to the loan officer: different forms may reuse the same key
+        return _digest(f"key:{lo_slug}|{header}")
+
+    email = str(payload.get("email") or "").strip().lower()
+    phone = "".join(ch for ch in str(payload.get("phone") or "") if ch.isdigit())
+    if not email and not phone:
+        return None
+
+    bucket = int(time.time() // settings.LEAD_DEDUP_WINDOW)
+    return _digest(f"fp:{lo_slug}|{email}|{phone}|{bucket}")
+
+
+def lookup(key):
+    """Return the submission id recently stored under key, or None."""
+    with _lock:
+        entry = _recent.get(key)
+        if entry is None:
+            return None
+        submission_id, expires_at = entry
+        if expires_at < time.monotonic():
+            del _recent[key]
+            return None
+        _recent.move_to_end(key)
+        return submission_id
+
+
+def remember(key, submission_id):
+    """Record key -> submission id, evicting the least recently used entries."""
+    with _lock:
+        _recent[key] = (submission_id, time.monotonic() + settings.LEAD_DEDUP_WINDOW)
+        _recent.move_to_end(key)
+        while len(_recent) > settings.LEAD_DEDUP_CACHE_SIZE:
+            _recent.popitem(last=False)
@@ -0,0 +1,77 @@
+"""
+Management command to check that our hot queries can use their indexes.
+
+Runs EXPLAIN (MySQL) for each real query path and fails if the index built
+for it is not among the optimizer's candidate keys. A different chosen key
+is only reported: on small tables MySQL may prefer a scan. The same query
+paths are checked by leads/tests.py (LeadIndexTests) on MySQL.
+
+Usage:
+    python manage.py explain_lead_queries
+"""
+
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from core.models import LoanOfficer
+from leads.models import LeadSubmission, LeadStatus
+
+
+def query_paths():
+    """(description, queryset, expected index name) for each query we run."""
+    cutoff = timezone.now() - timedelta(minutes=30)
+    loan_officer = LoanOfficer.objects.order_by().first()
+    loan_officer_id = loan_officer.id if loan_officer else None
+
+    return [
+        (
+            "Stuck-lead sweep (status + submitted_at)",
+            LeadSubmission.objects.filter(status=LeadStatus.QUEUED, submitted_at__lt=cutoff).order_by("submitted_at"),
+            "lead_status_submitted_idx",
+        ),
+        (
+            "Admin loan officer filter (loan_officer, newest first)",
+            LeadSubmission.objects.filter(loan_officer_id=loan_officer_id).order_by("-submitted_at"),
+            "lead_lo_submitted_idx",
+        ),
+        (
+            "Webform slug lookup",
+            LoanOfficer.objects.filter(slug="john-smith", is_active=True),
+            "slug",
+        ),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the lead query paths and verify their indexes are usable (MySQL only)'
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'mysql':
+            raise CommandError(f'EXPLAIN checks require MySQL (connected to {connection.vendor})')
+
+        failures = 0
+        with connection.cursor() as cursor:
+            for description, queryset, expected in query_paths():
+                sql, params = queryset.query.sql_with_params()
+                cursor.execute(f'EXPLAIN {sql}', params)
+                columns = [col[0] for col in cursor.description]
+                plan = dict(zip(columns, cursor.fetchone()))
+
+                possible = (plan.get('possible_keys') or '').split(',')
+                chosen = plan.get('key')
+
+                self.stdout.write(f'{description}:')
+                self.stdout.write(f'  possible_keys={plan.get("possible_keys")} key={chosen} rows={plan.get("rows")}')
+
+                if expected not in possible and chosen != expected:
+                    failures += 1
+                    self.stdout.write(self.style.ERROR(f'  index {expected} is not usable for this query'))
+                elif chosen != expected:
+                    self.stdout.write(self.style.WARNING(f'  optimizer chose {chosen} over {expected}'))
+                else:
+                    self.stdout.write(self.style.SUCCESS(f'  uses {expected}'))
+
+        if failures:
+            raise CommandError(f'{failures} query path(s) cannot use their index')
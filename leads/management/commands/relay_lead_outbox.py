@@ -0,0 +1,77 @@
+"""
+Management command to relay queued leads from the outbox to Service Bus.
+
+Usage:
+    python manage.py relay_lead_outbox
+    python manage.py relay_lead_outbox --once --batch-size 500
+"""
+
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from config import timing
+from leads import servicebus
+from leads.outbox import relay_batch, DEFAULT_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Drain the lead outbox to Azure Service Bus'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help='Maximum number of leads sent per Service Bus batch'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Seconds to wait when the outbox is empty'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Drain the outbox once and exit instead of polling'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        poll_interval = options['poll_interval']
+
+        if not servicebus.is_configured():
+            raise CommandError('Service Bus is not configured')
+
+        self.stdout.write(f'Relaying lead outbox (batch size {batch_size})...')
+        total = 0
+
+        try:
+            while True:
+                close_old_connections()
+                try:
+                    with timing.measure() as timings:
+                        relayed = relay_batch(batch_size)
+                except Exception as e:
+                    self.stderr.write(self.style.ERROR(f'Outbox relay failed: {e}'))
+                    if options['once']:
+                        raise CommandError(f'Relayed {total} lead(s) before failing: {e}')
+                    time.sleep(poll_interval * 5)  # Back off before retrying
+                    continue
+
+                total += relayed
+                if relayed:
+                    timing.log_timings(f"Relayed {relayed} lead(s) from outbox to Service Bus", timings, leads=relayed)
+
+                if relayed < batch_size:
+                    if options['once']:
+                        break
+                    time.sleep(poll_interval)
+
+        except KeyboardInterrupt:
+            self.stdout.write('Shutting down outbox relay...')
+        finally:
+            servicebus.close_sender()
+
+        self.stdout.write(self.style.SUCCESS(f'Relayed {total} lead(s)'))
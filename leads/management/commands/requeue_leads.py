@@ -0,0 +1,163 @@
+"""
+Management command to re-drive failed, stuck or dead-lettered leads.
+
+Usage:
+    python manage.py requeue_leads                          # all FAILED leads
+    python manage.py requeue_leads --status failed --since 2024-06-01 --loan-officer john-smith
+    python manage.py requeue_leads --stuck-minutes 60       # RECEIVED/QUEUED for over an hour, no retry pending
+    python manage.py requeue_leads --dry-run
+    python manage.py requeue_leads --sms --since 2024-06-01 # PENDING/FAILED SMS opt-ins
+    python manage.py requeue_leads --dead-letter            # drain the dead-letter queue
+"""
+
+from datetime import datetime, time, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from leads import servicebus
+from leads.models import LeadStatus
+from leads.replay import (
+    select_leads,
+    requeue_leads,
+    requeue_sms_opt_ins,
+    DEFAULT_PAGE_SIZE,
+    REQUEUEABLE_STATUSES,
+)
+
+
+def parse_when(value):
+    """An ISO date or datetime argument as an aware datetime."""
+    when = parse_datetime(value)
+    if when is None:
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f'Invalid date: {value}')
+        when = datetime.combine(day, time.min)
+    if timezone.is_naive(when):
+        when = timezone.make_aware(when)
+    return when
+
+
+class Command(BaseCommand):
+    help = 'Requeue FAILED or stuck leads (or SMS opt-ins) to Service Bus, or drain the dead-letter queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--status',
+            action='append',
+            choices=[status.value for status in REQUEUEABLE_STATUSES],
+            help='Lead status to requeue (repeatable, default: failed)'
+        )
+        parser.add_argument(
+            '--stuck-minutes',
+            type=int,
+            help='Requeue RECEIVED/QUEUED leads submitted more than this many minutes ago '
+                 '(QUEUED leads waiting on a worker retry are skipped)'
+        )
+        parser.add_argument(
+            '--since',
+            help='Only leads submitted on or after this ISO date/datetime'
+        )
+        parser.add_argument(
+            '--until',
+            help='Only leads submitted before this ISO date/datetime'
+        )
+        parser.add_argument(
+            '--loan-officer',
+            action='append',
+            help='Only leads for this loan officer slug (repeatable)'
+        )
+        parser.add_argument(
+            '--page-size',
+            type=int,
+            default=DEFAULT_PAGE_SIZE,
+            help='Leads read, sent and updated per page'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Count the matching leads without sending anything'
+        )
+        parser.add_argument(
+            '--sms',
+            action='store_true',
+            help='Requeue the PENDING/FAILED SMS opt-ins of synced leads instead'
+        )
+        parser.add_argument(
+            '--dead-letter',
+            action='store_true',
+            help="Move the queue's dead-lettered messages back onto the queue instead"
+        )
+        parser.add_argument(
+            '--max-messages',
+            type=int,
+            help='With --dead-letter: stop after this many messages'
+        )
+
+    def handle(self, *args, **options):
+        if not options['dry_run'] and not servicebus.is_configured():
+            raise CommandError('Service Bus is not configured')
+
+        try:
+            if options['dead_letter']:
+                self.drain_dead_letters(options)
+            elif options['sms']:
+                self.requeue_sms(options)
+            else:
+                self.requeue(options)
+        finally:
+            servicebus.close_sender()
+
+    def drain_dead_letters(self, options):
+        if options['dry_run']:
+            raise CommandError('--dry-run is not supported with --dead-letter')
+
+        self.stdout.write('Draining dead-letter queue...')
+        moved = servicebus.drain_dead_letters(max_messages=options['max_messages'], batch_size=options['page_size'])
+        self.stdout.write(self.style.SUCCESS(f'Moved {moved} dead-lettered message(s) back to the queue'))
+
+    def requeue_sms(self, options):
+        if options['status'] or options['stuck_minutes'] is not None:
+            raise CommandError('--status and --stuck-minutes do not apply to --sms')
+
+        leads = select_leads(
+            statuses=[LeadStatus.SYNCED],
+            since=parse_when(options['since']) if options['since'] else None,
+            until=parse_when(options['until']) if options['until'] else None,
+            loan_officers=options['loan_officer'],
+        )
+
+        self.stdout.write(f'Requeuing SMS opt-ins (page size {options["page_size"]})...')
+        try:
+            total = requeue_sms_opt_ins(leads, page_size=options['page_size'], dry_run=options['dry_run'])
+        except Exception as e:
+            raise CommandError(f'Requeue failed: {e}')
+
+        verb = 'Would requeue' if options['dry_run'] else 'Requeued'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {total} SMS opt-in(s)'))
+
+    def requeue(self, options):
+        statuses = options['status'] or [LeadStatus.FAILED]
+        until = parse_when(options['until']) if options['until'] else None
+
+        if options['stuck_minutes'] is not None:
+            statuses = options['status'] or [LeadStatus.RECEIVED, LeadStatus.QUEUED]
+            cutoff = timezone.now() - timedelta(minutes=options['stuck_minutes'])
+            until = min(until, cutoff) if until else cutoff
+
+        leads = select_leads(
+            statuses=statuses,
+            since=parse_when(options['since']) if options['since'] else None,
+            until=until,
+            loan_officers=options['loan_officer'],
+        )
+
+        self.stdout.write(f'Requeuing {", ".join(statuses)} leads (page size {options["page_size"]})...')
+        try:
+            total = requeue_leads(leads, page_size=options['page_size'], dry_run=options['dry_run'])
+        except Exception as e:
+            raise CommandError(f'Requeue failed: {e}')
+
+        verb = 'Would requeue' if options['dry_run'] else 'Requeued'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {total} lead(s)'))
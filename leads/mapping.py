@@ -0,0 +1,137 @@
+"""
+Compiles the declarative form mappings in leads.form_mappings into
+extractor functions.
+
+Mappings are compiled once at import. extract_lead_fields() picks the
+extractor by the payload's form_id and returns a dict of LeadSubmission
+field values.
+"""
+
+import re
+from django.core.exceptions import FieldDoesNotExist
+
+from .form_mappings import FORM_MAPPINGS
+from .models import LeadSubmission
+
+_NON_DIGITS = re.compile(r"\D")
+
+NORMALIZERS = {
+    "strip": str.strip,
+    "lower": str.lower,
+    "digits": lambda value: _NON_DIGITS.sub("", value),
+    "collapse_spaces": lambda value: " ".join(value.split()),
+}
+
+OPT_IN_RULES = {
+    # Formidable sends the checkbox value when ticked and "" (or nothing) when not
+    "present": lambda value: value is not None and value != "",
+    "truthy": lambda value: str(value).strip().lower() in ("1", "true", "yes", "on", "y"),
+}
+
+
+class MappingError(ValueError):
+    """Raised when a form mapping is invalid."""
+
+
+def _field_step(form_id, field_name, spec):
+    """Return (field name, keys, normalizers, max_length) for one mapped field."""
+    try:
+        model_field = LeadSubmission._meta.get_field(field_name)
+    except FieldDoesNotExist:
+        raise MappingError(f"Form {form_id}: unknown LeadSubmission field {field_name!r}")
+
+    normalizers = []
+    for name in spec.get("normalize", ["strip"]):
+        if name not in NORMALIZERS:
+            raise MappingError(f"Form {form_id}: unknown normalizer {name!r} for {field_name!r}")
+        normalizers.append(NORMALIZERS[name])
+
+    keys = tuple(spec.get("keys") or [field_name])
+    max_length = int(spec.get("max_length", model_field.max_length) or 0) or None
+    return field_name, keys, tuple(normalizers), max_length
+
+
+def compile_mapping(form_id, mapping):
+    """
+    Compile one form mapping into an extractor: payload dict -> field dict.
+
+    Field names, normalizers and opt-in rules are resolved and validated
+    once, at import, into tuples of steps the extractor walks. Fields read
+    from one key and only stripped (most of them) take a shorter path.
+    """
+    constants = {}
+    stripped = []  # (field name, key, max_length)
+    steps = []  # (field name, keys, normalizers, max_length)
+    for field_name, spec in mapping.get("fields", {}).items():
+        if "value" in spec:
+            _field_step(form_id, field_name, {})  # Still check the field exists
+            constants[field_name] = spec["value"]
+            continue
+        field_name, keys, normalizers, max_length = _field_step(form_id, field_name, spec)
+        if len(keys) == 1 and normalizers == (str.strip,):
+            stripped.append((field_name, keys[0], max_length))
+        else:
+            steps.append((field_name, keys, normalizers, max_length))
+    stripped = tuple(stripped)
+    steps = tuple(steps)
+
+    opt_in = mapping.get("opt_in") or {}
+    rule = opt_in.get("rule", "present")
+    if rule not in OPT_IN_RULES:
+        raise MappingError(f"Form {form_id}: unknown opt-in rule {rule!r}")
+    opt_in_rule = OPT_IN_RULES[rule]
+    opt_in_keys = tuple(opt_in.get("keys") or [])
+    opt_in_fields = tuple(opt_in.get("fields") or [])
+
+    def extract(payload):
+        get = payload.get
+        fields = constants.copy()
+
+        for field_name, key, max_length in stripped:
+            value = get(key) or ""
+            if value.__class__ is not str:
+                value = str(value)
+            fields[field_name] = value.strip()[:max_length]
+
+        for field_name, keys, normalizers, max_length in steps:
+            for key in keys:
+                value = get(key)
+                if value:
+                    break
+            else:
+                value = ""
+            if value.__class__ is not str:
+                value = str(value)
+            for normalize in normalizers:
+                value = normalize(value)
+            fields[field_name] = value[:max_length]
+
+        if opt_in_fields:
+            raw = ""
+            for key in opt_in_keys:
+                raw = get(key, "")
+                if raw:
+                    break
+            opted_in = opt_in_rule(raw)
+            for field_name in opt_in_fields:
+                fields[field_name] = opted_in
+        return fields
+
+    return extract
+
+
+def compile_mappings(mappings):
+    """Compile every form mapping, keyed by form id."""
+    if "default" not in mappings:
+        raise MappingError("Form mappings need a 'default' entry")
+    return {str(form_id): compile_mapping(form_id, mapping) for form_id, mapping in mappings.items()}
+
+
+EXTRACTORS = compile_mappings(FORM_MAPPINGS)
+
+
+def extract_lead_fields(payload):
+    """Map a webform payload to LeadSubmission field values using its form's extractor."""
+    form_id = payload.get("form_id")
+    extractor = EXTRACTORS.get(str(form_id)) if form_id is not None else None
+    return (extractor or EXTRACTORS["default"])(payload)
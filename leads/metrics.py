@@ -0,0 +1,213 @@
+"""
+Prometheus metrics for lead ingest, queueing and Total Expert sync.
+
+Defined once here and updated by the web app, the outbox relay and the
+worker. The web app serves them at /metrics; the worker (or the worker
+supervisor) on WORKER_METRICS_PORT.
+
+Multi-process: gunicorn workers and supervised lead workers each update
+their own copy. With PROMETHEUS_MULTIPROC_DIR set (to an empty directory,
+before the processes start) prometheus_client keeps every process's values
+in an mmap'd file there, and `registry()` sums them at scrape time.
+Without it, each process serves only its own values.
+
+Recording is a lock and an add on an already resolved label child, so the
+hot path pays a microsecond or two; nothing is computed until a scrape.
+"""
+
+import os
+import time
+import functools
+
+from asgiref.sync import iscoroutinefunction
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+# Request/DB/queue timings are mostly milliseconds; Total Expert calls can
+# take seconds and retry up to the read timeout
+FAST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+TE_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 15.0, 30.0, 60.0)
+
+REQUEST_SECONDS = Histogram(
+    "lead_request_seconds", "Time to handle a lead API request", ["view"], buckets=FAST_BUCKETS
+)
+RESPONSES = Counter(
+    "lead_responses_total", "Lead API responses by HTTP status", ["view", "status"]
+)
+DB_INSERT_SECONDS = Histogram(
+    "lead_db_insert_seconds", "Time to insert a lead and its outbox entry", buckets=FAST_BUCKETS
+)
+ENQUEUE_SECONDS = Histogram(
+    "lead_enqueue_seconds", "Time to send leads to Service Bus", ["call"], buckets=FAST_BUCKETS
+)
+OUTCOMES = Counter(
+    "lead_outcomes_total", "Leads written with each LeadStatus (or SmsStatus for the SMS stage)", ["source", "status"]
+)
+TE_SECONDS = Histogram(
+    "te_request_seconds", "Total Expert API call time, transport retries included", ["call"], buckets=TE_BUCKETS
+)
+TE_RESPONSES = Counter(
+    "te_responses_total", "Total Expert API responses by HTTP status ('error' if none)", ["call", "status"]
+)
+MESSAGES_IN_FLIGHT = Gauge(
+    "worker_messages_in_flight", "Service Bus messages received and not yet settled", ["stage"],
+    multiprocess_mode="livesum",
+)
+# Token age is time() - this: a gauge computed at scrape time cannot be
+# aggregated across processes. With a shared token cache, the newest fetch
+# by any live process is the age of the token everyone uses.
+TE_TOKEN_FETCHED = Gauge(
+    "te_token_fetched_timestamp_seconds", "When a Total Expert access token was last fetched from /v1/token",
+    multiprocess_mode="livemax",
+)
+
+# Total Expert sync health: circuit breaker, adaptive rate limiter and
+# contact index (leads/te_resilience.py, leads/contact_index.py)
+TE_BREAKER_STATES = {"closed": 0, "half_open": 1, "open": 2}
+TE_BREAKER_STATE = Gauge(
+    "te_circuit_breaker_state", "Total Expert circuit breaker state: 0 closed, 1 half-open, 2 open",
+    multiprocess_mode="livemax",
+)
+TE_BREAKER_OPENED = Counter(
+    "te_circuit_breaker_opened_total", "Times the Total Expert circuit breaker opened"
+)
+TE_BREAKER_REJECTED = Counter(
+    "te_circuit_breaker_rejected_total", "Total Expert calls failed fast while the circuit was open"
+)
+TE_LIMITER_RATE = Gauge(
+    "te_rate_limit_per_second", "Allowed Total Expert calls/sec after 429 backoff (0 = uncapped)",
+    multiprocess_mode="livesum",
+)
+TE_LIMITER_THROTTLED = Counter(
+    "te_rate_limiter_throttled_total", "429s that paused the Total Expert rate limiter"
+)
+TE_LIMITER_WAIT_SECONDS = Counter(
+    "te_rate_limiter_wait_seconds_total", "Time Total Expert calls spent waiting on the rate limiter"
+)
+CONTACT_INDEX_LOOKUPS = Counter(
+    "te_contact_index_lookups_total", "Contact index lookups by result (hit, miss, stale)", ["result"]
+)
+LOG_RECORDS_DROPPED = Counter(
+    "log_records_dropped_total", "Log records dropped because the logging queue was full"
+)
+
+TE_CALLS = {
+    "/v1/token": "token",
+    "/v1/contacts": "contacts",
+    "/v1/sms/opt-in": "sms_opt_in",
+}
+_te_seconds = {call: TE_SECONDS.labels(call) for call in (*TE_CALLS.values(), "contact_update", "other")}
+
+# Label children by label values; labels() takes a lock and formats every
+# value on each call, a plain dict hit does not
+_children = {}
+
+
+def _child(metric, *values):
+    key = (metric, values)
+    child = _children.get(key)
+    if child is None:
+        child = _children[key] = metric.labels(*values)
+    return child
+
+
+def te_call(path):
+    """Metric label for a Total Expert API path; contact ids are collapsed."""
+    call = TE_CALLS.get(path)
+    if call is None:
+        call = "contact_update" if path.startswith("/v1/contacts/") else "other"
+    return call
+
+
+def observe_te_call(path, status, seconds):
+    """Record one Total Expert call; `status` is the HTTP status, or None if no response came back."""
+    call = te_call(path)
+    _te_seconds[call].observe(seconds)
+    _child(TE_RESPONSES, call, status or "error").inc()
+
+
+def count_outcome(source, status, count=1):
+    """Count `count` leads written with `status` by `source` (webform, relay, worker, sms)."""
+    _child(OUTCOMES, source, status).inc(count)
+
+
+def record_outcomes(source, statuses):
+    """Count leads written with each status, e.g. record_outcomes("worker", [s.status for s in batch])."""
+    counts = {}
+    for status in statuses:
+        counts[status] = counts.get(status, 0) + 1
+    for status, count in counts.items():
+        count_outcome(source, status, count)
+
+
+def track_view(name):
+    """
+    Decorator timing a view into lead_request_seconds and counting its
+    responses by status (500 if it raises). Works for sync and async views.
+    """
+    seconds = REQUEST_SECONDS.labels(name)
+
+    def record(started, status):
+        seconds.observe(time.perf_counter() - started)
+        _child(RESPONSES, name, status).inc()
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    response = await view(request, *args, **kwargs)
+                except Exception:
+                    record(started, 500)
+                    raise
+                record(started, response.status_code)
+                return response
+        else:
+            @functools.wraps(view)
+            def wrapper(request, *args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    response = view(request, *args, **kwargs)
+                except Exception:
+                    record(started, 500)
+                    raise
+                record(started, response.status_code)
+                return response
+        return wrapper
+
+    return decorator
+
+
+def is_multiprocess():
+    return bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+
+def registry():
+    """The registry to scrape: every process's values in multi-process mode, else this process's."""
+    if not is_multiprocess():
+        return REGISTRY
+    collected = CollectorRegistry()
+    multiprocess.MultiProcessCollector(collected)
+    return collected
+
+
+def render():
+    """Metrics in the Prometheus text format."""
+    return generate_latest(registry())
+
+
+def start_listener(port):
+    """Serve /metrics on `port` from a daemon thread (the worker has no web server)."""
+    start_http_server(port, registry=registry())
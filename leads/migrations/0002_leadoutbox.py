@@ -0,0 +1,30 @@
+# Generated by Django 5.0.12 on 2026-10-17 09:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeadOutbox',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('attempt_count', models.PositiveIntegerField(default=0, help_text='Number of failed relay attempts')),
+                ('last_error', models.TextField(blank=True, default='', help_text='Last relay error, if any')),
+                ('submission', models.OneToOneField(help_text='The lead submission waiting to be queued', on_delete=django.db.models.deletion.CASCADE, related_name='outbox_entry', to='leads.leadsubmission')),
+            ],
+            options={
+                'verbose_name': 'Lead Outbox Entry',
+                'verbose_name_plural': 'Lead Outbox',
+                'db_table': 'lead_outbox',
+                'ordering': ['id'],
+            },
+        ),
+    ]
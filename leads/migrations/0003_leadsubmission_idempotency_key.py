@@ -0,0 +1,18 @@
+# Generated by Django 5.0.12 on 2026-10-17 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0002_leadoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='leadsubmission',
+            name='idempotency_key',
+            field=models.CharField(blank=True, help_text='SHA-256 of the Idempotency-Key header or lead fingerprint', max_length=64, null=True, unique=True),
+        ),
+    ]
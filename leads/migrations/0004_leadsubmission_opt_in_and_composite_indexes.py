@@ -0,0 +1,32 @@
+# Generated by Django 5.0.12 on 2026-10-17 11:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('leads', '0003_leadsubmission_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='leadsubmission',
+            name='ok_to_call',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='leadsubmission',
+            name='ok_to_email',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='leadsubmission',
+            index=models.Index(fields=['status', 'submitted_at'], name='lead_status_submitted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leadsubmission',
+            index=models.Index(fields=['loan_officer', '-submitted_at'], name='lead_lo_submitted_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.0.12 on 2026-10-17 11:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('leads', '0004_leadsubmission_opt_in_and_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TeContactIndex',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('key', models.CharField(help_text='Normalized email or phone, prefixed with its kind', max_length=260)),
+                ('te_contact_id', models.CharField(help_text='Total Expert contact ID', max_length=120)),
+                ('synced_at', models.DateTimeField(help_text='When a lead last synced to this contact')),
+                ('loan_officer', models.ForeignKey(help_text='The loan officer who owns the contact in Total Expert', on_delete=django.db.models.deletion.CASCADE, related_name='te_contacts', to='core.loanofficer')),
+            ],
+            options={
+                'verbose_name': 'Total Expert Contact',
+                'verbose_name_plural': 'Total Expert Contact Index',
+                'db_table': 'te_contact_index',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='tecontactindex',
+            constraint=models.UniqueConstraint(fields=('loan_officer', 'key'), name='te_contact_lo_key_uniq'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.0.12 on 2026-10-17 11:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('leads', '0005_te_contact_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='leadsubmission',
+            name='sms_attempt_count',
+            field=models.PositiveIntegerField(default=0, help_text='Number of SMS opt-in attempts'),
+        ),
+        migrations.AddField(
+            model_name='leadsubmission',
+            name='sms_last_error',
+            field=models.TextField(blank=True, default='', help_text='Last SMS opt-in error, or why it was skipped'),
+        ),
+        migrations.AddField(
+            model_name='leadsubmission',
+            name='sms_opted_in_at',
+            field=models.DateTimeField(blank=True, help_text='When the SMS opt-in was recorded in Total Expert', null=True),
+        ),
+        migrations.AddField(
+            model_name='leadsubmission',
+            name='sms_status',
+            field=models.CharField(choices=[('none', 'Not requested'), ('pending', 'Pending'), ('opted_in', 'Opted in'), ('skipped', 'Skipped'), ('failed', 'Failed')], default='none', help_text='SMS opt-in status (pending once the contact is synced, if the lead opted in)', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='leadsubmission',
+            index=models.Index(fields=['sms_status', 'submitted_at'], name='lead_sms_submitted_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.0.12 on 2026-10-17 12:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('leads', '0006_leadsubmission_sms_stage'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='leadsubmission',
+            name='loan_officer',
+            field=models.ForeignKey(db_index=False, help_text='The loan officer this lead is assigned to', on_delete=django.db.models.deletion.PROTECT, related_name='leads', to='core.loanofficer'),
+        ),
+    ]
@@ -15,6 +15,15 @@ class LeadStatus(models.TextChoices):
     FAILED = "failed", "Failed"
 
 
+class SmsStatus(models.TextChoices):
+    """Status choices for a lead's SMS opt-in."""
+    NOT_REQUESTED = "none", "Not requested"
+    PENDING = "pending", "Pending"
+    OPTED_IN = "opted_in", "Opted in"
+    SKIPPED = "skipped", "Skipped"
+    FAILED = "failed", "Failed"
+
+
 class LeadSubmission(models.Model):
     """
     Represents a lead submission from a webform.
@@ -22,11 +31,13 @@ class LeadSubmission(models.Model):
     """
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     
-    # Relationship
+    # Relationship (indexed by lead_lo_submitted_idx, whose leading column
+    # it is; a separate single-column index would be redundant)
     loan_officer = models.ForeignKey(
         LoanOfficer,
         on_delete=models.PROTECT,
         related_name="leads",
+        db_index=False,
         help_text="The loan officer this lead is assigned to"
     )
     
@@ -48,6 +59,15 @@ class LeadSubmission(models.Model):
     ok_to_email = models.BooleanField(default=False)
     ok_to_call = models.BooleanField(default=False)
     
+    # Duplicate suppression (Idempotency-Key header or content fingerprint)
+    idempotency_key = models.CharField(
+        max_length=64,
+        unique=True,
+        blank=True,
+        null=True,
+        help_text="SHA-256 of the Idempotency-Key header or lead fingerprint"
+    )
+    
     # Raw payload (store everything we received)
     raw_payload = models.JSONField(default=dict, help_text="Complete JSON payload from the form submission")
     
@@ -63,11 +83,21 @@ class LeadSubmission(models.Model):
     attempt_count = models.PositiveIntegerField(default=0, help_text="Number of sync attempts")
     last_error = models.TextField(blank=True, default="", help_text="Last error message if sync failed")
     
+    # SMS opt-in (own pipeline stage, after the contact sync)
+    sms_status = models.CharField(
+        max_length=20,
+        choices=SmsStatus.choices,
+        default=SmsStatus.NOT_REQUESTED,
+        help_text="SMS opt-in status (pending once the contact is synced, if the lead opted in)"
+    )
+    sms_attempt_count = models.PositiveIntegerField(default=0, help_text="Number of SMS opt-in attempts")
+    sms_last_error = models.TextField(blank=True, default="", help_text="Last SMS opt-in error, or why it was skipped")
+    
     # Timestamps
     queued_at = models.DateTimeField(blank=True, null=True, help_text="When this lead was queued to Service Bus")
     synced_at = models.DateTimeField(blank=True, null=True, help_text="When this lead was successfully synced to Total Expert")
+    sms_opted_in_at = models.DateTimeField(blank=True, null=True, help_text="When the SMS opt-in was recorded in Total Expert")
     
-    """
     class Meta:
         verbose_name = "Lead Submission"
         verbose_name_plural = "Lead Submissions"
@@ -78,10 +108,75 @@ class LeadSubmission(models.Model):
             models.Index(fields=["status"]),
             models.Index(fields=["email"]),
             models.Index(fields=["phone"]),
+            # Stuck-lead sweeps: WHERE status = ... AND submitted_at < ...
+            models.Index(fields=["status", "submitted_at"], name="lead_status_submitted_idx"),
+            # Admin loan officer filter, newest first
+            models.Index(fields=["loan_officer", "-submitted_at"], name="lead_lo_submitted_idx"),
+            # SMS replay sweeps: WHERE sms_status = ... ORDER BY submitted_at
+            models.Index(fields=["sms_status", "submitted_at"], name="lead_sms_submitted_idx"),
         ]
-        """
     
     def __str__(self):
         name = f"{self.first_name} {self.last_name}".strip()
         contact = self.email or self.phone or "no contact"
         return f"{name or 'Unknown'} ({contact}) - {self.get_status_display()}"
+
+
+class LeadOutbox(models.Model):
+    """
+    Transactional outbox entry for a lead that still needs to be sent to Service Bus.
+
+    Written in the same DB transaction as the LeadSubmission, so the webform
+    endpoint never waits on the broker. The relay_lead_outbox command drains
+    these rows in batches and deletes them once sent.
+    """
+    id = models.BigAutoField(primary_key=True)
+    submission = models.OneToOneField(
+        LeadSubmission,
+        on_delete=models.CASCADE,
+        related_name="outbox_entry",
+        help_text="The lead submission waiting to be queued"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    attempt_count = models.PositiveIntegerField(default=0, help_text="Number of failed relay attempts")
+    last_error = models.TextField(blank=True, default="", help_text="Last relay error, if any")
+
+    class Meta:
+        verbose_name = "Lead Outbox Entry"
+        verbose_name_plural = "Lead Outbox"
+        ordering = ["id"]
+        db_table = "lead_outbox"
+
+    def __str__(self):
+        return f"Outbox entry for {self.submission_id}"
+
+
+class TeContactIndex(models.Model):
+    """
+    A contact the worker has already created in Total Expert, per loan officer.
+
+    Keyed by a normalized email or phone ("email:jane@example.com",
+    "phone:5551234567"; see leads.contact_index). A lead with a fresh match
+    updates the known contact instead of creating a duplicate.
+    """
+    id = models.BigAutoField(primary_key=True)
+    loan_officer = models.ForeignKey(
+        LoanOfficer,
+        on_delete=models.CASCADE,
+        related_name="te_contacts",
+        help_text="The loan officer who owns the contact in Total Expert"
+    )
+    key = models.CharField(max_length=260, help_text="Normalized email or phone, prefixed with its kind")
+    te_contact_id = models.CharField(max_length=120, help_text="Total Expert contact ID")
+    synced_at = models.DateTimeField(help_text="When a lead last synced to this contact")
+
+    class Meta:
+        verbose_name = "Total Expert Contact"
+        verbose_name_plural = "Total Expert Contact Index"
+        db_table = "te_contact_index"
+        constraints = [
+            models.UniqueConstraint(fields=["loan_officer", "key"], name="te_contact_lo_key_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.key} -> {self.te_contact_id}"
@@ -0,0 +1,75 @@
+"""
+Relay for the lead transactional outbox.
+
+webform_lead writes a LeadOutbox row in the same transaction as the
+LeadSubmission. This module drains those rows to Service Bus in batches and
+marks the leads QUEUED with one bulk UPDATE per batch.
+"""
+
+import logging
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from config import timing
+from . import metrics
+from .models import LeadSubmission, LeadStatus, LeadOutbox
+from .servicebus import enqueue_leads
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 100
+
+
+def relay_batch(batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """
+    Send one batch of outbox entries to Service Bus.
+
+    Rows are claimed with SELECT ... FOR UPDATE SKIP LOCKED, so several
+    relays can run side by side without sending the same lead twice.
+
+    Returns:
+        Number of leads relayed (0 when the outbox is empty)
+
+    Raises:
+        Any Service Bus error; the claimed entries stay in the outbox with
+        attempt_count/last_error updated for the next attempt.
+    """
+    entry_ids = []
+    try:
+        with transaction.atomic():
+            with timing.phase("claim"):
+                entries = list(
+                    LeadOutbox.objects
+                    .select_for_update(skip_locked=True)
+                    .only("id", "submission_id")
+                    .order_by("id")[:batch_size]
+                )
+            if not entries:
+                return 0
+
+            entry_ids = [entry.id for entry in entries]
+            submission_ids = [entry.submission_id for entry in entries]
+
+            with timing.phase("enqueue"):
+                enqueue_leads(submission_ids)
+
+            # Only RECEIVED leads move to QUEUED; never regress a lead the
+            # worker already picked up.
+            with timing.phase("status_update"):
+                queued = LeadSubmission.objects.filter(
+                    id__in=submission_ids,
+                    status=LeadStatus.RECEIVED,
+                ).update(status=LeadStatus.QUEUED, queued_at=timezone.now())
+                LeadOutbox.objects.filter(id__in=entry_ids).delete()
+
+    except Exception as e:
+        if entry_ids:
+            LeadOutbox.objects.filter(id__in=entry_ids).update(
+                attempt_count=F("attempt_count") + 1,
+                last_error=str(e)[:500],
+            )
+        raise
+
+    metrics.count_outcome("relay", LeadStatus.QUEUED, queued)
+    return len(entry_ids)
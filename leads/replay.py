@@ -0,0 +1,162 @@
+"""
+Bulk re-drive of leads that did not make it to Total Expert.
+
+Leads are selected by status, submission date and loan officer, then
+streamed in pages with keyset pagination over (status, submitted_at, id),
+which the lead_status_submitted_idx index serves directly. Each page is
+sent to Service Bus as ServiceBusMessageBatch chunks and marked QUEUED
+with one bulk UPDATE, so memory stays flat however many leads match.
+
+SMS opt-ins left PENDING or FAILED are re-driven the same way, paging over
+(sms_status, submitted_at, id) and sending to the SMS stage's queue.
+
+Used by the requeue_leads command and the LeadSubmissionAdmin actions.
+"""
+
+import logging
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import LeadOutbox, LeadSubmission, LeadStatus, SmsStatus
+from .servicebus import enqueue_leads, enqueue_sms_opt_ins
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 500
+
+# Statuses that can be re-driven; SYNCED leads are already in Total Expert
+REQUEUEABLE_STATUSES = (LeadStatus.RECEIVED, LeadStatus.QUEUED, LeadStatus.FAILED)
+
+# SMS opt-ins that can be re-driven, in the order they are paged: requeued
+# FAILED ones become PENDING, which is done by then
+REQUEUEABLE_SMS_STATUSES = (SmsStatus.PENDING, SmsStatus.FAILED)
+
+
+def select_leads(statuses=(LeadStatus.FAILED,), since=None, until=None, loan_officers=None, queryset=None):
+    """
+    Leads to re-drive.
+
+    Args:
+        statuses: Lead statuses to include
+        since: Only leads submitted at or after this datetime
+        until: Only leads submitted before this datetime
+        loan_officers: Only leads for these loan officer slugs
+        queryset: Narrow an existing queryset (e.g. the admin selection)
+    """
+    leads = LeadSubmission.objects.all() if queryset is None else queryset
+    leads = leads.filter(status__in=statuses)
+    if since is not None:
+        leads = leads.filter(submitted_at__gte=since)
+    if until is not None:
+        leads = leads.filter(submitted_at__lt=until)
+    if loan_officers:
+        leads = leads.filter(loan_officer__slug__in=loan_officers)
+    return leads
+
+
+def iter_pages(leads, page_size=DEFAULT_PAGE_SIZE, status_field="status"):
+    """
+    Yield lists of lead ids, `page_size` at a time.
+
+    Keyset pagination: every page starts after the last (status,
+    submitted_at, id) seen, so no page costs an OFFSET scan and rows that
+    change in between do not shift later pages. `status_field` is "status"
+    or "sms_status".
+    """
+    leads = leads.order_by(status_field, "submitted_at", "id")
+    last = None
+    while True:
+        page = leads
+        if last is not None:
+            status, submitted_at, lead_id = last
+            page = page.filter(
+                Q(**{f"{status_field}__gt": status})
+                | Q(**{status_field: status}, submitted_at__gt=submitted_at)
+                | Q(**{status_field: status}, submitted_at=submitted_at, id__gt=lead_id)
+            )
+        rows = list(page.values_list(status_field, "submitted_at", "id")[:page_size])
+        if not rows:
+            return
+
+        yield [lead_id for _, _, lead_id in rows]
+
+        if len(rows) < page_size:
+            return
+        last = rows[-1]
+
+
+def requeue_page(lead_ids) -> int:
+    """
+    Send one page of leads to Service Bus and mark them QUEUED.
+
+    RECEIVED leads still have an outbox entry; it is deleted in the same
+    transaction, so the relay does not send them a second time (it skips
+    the rows this transaction has locked).
+
+    Raises on a Service Bus error; the page's leads are then left as they were.
+    """
+    with transaction.atomic():
+        LeadOutbox.objects.filter(submission_id__in=lead_ids).delete()
+        enqueue_leads(lead_ids)
+        # A lead the worker synced in the meantime keeps its SYNCED status
+        return LeadSubmission.objects.filter(
+            id__in=lead_ids,
+            status__in=REQUEUEABLE_STATUSES,
+        ).update(status=LeadStatus.QUEUED, queued_at=timezone.now())
+
+
+def requeue_leads(leads, page_size=DEFAULT_PAGE_SIZE, dry_run=False) -> int:
+    """
+    Re-drive every lead in `leads` through Service Bus.
+
+    QUEUED leads with a failed attempt are skipped: the worker has scheduled
+    their retry message (up to WORKER_RETRY_MAX_SECONDS ahead), and sending
+    another would sync them twice. Once out of attempts they turn FAILED.
+
+    Returns:
+        Number of leads requeued (or that would be, with dry_run)
+    """
+    started = timezone.now()
+    # Requeued leads sort again under QUEUED; skip the ones this run queued
+    leads = (
+        leads.exclude(status=LeadStatus.SYNCED)
+        .exclude(queued_at__gte=started)
+        .exclude(status=LeadStatus.QUEUED, attempt_count__gt=0)
+    )
+
+    total = 0
+    for lead_ids in iter_pages(leads, page_size):
+        if not dry_run:
+            requeue_page(lead_ids)
+        total += len(lead_ids)
+        logger.info("%s %s lead(s)", "Would requeue" if dry_run else "Requeued", total)
+    return total
+
+
+def requeue_sms_page(lead_ids) -> int:
+    """Send one page of SMS opt-ins to the SMS stage and mark them PENDING."""
+    enqueue_sms_opt_ins(lead_ids)
+    return LeadSubmission.objects.filter(
+        id__in=lead_ids,
+        sms_status__in=REQUEUEABLE_SMS_STATUSES,
+    ).update(sms_status=SmsStatus.PENDING)
+
+
+def requeue_sms_opt_ins(leads, page_size=DEFAULT_PAGE_SIZE, dry_run=False) -> int:
+    """
+    Re-drive the PENDING and FAILED SMS opt-ins of synced leads in `leads`.
+
+    Returns:
+        Number of opt-ins requeued (or that would be, with dry_run)
+    """
+    leads = leads.filter(status=LeadStatus.SYNCED)
+
+    total = 0
+    for sms_status in REQUEUEABLE_SMS_STATUSES:
+        for lead_ids in iter_pages(leads.filter(sms_status=sms_status), page_size, status_field="sms_status"):
+            if not dry_run:
+                requeue_sms_page(lead_ids)
+            total += len(lead_ids)
+            logger.info("%s %s SMS opt-in(s)", "Would requeue" if dry_run else "Requeued", total)
+    return total
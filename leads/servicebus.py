@@ -1,57 +1,293 @@
 """
 Azure Service Bus integration for queuing lead submissions.
+
+A single ServiceBusClient, with one sender per queue, is kept per process
+and reused across requests, so a webform POST no longer pays for a fresh
+AMQP connection, TLS handshake and CBS auth. Senders are created lazily on
+first use, which under gunicorn means after the worker has forked.
+
+Leads go to SERVICEBUS_QUEUE_NAME; once a lead's contact is synced, its
+SMS opt-in goes to SERVICEBUS_SMS_QUEUE_NAME.
 """
 
 import os
 import json
+import atexit
 import logging
-from azure.servicebus import ServiceBusClient, ServiceBusMessage
+import threading
+from azure.servicebus import ServiceBusClient, ServiceBusMessage, ServiceBusSubQueue
+from azure.servicebus.exceptions import (
+    MessageSizeExceededError,
+    ServiceBusConnectionError,
+    ServiceBusCommunicationError,
+    OperationTimeoutError,
+)
 from django.conf import settings
 
+from . import metrics
+
 logger = logging.getLogger(__name__)
 
+# Errors that mean the underlying link/connection is broken and the sender
+# should be rebuilt before retrying.
+RECONNECT_ERRORS = (
+    ServiceBusConnectionError,
+    ServiceBusCommunicationError,
+    OperationTimeoutError,
+)
+
+# Per-process sender state
+_lock = threading.Lock()
+_client = None
+_senders = {}  # queue name -> sender
+_sender_pid = None
+
+
+def _close_sender_locked():
+    """Close the cached senders and client. Caller must hold _lock."""
+    global _client, _sender_pid
+
+    if _sender_pid == os.getpid():
+        for handler in (*_senders.values(), _client):
+            if handler is None:
+                continue
+            try:
+                handler.close()
+            except Exception as e:
+                logger.warning("Error closing Service Bus handler: %s", e)
+
+    # Senders inherited from a parent process are simply dropped: their
+    # sockets belong to the parent and must not be shut down from here.
+    _client = None
+    _senders.clear()
+    _sender_pid = None
+
+
+def _get_sender_locked(queue_name=None):
+    """Return the process-wide sender for a queue (default: the lead queue), creating it if needed. Caller must hold _lock."""
+    global _client, _sender_pid
+
+    queue_name = queue_name or settings.SERVICEBUS_QUEUE_NAME
+
+    if _sender_pid != os.getpid():
+        # Either first use or we are in a freshly forked child
+        _close_sender_locked()
+        _client = ServiceBusClient.from_connection_string(settings.SERVICEBUS_CONNECTION_STRING)
+        _sender_pid = os.getpid()
+
+    sender = _senders.get(queue_name)
+    if sender is None:
+        sender = _senders[queue_name] = _client.get_queue_sender(queue_name=queue_name)
+        logger.info("Opened Service Bus sender for queue %s (pid %s)", queue_name, _sender_pid)
+    return sender
+
+
+def close_sender():
+    """Close the process-wide Service Bus senders, if any are open."""
+    with _lock:
+        _close_sender_locked()
+
+
+atexit.register(close_sender)
+
+
+def send_messages(messages, queue_name=None):
+    """
+    Send one message, a list of messages or a ServiceBusMessageBatch using
+    the shared sender for `queue_name` (default: the lead queue).
+
+    If the link is broken the sender is rebuilt and the send is retried once.
+    Any other error is raised to the caller.
+    """
+    with _lock:
+        try:
+            _get_sender_locked(queue_name).send_messages(messages)
+        except RECONNECT_ERRORS as e:
+            logger.warning("Service Bus link error, reconnecting: %s", e)
+            _close_sender_locked()
+            _get_sender_locked(queue_name).send_messages(messages)
+
+
+def _send_batches_locked(messages, queue_name=None):
+    """Pack messages into as few ServiceBusMessageBatch sends as possible. Caller must hold _lock."""
+    sender = _get_sender_locked(queue_name)
+    batch = sender.create_message_batch()
+
+    for message in messages:
+        try:
+            batch.add_message(message)
+        except MessageSizeExceededError:
+            # Batch is full: ship it and start a new one
+            sender.send_messages(batch)
+            batch = sender.create_message_batch()
+            batch.add_message(message)
+
+    if len(batch):
+        sender.send_messages(batch)
+
+
+def send_in_batches(messages, queue_name=None) -> None:
+    """
+    Send a list of messages to `queue_name` (default: the lead queue) using
+    ServiceBusMessageBatch sends.
+
+    Raises on failure. A reconnect retry may resend batches that already
+    went out; the worker skips leads (and SMS opt-ins) already done.
+    """
+    if not messages:
+        return
+
+    with _lock:
+        try:
+            _send_batches_locked(messages, queue_name)
+        except RECONNECT_ERRORS as e:
+            logger.warning("Service Bus link error, reconnecting: %s", e)
+            _close_sender_locked()
+            _send_batches_locked(messages, queue_name)
+
+
+def enqueue_leads(submission_ids) -> None:
+    """
+    Enqueue many lead submissions using ServiceBusMessageBatch sends.
+
+    Raises on failure, so callers can keep the leads for a later retry.
+    """
+    with metrics.ENQUEUE_SECONDS.labels("enqueue_leads").time():
+        send_in_batches([build_lead_message(str(submission_id)) for submission_id in submission_ids])
+
+
+def enqueue_sms_opt_ins(submission_ids) -> None:
+    """
+    Queue SMS opt-ins for leads whose contact is synced, using
+    ServiceBusMessageBatch sends. Raises on failure.
+    """
+    with metrics.ENQUEUE_SECONDS.labels("enqueue_sms_opt_ins").time():
+        send_in_batches(
+            [build_sms_message(str(submission_id)) for submission_id in submission_ids],
+            queue_name=settings.SERVICEBUS_SMS_QUEUE_NAME,
+        )
+
+
+def copy_message(message) -> ServiceBusMessage:
+    """A new, sendable ServiceBusMessage with a received message's body and properties."""
+    return ServiceBusMessage(
+        b"".join(message.body),
+        content_type=message.content_type,
+        application_properties=message.application_properties,
+        correlation_id=message.correlation_id,
+        subject=message.subject,
+    )
+
+
+def drain_dead_letters(max_messages=None, batch_size=100, max_wait_time=5) -> int:
+    """
+    Move messages from the queue's dead-letter sub-queue back onto the queue.
+
+    Messages are received in chunks of `batch_size`, resent with
+    ServiceBusMessageBatch sends and only then completed on the dead-letter
+    queue, so at most one chunk is held in memory and a crash can only
+    duplicate messages, never lose them.
+
+    Args:
+        max_messages: Stop after this many messages (None = until empty)
+        batch_size: Messages received and resent per chunk
+        max_wait_time: Seconds to wait for more messages before stopping
+
+    Returns:
+        Number of messages moved
+    """
+    moved = 0
+    with ServiceBusClient.from_connection_string(settings.SERVICEBUS_CONNECTION_STRING) as client:
+        with client.get_queue_receiver(
+            queue_name=settings.SERVICEBUS_QUEUE_NAME,
+            sub_queue=ServiceBusSubQueue.DEAD_LETTER,
+        ) as receiver:
+            while max_messages is None or moved < max_messages:
+                count = batch_size if max_messages is None else min(batch_size, max_messages - moved)
+                messages = receiver.receive_messages(max_message_count=count, max_wait_time=max_wait_time)
+                if not messages:
+                    break
+
+                send_in_batches([copy_message(message) for message in messages])
+                for message in messages:
+                    receiver.complete_message(message)
+
+                moved += len(messages)
+                logger.info("Moved %s dead-lettered message(s) back to %s", moved, settings.SERVICEBUS_QUEUE_NAME)
+
+    return moved
+
+
+def build_lead_message(submission_id: str, attempt: int = 0) -> ServiceBusMessage:
+    """
+    Build the Service Bus message the worker expects for a lead submission.
+
+    `attempt` counts earlier failed syncs; the worker sets it when it
+    reschedules a lead for a retry.
+    """
+    payload = {
+        "submission_id": submission_id,
+        "action": "sync_to_crm",
+        "attempt": attempt,
+    }
+    return ServiceBusMessage(
+        json.dumps(payload),
+        content_type="application/json"
+    )
+
+
+def build_sms_message(submission_id: str, attempt: int = 0) -> ServiceBusMessage:
+    """Build the SMS opt-in stage message for a lead submission (see build_lead_message)."""
+    payload = {
+        "submission_id": submission_id,
+        "action": "sms_opt_in",
+        "attempt": attempt,
+    }
+    return ServiceBusMessage(
+        json.dumps(payload),
+        content_type="application/json"
+    )
+
+
+def is_configured() -> bool:
+    """Whether Service Bus settings are present, logging a warning if not."""
+    if not settings.SERVICEBUS_CONNECTION_STRING:
+        logger.warning("Service Bus not configured (SERVICEBUS_CONNECTION_STRING not set)")
+        return False
+
+    if not settings.SERVICEBUS_QUEUE_NAME:
+        logger.warning("Service Bus queue name not configured")
+        return False
+
+    return True
+
 
 def enqueue_lead(submission_id: str) -> bool:
     """
-    Enqueue a lead submission to Azure Service Bus for async processing.
-    
+    Enqueue a lead submission to Azure Service Bus for async processing,
+    on the process-wide sender.
+
+    The webform endpoints do not call this: they write a LeadOutbox entry
+    that relay_lead_outbox sends with enqueue_leads. It is kept for one-off
+    sends (shell, scripts) and bench_enqueue.
+
     Args:
         submission_id: UUID string of the LeadSubmission
-        
+
     Returns:
         True if successfully enqueued, False otherwise
     """
-    connection_string = settings.SERVICEBUS_CONNECTION_STRING
-    queue_name = settings.SERVICEBUS_QUEUE_NAME
-    
     # If not configured, log warning and return False
-    if not connection_string:
-        logger.warning("Service Bus not configured (SERVICEBUS_CONNECTION_STRING not set)")
+    if not is_configured():
         return False
-    
-    if not queue_name:
-        logger.warning("Service Bus queue name not configured")
-        return False
-    
+
     try:
-        # Prepare message payload
-        payload = {
-            "submission_id": submission_id,
-            "action": "sync_to_crm",
-        }
-        
-        # Send to Service Bus
-        with ServiceBusClient.from_connection_string(connection_string) as client:
-            with client.get_queue_sender(queue_name=queue_name) as sender:
-                message = ServiceBusMessage(
-                    json.dumps(payload),
-                    content_type="application/json"
-                )
-                sender.send_messages(message)
-        
-        logger.info(f"Successfully enqueued lead {submission_id} to Service Bus")
+        with metrics.ENQUEUE_SECONDS.labels("enqueue_lead").time():
+            send_messages(build_lead_message(submission_id))
+
+        logger.info("Successfully enqueued lead %s to Service Bus", submission_id)
         return True
-        
+
     except Exception as e:
-        logger.error(f"Failed to enqueue lead {submission_id} to Service Bus: {e}", exc_info=True)
+        logger.error("Failed to enqueue lead %s to Service Bus: %s", submission_id, e, exc_info=True)
         return False
@@ -0,0 +1,221 @@
+"""
+Client-side protection for the Total Expert API.
+
+RateLimiter is a token bucket shared by every worker thread or task in a
+process (each process has its own, so the rate is per process). A 429 pauses it for the Retry-After period and halves its rate;
+the rate then creeps back up as calls succeed. With rate=0 there is no
+steady cap and only the Retry-After pauses apply.
+
+CircuitBreaker trips after `failure_threshold` consecutive failures
+(connection errors, timeouts, 5xx). While open, calls fail fast with
+CircuitOpenError and the worker stops receiving messages. After
+`reset_timeout` seconds a single probe call is let through (half-open):
+success closes the circuit, failure reopens it. The clients record a
+failure for a call that ends in any exception, so a probe can never be
+left unresolved.
+
+Both are thread-safe and never block while holding their lock, so the
+asyncio worker can share them.
+"""
+
+import time
+import asyncio
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling Total Expert while the circuit is open."""
+
+
+def parse_retry_after(value, default=1.0):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)."""
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+class RateLimiter:
+    """
+    Adaptive token bucket.
+
+    Args:
+        rate: Calls per second allowed when Total Expert is not throttling
+            (0 = no cap, only honor Retry-After)
+        burst: Bucket size (calls that may go out back to back)
+        min_rate: Floor the rate is never cut below after a 429
+    """
+
+    def __init__(self, rate=10.0, burst=None, min_rate=0.5):
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.burst = float(burst or max(1.0, rate))
+        self.min_rate = min(float(min_rate), self.max_rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        # Metrics
+        self.throttled = 0
+        self.waited_seconds = 0.0
+        metrics.TE_LIMITER_RATE.set(self.rate)
+
+    def _reserve(self):
+        """Take one token; return how long the caller must wait before sending."""
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self._paused_until - now)
+            if self.rate:
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                self._tokens -= 1
+                wait = max(wait, -self._tokens / self.rate)
+            self.waited_seconds += wait
+        if wait:
+            metrics.TE_LIMITER_WAIT_SECONDS.inc(wait)
+        return wait
+
+    def acquire(self):
+        """Block the calling thread until a call may be sent."""
+        wait = self._reserve()
+        if wait:
+            time.sleep(wait)
+
+    async def aacquire(self):
+        """Async version of acquire."""
+        wait = self._reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+    def record_throttled(self, retry_after):
+        """Total Expert answered 429: pause for `retry_after` seconds and halve the rate."""
+        with self._lock:
+            self.throttled += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            if self.rate:
+                self.rate = max(self.min_rate, self.rate / 2)
+                self._tokens = min(self._tokens, 0.0)
+            rate = self.rate
+        metrics.TE_LIMITER_THROTTLED.inc()
+        metrics.TE_LIMITER_RATE.set(rate)
+        logger.warning("Total Expert throttled us; pausing %.1fs, rate now %.2f/s", retry_after, self.rate)
+
+    def record_success(self):
+        """Recover towards the configured rate, about 1% of it per successful call."""
+        if self.rate < self.max_rate:
+            with self._lock:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 100)
+                rate = self.rate
+            metrics.TE_LIMITER_RATE.set(rate)
+
+    def snapshot(self):
+        return {
+            "rate": round(self.rate, 3),
+            "max_rate": self.max_rate,
+            "throttled": self.throttled,
+            "waited_seconds": round(self.waited_seconds, 3),
+            "paused_for": round(max(0.0, self._paused_until - time.monotonic()), 3),
+        }
+
+
+class CircuitBreaker:
+    """
+    Args:
+        failure_threshold: Consecutive failures that open the circuit
+        reset_timeout: Seconds the circuit stays open before a probe
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        # Metrics
+        self.opened = 0
+        self.rejected = 0
+        self._set_state_locked(self.CLOSED)
+
+    def _set_state_locked(self, state):
+        self.state = state
+        metrics.TE_BREAKER_STATE.set(metrics.TE_BREAKER_STATES[state])
+
+    def _refresh_locked(self):
+        if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._set_state_locked(self.HALF_OPEN)
+            self._probe_in_flight = False
+            logger.info("Total Expert circuit half-open, sending a probe")
+
+    def current_state(self):
+        with self._lock:
+            self._refresh_locked()
+            return self.state
+
+    def seconds_until_probe(self):
+        """Seconds until an open circuit lets a probe through (0 if not open)."""
+        with self._lock:
+            self._refresh_locked()
+            if self.state != self.OPEN:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go out now."""
+        with self._lock:
+            self._refresh_locked()
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            self.rejected += 1
+        metrics.TE_BREAKER_REJECTED.inc()
+        raise CircuitOpenError("Total Expert circuit is open")
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("Total Expert circuit closed")
+                self._set_state_locked(self.CLOSED)
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self._failures >= self.failure_threshold):
+                self._set_state_locked(self.OPEN)
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+                self.opened += 1
+                metrics.TE_BREAKER_OPENED.inc()
+                logger.warning(
+                    "Total Expert circuit opened after %s consecutive failure(s); retrying in %ss",
+                    self._failures, self.reset_timeout
+                )
+
+    def snapshot(self):
+        return {
+            "state": self.current_state(),
+            "consecutive_failures": self._failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
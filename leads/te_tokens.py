@@ -0,0 +1,236 @@
+"""
+Total Expert OAuth access token cache.
+
+- Single-flight: one refresh at a time per process, so concurrent misses
+  do not stampede /v1/token.
+- Proactive: once a token is within `refresh_before` seconds of expiry, the
+  next caller starts a background refresh and keeps using the current token.
+- Shared (optional): the token is kept in Django's cache, so every process
+  and container on the same cache (CACHE_BACKEND=db) reuses one token. A
+  cache.add() lock keeps refreshes single-flight across processes too.
+
+TokenCache backs the threaded TotalExpertClient, AsyncTokenCache the
+asyncio one. Both take a `fetch` callable returning the decoded /v1/token
+response.
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import namedtuple
+
+from django.core.cache import cache
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = "totalexpert:access_token"
+LOCK_KEY = "totalexpert:access_token:lock"
+
+# Seconds between polls while another process holds the refresh lock
+LOCK_POLL_INTERVAL = 0.1
+
+# Times are time.time() epoch seconds
+Token = namedtuple("Token", ["value", "expires_at", "refresh_at"])
+
+
+class _TokenCacheBase:
+    """
+    Args:
+        fetch: Callable returning the /v1/token JSON (a coroutine function
+            for AsyncTokenCache)
+        shared: Keep the token in Django's cache for other processes
+        refresh_before: Seconds before expiry at which a background refresh
+            starts (at most half the token's lifetime)
+        expiry_margin: Seconds before the real expiry a token stops being used
+        lock_timeout: Seconds to wait on another process's refresh before
+            fetching anyway
+    """
+
+    def __init__(self, fetch, shared=False, refresh_before=600, expiry_margin=60, lock_timeout=30):
+        self.fetch = fetch
+        self.shared = shared
+        self.refresh_before = refresh_before
+        self.expiry_margin = expiry_margin
+        self.lock_timeout = lock_timeout
+        self._token = None
+        self._refreshing = False
+        # Tokens fetched from /v1/token by this process
+        self.fetches = 0
+
+    def _make_token(self, data):
+        now = time.time()
+        lifetime = data.get("expires_in", 3600) - self.expiry_margin
+        # Short-lived tokens refresh at half their lifetime, not on every call
+        refresh_at = now + max(lifetime - self.refresh_before, lifetime / 2)
+        return Token(data["access_token"], now + lifetime, refresh_at)
+
+    @staticmethod
+    def _needs_refresh(token, rejected=None, proactive=False):
+        if token is None or token.value == rejected:
+            return True
+        now = time.time()
+        return now >= token.expires_at or (proactive and now >= token.refresh_at)
+
+    def _fetched(self, data):
+        token = self._make_token(data)
+        self.fetches += 1
+        metrics.TE_TOKEN_FETCHED.set_to_current_time()
+        logger.info("Successfully obtained Total Expert access token")
+        return token
+
+    @staticmethod
+    def _cache_timeout(token):
+        return max(1, int(token.expires_at - time.time()))
+
+
+class TokenCache(_TokenCacheBase):
+    """Thread-safe token cache for TotalExpertClient."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = threading.Lock()
+        self._flag_lock = threading.Lock()
+
+    def get(self):
+        """Return a usable access token, refreshing it if needed."""
+        token = self._token
+        if token is not None:
+            now = time.time()
+            if now < token.refresh_at:
+                return token.value
+            if now < token.expires_at:
+                self._start_background_refresh()
+                return token.value
+        return self._refresh().value
+
+    def invalidate(self, rejected):
+        """
+        Replace a token Total Expert refused (401) and return the new one.
+        Callers that hit 401 together share a single refresh.
+        """
+        return self._refresh(rejected=rejected).value
+
+    def _refresh(self, rejected=None, proactive=False):
+        with self._lock:
+            # Another thread may have refreshed while we waited
+            if self._needs_refresh(self._token, rejected, proactive):
+                self._token = self._obtain(rejected, proactive)
+            return self._token
+
+    def _obtain(self, rejected, proactive):
+        if not self.shared:
+            logger.info("Requesting new Total Expert access token...")
+            return self._fetched(self.fetch())
+
+        deadline = time.monotonic() + self.lock_timeout
+        while True:
+            stored = cache.get(CACHE_KEY)
+            stored = Token(*stored) if stored else None
+            if not self._needs_refresh(stored, rejected, proactive):
+                return stored
+
+            if cache.add(LOCK_KEY, os.getpid(), timeout=self.lock_timeout):
+                try:
+                    logger.info("Requesting new Total Expert access token (shared)...")
+                    token = self._fetched(self.fetch())
+                    cache.set(CACHE_KEY, tuple(token), timeout=self._cache_timeout(token))
+                    return token
+                finally:
+                    cache.delete(LOCK_KEY)
+
+            # Another process is refreshing
+            if proactive and not self._needs_refresh(stored, rejected):
+                return stored
+            if time.monotonic() >= deadline:
+                logger.warning("Timed out waiting for shared Total Expert token refresh")
+                return self._fetched(self.fetch())
+            time.sleep(LOCK_POLL_INTERVAL)
+
+    def _start_background_refresh(self):
+        with self._flag_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_refresh, name="te-token-refresh", daemon=True).start()
+
+    def _background_refresh(self):
+        try:
+            self._refresh(proactive=True)
+        except Exception as e:
+            logger.warning("Background Total Expert token refresh failed: %s", e)
+        finally:
+            self._refreshing = False
+
+
+class AsyncTokenCache(_TokenCacheBase):
+    """Token cache for AsyncTotalExpertClient; use from a single event loop."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = asyncio.Lock()
+        self._refresh_task = None
+
+    async def get(self):
+        """Return a usable access token, refreshing it if needed."""
+        token = self._token
+        if token is not None:
+            now = time.time()
+            if now < token.refresh_at:
+                return token.value
+            if now < token.expires_at:
+                if not self._refreshing:
+                    self._refreshing = True
+                    self._refresh_task = asyncio.create_task(self._background_refresh())
+                return token.value
+        return (await self._refresh()).value
+
+    async def invalidate(self, rejected):
+        """Async version of TokenCache.invalidate."""
+        return (await self._refresh(rejected=rejected)).value
+
+    async def _refresh(self, rejected=None, proactive=False):
+        async with self._lock:
+            if self._needs_refresh(self._token, rejected, proactive):
+                self._token = await self._obtain(rejected, proactive)
+            return self._token
+
+    async def _obtain(self, rejected, proactive):
+        if not self.shared:
+            logger.info("Requesting new Total Expert access token...")
+            return self._fetched(await self.fetch())
+
+        deadline = time.monotonic() + self.lock_timeout
+        while True:
+            stored = await cache.aget(CACHE_KEY)
+            stored = Token(*stored) if stored else None
+            if not self._needs_refresh(stored, rejected, proactive):
+                return stored
+
+            if await cache.aadd(LOCK_KEY, os.getpid(), timeout=self.lock_timeout):
+                try:
+                    logger.info("Requesting new Total Expert access token (shared)...")
+                    token = self._fetched(await self.fetch())
+                    await cache.aset(CACHE_KEY, tuple(token), timeout=self._cache_timeout(token))
+                    return token
+                finally:
+                    await cache.adelete(LOCK_KEY)
+
+            # Another process is refreshing
+            if proactive and not self._needs_refresh(stored, rejected):
+                return stored
+            if time.monotonic() >= deadline:
+                logger.warning("Timed out waiting for shared Total Expert token refresh")
+                return self._fetched(await self.fetch())
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+
+    async def _background_refresh(self):
+        try:
+            await self._refresh(proactive=True)
+        except Exception as e:
+            logger.warning("Background Total Expert token refresh failed: %s", e)
+        finally:
+            self._refreshing = False
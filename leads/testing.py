@@ -0,0 +1,516 @@
+"""
+Local stand-ins for Service Bus and Total Expert, used by the leads tests
+and the benchmarks.
+
+FakeServiceBusTransport mimics the parts of azure.servicebus (sync and aio)
+we use. Opening a client costs `connect_latency` seconds (AMQP connect, TLS
+handshake and CBS auth), every send or schedule costs `send_latency` and
+every complete/abandon `settle_latency`. A fraction `error_rate` of sends
+raise ServiceBusConnectionError. Sent messages land in an in-memory queue
+per queue name, so the worker can receive them back; scheduled messages
+become receivable at their enqueue time and abandoned ones immediately.
+A receiver opened with sub_queue=ServiceBusSubQueue.DEAD_LETTER reads the
+queue's dead-letter queue (FakeServiceBusTransport.dead_letter_queue).
+
+FakeTotalExpertServer is a local HTTP stand-in for the Total Expert API.
+"""
+
+import heapq
+import asyncio
+import itertools
+import threading
+import time
+import random
+from datetime import datetime, timezone
+
+from azure.servicebus import ServiceBusSubQueue
+from azure.servicebus.exceptions import MessageSizeExceededError, ServiceBusConnectionError
+
+
+class FakeServiceBusMessageBatch:
+    def __init__(self, max_messages=100):
+        self.max_messages = max_messages
+        self.messages = []
+
+    def add_message(self, message):
+        if len(self.messages) >= self.max_messages:
+            raise MessageSizeExceededError(message="Batch is full")
+        self.messages.append(message)
+
+    def __len__(self):
+        return len(self.messages)
+
+
+class FakeQueue:
+    """One in-memory queue: messages ordered by when they become receivable."""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.heap = []  # (due monotonic time, sequence number, message)
+        self.sequence = itertools.count(1)
+        self.completed = 0
+        self.abandoned = 0
+        self.scheduled = 0
+
+    def put(self, messages, delay=0.0):
+        due = time.monotonic() + max(0.0, delay)
+        numbers = []
+        with self.condition:
+            for message in messages:
+                number = next(self.sequence)
+                heapq.heappush(self.heap, (due, number, message))
+                numbers.append(number)
+            self.condition.notify_all()
+        return numbers
+
+    def get(self, max_count, max_wait=None):
+        """Up to `max_count` due messages, waiting up to `max_wait` seconds for the first."""
+        deadline = time.monotonic() + (max_wait or 0)
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                messages = []
+                while self.heap and self.heap[0][0] <= now and len(messages) < max_count:
+                    messages.append(heapq.heappop(self.heap)[2])
+                if messages or now >= deadline:
+                    return messages
+                wait = deadline - now
+                if self.heap:
+                    wait = min(wait, self.heap[0][0] - now)
+                self.condition.wait(wait)
+
+    def complete(self, message):
+        with self.condition:
+            self.completed += 1
+
+    def abandon(self, message):
+        """Make an abandoned message receivable again right away."""
+        with self.condition:
+            self.abandoned += 1
+        self.put([message])
+
+    def __len__(self):
+        with self.condition:
+            return len(self.heap)
+
+
+class FakeServiceBusSender:
+    def __init__(self, transport, queue_name=None):
+        self.transport = transport
+        self.queue_name = queue_name
+
+    def send_messages(self, messages):
+        time.sleep(self.transport.send_latency)
+        self.transport.deliver(self.queue_name, messages)
+
+    def schedule_messages(self, messages, schedule_time_utc):
+        time.sleep(self.transport.send_latency)
+        return self.transport.schedule(self.queue_name, messages, schedule_time_utc)
+
+    def create_message_batch(self, max_size_in_bytes=None):
+        return FakeServiceBusMessageBatch(self.transport.batch_max_messages)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FakeServiceBusReceiver:
+    def __init__(self, transport, queue_name):
+        self.transport = transport
+        self.queue = transport.queue(queue_name)
+
+    def receive_messages(self, max_message_count=1, max_wait_time=None):
+        return self.queue.get(max_message_count or 1, max_wait_time)
+
+    def complete_message(self, message):
+        time.sleep(self.transport.settle_latency)
+        self.queue.complete(message)
+
+    def abandon_message(self, message):
+        time.sleep(self.transport.settle_latency)
+        self.queue.abandon(message)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FakeAsyncServiceBusSender:
+    """azure.servicebus.aio sender over a FakeServiceBusSender; the latency is awaited, not slept."""
+
+    def __init__(self, transport, queue_name=None):
+        self.transport = transport
+        self.queue_name = queue_name
+
+    async def send_messages(self, messages):
+        await asyncio.sleep(self.transport.send_latency)
+        self.transport.deliver(self.queue_name, messages)
+
+    async def schedule_messages(self, messages, schedule_time_utc):
+        await asyncio.sleep(self.transport.send_latency)
+        return self.transport.schedule(self.queue_name, messages, schedule_time_utc)
+
+    def create_message_batch(self, max_size_in_bytes=None):
+        return FakeServiceBusMessageBatch(self.transport.batch_max_messages)
+
+    async def close(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+class FakeAsyncServiceBusReceiver:
+    def __init__(self, transport, queue_name):
+        self.transport = transport
+        self.queue = transport.queue(queue_name)
+
+    async def receive_messages(self, max_message_count=1, max_wait_time=None):
+        deadline = time.monotonic() + (max_wait_time or 0)
+        while True:
+            messages = self.queue.get(max_message_count or 1)
+            if messages or time.monotonic() >= deadline:
+                return messages
+            await asyncio.sleep(0.005)
+
+    async def complete_message(self, message):
+        await asyncio.sleep(self.transport.settle_latency)
+        self.queue.complete(message)
+
+    async def abandon_message(self, message):
+        await asyncio.sleep(self.transport.settle_latency)
+        self.queue.abandon(message)
+
+    async def close(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+class FakeAutoLockRenewer:
+    """Message locks never expire in the fake queues, so there is nothing to renew."""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def register(self, receiver, renewable, **kwargs):
+        pass
+
+    def close(self, wait=True):
+        pass
+
+
+class FakeAsyncAutoLockRenewer(FakeAutoLockRenewer):
+    async def close(self):
+        pass
+
+
+class FakeServiceBusTransport:
+    def __init__(
+        self,
+        connect_latency=0.05,
+        send_latency=0.005,
+        batch_max_messages=100,
+        settle_latency=0.0,
+        error_rate=0.0,
+        seed=None,
+    ):
+        self.connect_latency = connect_latency
+        self.send_latency = send_latency
+        self.batch_max_messages = batch_max_messages
+        self.settle_latency = settle_latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.sends = 0
+        self.send_errors = 0
+        self.sent = []
+        self.queues = {}
+
+    def queue(self, name):
+        """The in-memory queue for `name`, created on first use."""
+        with self.lock:
+            queue = self.queues.get(name)
+            if queue is None:
+                queue = self.queues[name] = FakeQueue()
+            return queue
+
+    def dead_letter_queue(self, name):
+        """The in-memory dead-letter queue of queue `name`."""
+        return self.queue(self.receiver_queue_name(name, ServiceBusSubQueue.DEAD_LETTER))
+
+    def receiver_queue_name(self, queue_name, sub_queue=None):
+        """Name of the in-memory queue a receiver for `queue_name` and `sub_queue` reads."""
+        if sub_queue == ServiceBusSubQueue.DEAD_LETTER:
+            return f"{queue_name}/$deadletterqueue"
+        return queue_name
+
+    def _fail_sometimes(self):
+        with self.lock:
+            failed = self.random.random() < self.error_rate
+            self.send_errors += failed
+        if failed:
+            raise ServiceBusConnectionError(message="Injected Service Bus send failure")
+
+    def deliver(self, queue_name, messages):
+        """Record a send (a message, list or batch) and queue its messages."""
+        self._fail_sometimes()
+        if isinstance(messages, FakeServiceBusMessageBatch):
+            messages = messages.messages
+        elif not isinstance(messages, list):
+            messages = [messages]
+        with self.lock:
+            self.sent.extend(messages)
+            self.sends += 1
+        self.queue(queue_name).put(messages)
+
+    def schedule(self, queue_name, messages, schedule_time_utc):
+        """Queue messages to become receivable at `schedule_time_utc`; returns their sequence numbers."""
+        self._fail_sometimes()
+        if not isinstance(messages, list):
+            messages = [messages]
+        queue = self.queue(queue_name)
+        with queue.condition:
+            queue.scheduled += len(messages)
+        delay = (schedule_time_utc - datetime.now(timezone.utc)).total_seconds()
+        return queue.put(messages, delay)
+
+    def client_class(self):
+        """Return a ServiceBusClient-compatible class bound to this transport."""
+        transport = self
+
+        class FakeServiceBusClient:
+            @classmethod
+            def from_connection_string(cls, conn_str, **kwargs):
+                time.sleep(transport.connect_latency)
+                transport.connections += 1
+                return cls()
+
+            def get_queue_sender(self, queue_name, **kwargs):
+                return FakeServiceBusSender(transport, queue_name)
+
+            def get_queue_receiver(self, queue_name, sub_queue=None, **kwargs):
+                return FakeServiceBusReceiver(transport, transport.receiver_queue_name(queue_name, sub_queue))
+
+            def close(self):
+                pass
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                self.close()
+
+        return FakeServiceBusClient
+
+    def async_client_class(self):
+        """Return an azure.servicebus.aio.ServiceBusClient-compatible class bound to this transport."""
+        transport = self
+
+        class FakeAsyncServiceBusClient:
+            @classmethod
+            def from_connection_string(cls, conn_str, **kwargs):
+                transport.connections += 1
+                return cls()
+
+            def get_queue_sender(self, queue_name, **kwargs):
+                return FakeAsyncServiceBusSender(transport, queue_name)
+
+            def get_queue_receiver(self, queue_name, sub_queue=None, **kwargs):
+                return FakeAsyncServiceBusReceiver(transport, transport.receiver_queue_name(queue_name, sub_queue))
+
+            async def close(self):
+                pass
+
+            async def __aenter__(self):
+                await asyncio.sleep(transport.connect_latency)
+                return self
+
+            async def __aexit__(self, *exc):
+                await self.close()
+
+        return FakeAsyncServiceBusClient
+
+
+class FakeTotalExpertServer:
+    """
+    Local HTTP/1.1 stand-in for the Total Expert API.
+
+    Serves POST /v1/token, /v1/contacts and /v1/sms/opt-in, and PATCH
+    /v1/contacts/<id> (404 unless the fake created that id), on 127.0.0.1 from
+    a background thread. Every request waits `latency` seconds, plus
+    `connect_latency` on the first request of a new connection (standing in
+    for the TCP+TLS handshake a real HTTPS call pays). A fraction
+    `error_rate` of requests get a 503, and `throttle_rate` get a 429 with a
+    Retry-After header. Counts requests per path and distinct TCP
+    connections, so keep-alive reuse is visible.
+
+    Tokens from /v1/token report `expires_in` seconds; other calls need one
+    of them as a bearer token, else 401. revoke_tokens() invalidates every
+    token issued so far.
+
+    Usage:
+        with FakeTotalExpertServer(latency=0.05) as server:
+            client = TotalExpertClient(server.url, "id", "secret")
+    """
+
+    def __init__(
+        self,
+        latency=0.0,
+        connect_latency=0.0,
+        error_rate=0.0,
+        throttle_rate=0.0,
+        retry_after=1,
+        expires_in=3600,
+        seed=None,
+    ):
+        import random
+        import threading
+
+        self.latency = latency
+        self.connect_latency = connect_latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.expires_in = expires_in
+        self.valid_tokens = set()
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.statuses = {}
+        self.connections = set()
+        self.tokens_issued = 0
+        self.contacts_created = 0
+        self.contacts_updated = 0
+        self._server = None
+        self._thread = None
+
+    def revoke_tokens(self):
+        """Make every token issued so far answer 401."""
+        with self.lock:
+            self.valid_tokens.clear()
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler_class(self):
+        import json
+        from http.server import BaseHTTPRequestHandler
+
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are separate writes; without this, Nagle plus
+            # delayed ACKs add ~40ms to every reused connection.
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status, body, headers=None):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+                with fake.lock:
+                    fake.statuses[status] = fake.statuses.get(status, 0) + 1
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                self.rfile.read(length)
+                route = self.path
+                if self.command == "PATCH" and self.path.startswith("/v1/contacts/"):
+                    route = "/v1/contacts/{id}"
+                with fake.lock:
+                    fake.requests[route] = fake.requests.get(route, 0) + 1
+                    new_connection = self.client_address not in fake.connections
+                    fake.connections.add(self.client_address)
+                    roll = fake.random.random()
+
+                delay = fake.latency + (fake.connect_latency if new_connection else 0)
+                if delay:
+                    time.sleep(delay)
+
+                if roll < fake.throttle_rate:
+                    return self._reply(429, {"error": "rate limited"}, {"Retry-After": str(fake.retry_after)})
+                if roll < fake.throttle_rate + fake.error_rate:
+                    return self._reply(503, {"error": "unavailable"})
+
+                if self.path == "/v1/token":
+                    with fake.lock:
+                        fake.tokens_issued += 1
+                        token = f"token-{fake.tokens_issued}"
+                        fake.valid_tokens.add(token)
+                    return self._reply(200, {"access_token": token, "expires_in": fake.expires_in})
+
+                token = (self.headers.get("Authorization") or "").removeprefix("Bearer ")
+                if token not in fake.valid_tokens:
+                    return self._reply(401, {"error": "invalid token"})
+                if route == "/v1/contacts/{id}":
+                    contact_id = self.path.rsplit("/", 1)[1]
+                    with fake.lock:
+                        known = contact_id.isdigit() and 0 < int(contact_id) <= fake.contacts_created
+                        fake.contacts_updated += known
+                    if not known:
+                        return self._reply(404, {"error": "contact not found"})
+                    return self._reply(200, {"id": int(contact_id)})
+                if self.path == "/v1/contacts":
+                    with fake.lock:
+                        fake.contacts_created += 1
+                        contact_id = fake.contacts_created
+                    return self._reply(201, {"id": contact_id})
+                if self.path == "/v1/sms/opt-in":
+                    return self._reply(200, {"status": "OPTED_IN"})
+                return self._reply(404, {"error": "not found"})
+
+            do_PATCH = do_POST
+
+        return Handler
+
+    def start(self):
+        import threading
+        from http.server import ThreadingHTTPServer
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,1043 @@
+"""
+Tests for the leads app.
+
+Run with `python manage.py test leads`. The EXPLAIN checks need MySQL (the
+production database) and are skipped on other backends.
+"""
+
+import io
+import json
+import asyncio
+import logging
+import socket
+import tempfile
+import threading
+import unittest
+import uuid
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import aiohttp
+import requests
+from azure.servicebus.exceptions import ServiceBusConnectionError
+from prometheus_client import REGISTRY
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from config import timing
+from config.log import JsonFormatter, PayloadSummary, QueueListenerHandler
+from core.models import LoanOfficer
+from leads.management.commands.explain_lead_queries import query_paths
+from leads import idempotency, servicebus
+from leads.models import LeadSubmission, LeadStatus, LeadOutbox, SmsStatus
+from leads.outbox import relay_batch
+from leads.replay import REQUEUEABLE_STATUSES, requeue_leads, select_leads
+from leads.te_resilience import CircuitBreaker, CircuitOpenError
+from leads.testing import FakeServiceBusTransport, FakeTotalExpertServer
+from leads.totalexpert import AsyncTotalExpertClient, TotalExpertClient
+from workers import process_leads
+
+# Transaction control is not counted against query budgets: it is
+# BEGIN/COMMIT on SQLite, SAVEPOINT/RELEASE inside a TestCase, and not
+# logged at all by MySQL
+TRANSACTION_STATEMENTS = {"BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE"}
+
+
+@unittest.skipUnless(connection.vendor == "mysql", "EXPLAIN plans are checked on MySQL only")
+class LeadIndexTests(TestCase):
+    """The hot lead queries can use the indexes built for them."""
+
+    @classmethod
+    def setUpTestData(cls):
+        LoanOfficer.objects.create(slug="john-smith", first_name="John", last_name="Smith", te_owner_id="TE_1")
+
+    def explain(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN {sql}", params)
+            columns = [column[0] for column in cursor.description]
+            return dict(zip(columns, cursor.fetchone()))
+
+    def assertUsesIndex(self, queryset, index):
+        plan = self.explain(queryset)
+        usable = set((plan.get("possible_keys") or "").split(",")) | {plan.get("key")}
+        self.assertIn(index, usable, f"EXPLAIN plan: {plan}")
+
+    def test_query_paths_use_their_indexes(self):
+        for description, queryset, index in query_paths():
+            with self.subTest(description):
+                self.assertUsesIndex(queryset, index)
+
+    def test_stuck_lead_sweep_uses_status_submitted_index(self):
+        paths = {index: queryset for _, queryset, index in query_paths()}
+        self.assertUsesIndex(paths["lead_status_submitted_idx"], "lead_status_submitted_idx")
+
+    def test_loan_officer_filter_uses_lo_submitted_index(self):
+        paths = {index: queryset for _, queryset, index in query_paths()}
+        self.assertUsesIndex(paths["lead_lo_submitted_idx"], "lead_lo_submitted_idx")
+
+
+class ForgetIdempotencyKeysMixin:
+    """
+    Clears the in-process LRU of recent idempotency keys around each test,
+    so a lead posted by one test is not answered as a duplicate in the next.
+    """
+
+    def setUp(self):
+        super().setUp()
+        idempotency._recent.clear()
+        self.addCleanup(idempotency._recent.clear)
+
+
+class WebformBatchTests(ForgetIdempotencyKeysMixin, TestCase):
+    """Every batch item gets its own result; one bad item never fails the rest."""
+
+    @classmethod
+    def setUpTestData(cls):
+        LoanOfficer.objects.create(slug="john-smith", first_name="John", last_name="Smith", te_owner_id="TE_1")
+
+    def post_batch(self, body, content_type="application/json"):
+        return self.client.post("/api/v1/leads/webform/batch", body, content_type=content_type)
+
+    def assertResults(self, response, expected):
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual([result["status"] for result in results], [status for status, _ in expected])
+        for result, (status, error) in zip(results, expected):
+            if error is not None:
+                self.assertEqual(result["error"], error)
+
+    def test_json_array_results_per_item(self):
+        items = [
+            {"lo_slug": "john-smith", "email": "jane@example.com"},
+            {"lo_slug": "jon-smith", "email": "jane@example.com"},
+            {"lo_slug": 3, "email": "jane@example.com"},
+            {"email": "jane@example.com"},
+            "not an object",
+        ]
+        response = self.post_batch(json.dumps(items))
+
+        self.assertResults(response, [
+            (201, None),
+            (404, "Unknown loan officer: jon-smith"),
+            (400, "lo_slug must be a string"),
+            (400, "lo_slug is required"),
+            (400, "Invalid JSON payload"),
+        ])
+        self.assertEqual(response.json()["created"], 1)
+        self.assertEqual(LeadSubmission.objects.count(), 1)
+        self.assertEqual(LeadOutbox.objects.count(), 1)
+
+    def test_ndjson_malformed_line_is_rejected_alone(self):
+        body = "\n".join([
+            json.dumps({"lo_slug": "john-smith", "email": "jane@example.com"}),
+            '{"lo_slug": "john-smith", ',
+            json.dumps({"lo_slug": "jon-smith"}),
+            json.dumps({"lo_slug": ["john-smith"]}),
+        ])
+        response = self.post_batch(body, content_type="application/x-ndjson")
+
+        self.assertResults(response, [
+            (201, None),
+            (400, "Invalid JSON payload"),
+            (404, "Unknown loan officer: jon-smith"),
+            (400, "lo_slug must be a string"),
+        ])
+        self.assertEqual(LeadSubmission.objects.count(), 1)
+
+    def test_invalid_batch_body(self):
+        self.assertEqual(self.post_batch('{"lo_slug": "john-smith"}').status_code, 400)
+        self.assertEqual(self.post_batch(b"\xff\xfe", content_type="application/x-ndjson").status_code, 400)
+
+    def test_webform_rejects_non_string_lo_slug(self):
+        response = self.client.post(
+            "/api/v1/leads/webform", json.dumps({"lo_slug": 3}), content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["error"], "lo_slug must be a string")
+
+
+class IdempotencyTests(ForgetIdempotencyKeysMixin, TestCase):
+    """Retries and double-clicks return the original lead instead of a new one."""
+
+    @classmethod
+    def setUpTestData(cls):
+        LoanOfficer.objects.create(slug="john-smith", first_name="John", last_name="Smith", te_owner_id="TE_1")
+        LoanOfficer.objects.create(slug="mary-jones", first_name="Mary", last_name="Jones", te_owner_id="TE_2")
+
+    def post_lead(self, payload, key=None):
+        headers = {"HTTP_IDEMPOTENCY_KEY": key} if key else {}
+        return self.client.post(
+            "/api/v1/leads/webform", json.dumps(payload), content_type="application/json", **headers
+        )
+
+    def assertDuplicateOf(self, response, original):
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], "duplicate")
+        self.assertEqual(response.json()["id"], original.json()["id"])
+
+    def test_header_key_returns_original_submission(self):
+        first = self.post_lead({"lo_slug": "john-smith", "email": "jane@example.com"}, key="abc-123")
+        # The header wins over the content: a retry may carry edited fields
+        retry = self.post_lead({"lo_slug": "john-smith", "email": "other@example.com"}, key="abc-123")
+
+        self.assertEqual(first.status_code, 201)
+        self.assertDuplicateOf(retry, first)
+        self.assertEqual(LeadSubmission.objects.count(), 1)
+        self.assertEqual(LeadOutbox.objects.count(), 1)
+
+    def test_header_key_is_scoped_to_loan_officer(self):
+        self.post_lead({"lo_slug": "john-smith", "email": "jane@example.com"}, key="abc-123")
+        other = self.post_lead({"lo_slug": "mary-jones", "email": "jane@example.com"}, key="abc-123")
+
+        self.assertEqual(other.status_code, 201)
+        self.assertEqual(LeadSubmission.objects.count(), 2)
+
+    def test_distinct_header_keys_are_not_fingerprinted(self):
+        payload = {"lo_slug": "john-smith", "email": "jane@example.com"}
+        self.post_lead(payload, key="first")
+        second = self.post_lead(payload, key="second")
+
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(LeadSubmission.objects.count(), 2)
+
+    def test_fingerprint_without_header(self):
+        first = self.post_lead({"lo_slug": "john-smith", "email": "Jane@Example.com", "phone": "555-1234"})
+        again = self.post_lead({"lo_slug": "john-smith", "email": " jane@example.com", "phone": "(555) 1234"})
+        other = self.post_lead({"lo_slug": "john-smith", "email": "jane@example.com", "phone": "555-9999"})
+
+        self.assertDuplicateOf(again, first)
+        self.assertEqual(other.status_code, 201)
+        self.assertEqual(LeadSubmission.objects.count(), 2)
+
+    def test_fingerprint_expires_with_its_time_bucket(self):
+        payload = {"lo_slug": "john-smith", "email": "jane@example.com"}
+        window = settings.LEAD_DEDUP_WINDOW
+        with mock.patch.object(idempotency.time, "time", return_value=window * 1000):
+            self.post_lead(payload)
+        with mock.patch.object(idempotency.time, "time", return_value=window * 1001):
+            later = self.post_lead(payload)
+
+        self.assertEqual(later.status_code, 201)
+        self.assertEqual(LeadSubmission.objects.count(), 2)
+
+    def test_no_fingerprint_without_email_or_phone(self):
+        payload = {"lo_slug": "john-smith", "first_name": "Jane"}
+        self.post_lead(payload)
+        second = self.post_lead(payload)
+
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(list(LeadSubmission.objects.values_list("idempotency_key", flat=True)), [None, None])
+
+    def test_concurrent_insert_returns_stored_submission(self):
+        first = self.post_lead({"lo_slug": "john-smith", "email": "jane@example.com"}, key="abc-123")
+        # Another process stored the key: this one's cache has never seen it,
+        # so the insert hits the unique constraint
+        idempotency._recent.clear()
+        with CaptureQueriesContext(connection) as queries:
+            retry = self.post_lead({"lo_slug": "john-smith", "email": "jane@example.com"}, key="abc-123")
+
+        self.assertDuplicateOf(retry, first)
+        self.assertTrue(any(query["sql"].startswith("INSERT") for query in queries.captured_queries))
+        self.assertEqual(LeadSubmission.objects.count(), 1)
+        self.assertEqual(LeadOutbox.objects.count(), 1)
+
+        # The stored id is cached, so the next retry skips the database
+        with CaptureQueriesContext(connection) as queries:
+            self.assertDuplicateOf(self.post_lead({"lo_slug": "john-smith"}, key="abc-123"), first)
+        self.assertFalse(any("leads_leadsubmission" in query["sql"] for query in queries.captured_queries))
+
+
+class FakeServiceBusMixin:
+    """Routes leads.servicebus through an in-memory FakeServiceBusTransport."""
+
+    def setUp(self):
+        super().setUp()
+        self.transport = FakeServiceBusTransport(connect_latency=0, send_latency=0)
+        overrides = self.settings(
+            SERVICEBUS_CONNECTION_STRING="Endpoint=sb://fake/;SharedAccessKeyName=x;SharedAccessKey=y",
+            SERVICEBUS_QUEUE_NAME="webform-leads",
+            SERVICEBUS_SMS_QUEUE_NAME="webform-leads-sms",
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        patcher = mock.patch.object(servicebus, "ServiceBusClient", self.transport.client_class())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Drop any sender cached by an earlier test, and ours afterwards
+        servicebus.close_sender()
+        self.addCleanup(servicebus.close_sender)
+
+    def queued_payloads(self, queue_name="webform-leads"):
+        """Take every receivable message off a fake queue and decode its body."""
+        return [json.loads(b"".join(message.body)) for message in self.transport.queue(queue_name).get(1000)]
+
+
+class OutboxRelayTests(ForgetIdempotencyKeysMixin, FakeServiceBusMixin, TestCase):
+    """relay_batch sends outbox entries to Service Bus and marks their leads QUEUED."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.loan_officer = LoanOfficer.objects.create(
+            slug="john-smith", first_name="John", last_name="Smith", te_owner_id="TE_1"
+        )
+
+    def create_leads(self, count, status=LeadStatus.RECEIVED):
+        leads = []
+        for _ in range(count):
+            lead = LeadSubmission.objects.create(loan_officer=self.loan_officer, status=status)
+            LeadOutbox.objects.create(submission=lead)
+            leads.append(lead)
+        return leads
+
+    def test_relay_sends_and_marks_queued(self):
+        leads = self.create_leads(2)
+
+        self.assertEqual(relay_batch(), 2)
+
+        self.assertEqual(
+            self.queued_payloads(),
+            [{"submission_id": str(lead.id), "action": "sync_to_crm", "attempt": 0} for lead in leads],
+        )
+        for lead in leads:
+            lead.refresh_from_db()
+            self.assertEqual(lead.status, LeadStatus.QUEUED)
+            self.assertIsNotNone(lead.queued_at)
+        self.assertFalse(LeadOutbox.objects.exists())
+
+    def test_relay_drains_in_batches(self):
+        self.create_leads(3)
+
+        self.assertEqual([relay_batch(batch_size=2) for _ in range(3)], [2, 1, 0])
+        self.assertEqual(len(self.queued_payloads()), 3)
+
+    def test_relay_never_regresses_a_processed_lead(self):
+        # e.g. requeued by hand and synced before the relay ran
+        lead, = self.create_leads(1, status=LeadStatus.SYNCED)
+
+        self.assertEqual(relay_batch(), 1)
+
+        lead.refresh_from_db()
+        self.assertEqual(lead.status, LeadStatus.SYNCED)
+        self.assertIsNone(lead.queued_at)
+        self.assertFalse(LeadOutbox.objects.exists())
+
+    def test_failed_send_keeps_entries_for_retry(self):
+        lead, = self.create_leads(1)
+        self.transport.error_rate = 1.0
+
+        with self.assertRaises(ServiceBusConnectionError):
+            relay_batch()
+
+        entry = LeadOutbox.objects.get(submission=lead)
+        self.assertEqual(entry.attempt_count, 1)
+        self.assertIn("Injected Service Bus send failure", entry.last_error)
+        lead.refresh_from_db()
+        self.assertEqual(lead.status, LeadStatus.RECEIVED)
+
+        self.transport.error_rate = 0.0
+        self.assertEqual(relay_batch(), 1)
+        self.assertFalse(LeadOutbox.objects.exists())
+
+    def test_webform_lead_is_relayed(self):
+        response = self.client.post(
+            "/api/v1/leads/webform",
+            json.dumps({"lo_slug": "john-smith", "email": "jane@example.com"}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 201)
+        # Nothing is sent until the relay runs
+        self.assertEqual(self.queued_payloads(), [])
+
+        call_command("relay_lead_outbox", "--once", stdout=io.StringIO())
+
+        self.assertEqual([payload["submission_id"] for payload in self.queued_payloads()], [response.json()["id"]])
+        self.assertEqual(LeadSubmission.objects.get().status, LeadStatus.QUEUED)
+
+
+class ServerTimingHeaderTests(ForgetIdempotencyKeysMixin, TestCase):
+    """Phase timings are only returned to callers holding a profile token."""
+
+    @classmethod
+    def setUpTestData(cls):
+        LoanOfficer.objects.create(slug="john-smith", first_name="John", last_name="Smith", te_owner_id="TE_1")
+
+    def setUp(self):
+        super().setUp()
+        profile_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(profile_dir.cleanup)
+        overrides = self.settings(SERVER_TIMING=True, SERVER_TIMING_HEADER=False, PROFILE_DIR=profile_dir.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def post_lead(self, **headers):
+        return self.client.post(
+            "/api/v1/leads/webform",
+            json.dumps({"lo_slug": "john-smith", "email": "jane@example.com"}),
+            content_type="application/json",
+            headers=headers,
+        )
+
+    def test_anonymous_response_has_no_timings(self):
+        response = self.post_lead()
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn("Server-Timing", response.headers)
+
+    def test_invalid_token_gets_no_timings(self):
+        response = self.post_lead(**{timing.PROFILE_HEADER: "forged"})
+        self.assertNotIn("Server-Timing", response.headers)
+
+    def test_profile_token_gets_timings(self):
+        response = self.post_lead(**{timing.PROFILE_HEADER: timing.profile_token()})
+        self.assertIn("dedup;dur=", response.headers["Server-Timing"])
+
+    def test_header_for_everyone_when_enabled(self):
+        with self.settings(SERVER_TIMING_HEADER=True):
+            response = self.post_lead()
+        self.assertIn("total;dur=", response.headers["Server-Timing"])
+
+
+class RequeueLeadsTests(TestCase):
+    """Re-driving FAILED and stuck leads (leads.replay, the requeue_leads command and admin action)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.loan_officer = LoanOfficer.objects.create(
+            slug="john-smith", first_name="John", last_name="Smith", te_owner_id="TE_1"
+        )
+
+    def create_lead(self, status, attempt_count=0, **fields):
+        return LeadSubmission.objects.create(
+            loan_officer=self.loan_officer, status=status, attempt_count=attempt_count, **fields
+        )
+
+    def setUp(self):
+        patcher = mock.patch("leads.replay.enqueue_leads")
+        self.enqueue_leads = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def sent_ids(self):
+        return {lead_id for call in self.enqueue_leads.call_args_list for lead_id in call.args[0]}
+
+    def test_requeue_skips_synced_and_retrying_leads(self):
+        failed = self.create_lead(LeadStatus.FAILED, attempt_count=8)
+        received = self.create_lead(LeadStatus.RECEIVED)
+        LeadOutbox.objects.create(submission=received)
+        queued = self.create_lead(LeadStatus.QUEUED)
+        retrying = self.create_lead(LeadStatus.QUEUED, attempt_count=2)
+        self.create_lead(LeadStatus.SYNCED, attempt_count=1)
+
+        total = requeue_leads(select_leads(statuses=REQUEUEABLE_STATUSES), page_size=2)
+
+        self.assertEqual(total, 3)
+        self.assertEqual(self.sent_ids(), {failed.id, received.id, queued.id})
+        for lead in (failed, received, queued):
+            lead.refresh_from_db()
+            self.assertEqual(lead.status, LeadStatus.QUEUED)
+            self.assertIsNotNone(lead.queued_at)
+        retrying.refresh_from_db()
+        self.assertIsNone(retrying.queued_at)
+        # The relay must not send the RECEIVED lead a second time
+        self.assertFalse(LeadOutbox.objects.exists())
+
+    def test_failed_send_leaves_leads_untouched(self):
+        lead = self.create_lead(LeadStatus.RECEIVED)
+        LeadOutbox.objects.create(submission=lead)
+        self.enqueue_leads.side_effect = RuntimeError("Service Bus down")
+
+        with self.assertRaises(RuntimeError):
+            requeue_leads(select_leads(statuses=REQUEUEABLE_STATUSES))
+
+        lead.refresh_from_db()
+        self.assertEqual(lead.status, LeadStatus.RECEIVED)
+        self.assertTrue(LeadOutbox.objects.filter(submission=lead).exists())
+
+    def test_stuck_minutes_only_requeues_old_leads(self):
+        old = self.create_lead(LeadStatus.QUEUED)
+        LeadSubmission.objects.filter(id=old.id).update(submitted_at=timezone.now() - timedelta(hours=2))
+        self.create_lead(LeadStatus.QUEUED)
+
+        with mock.patch.object(servicebus, "is_configured", return_value=True), \
+                mock.patch.object(servicebus, "close_sender"):
+            call_command("requeue_leads", "--stuck-minutes", "60", stdout=io.StringIO())
+
+        self.assertEqual(self.sent_ids(), {old.id})
+
+    def test_admin_action_refuses_large_selections(self):
+        leads = [self.create_lead(LeadStatus.FAILED, attempt_count=8) for _ in range(3)]
+        user = User.objects.create_superuser("admin", "admin@example.com", "password")
+        self.client.force_login(user)
+
+        with mock.patch.object(servicebus, "is_configured", return_value=True), \
+                mock.patch("leads.admin.ADMIN_REQUEUE_MAX_LEADS", 2):
+            response = self.client.post(
+                reverse("admin:leads_leadsubmission_changelist"),
+                {"action": "requeue_selected", "_selected_action": [str(lead.id) for lead in leads]},
+            )
+
+        self.assertEqual(response.status_code, 302)
+        notices = [str(message) for message in get_messages(response.wsgi_request)]
+        self.assertTrue(any("the admin requeues at most 2" in notice for notice in notices), notices)
+        self.enqueue_leads.assert_not_called()
+
+
+class CircuitBreakerProbeTests(SimpleTestCase):
+    """A half-open probe is resolved however the call ends."""
+
+    def setUp(self):
+        # reset_timeout=0: an open circuit is half-open again right away
+        self.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        self.breaker.record_failure()
+
+    def assertProbeReleased(self):
+        self.assertEqual(self.breaker.opened, 2)
+        self.breaker.before_call()  # Raises CircuitOpenError if the probe is stuck in flight
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.current_state(), CircuitBreaker.CLOSED)
+
+    def test_sync_probe_raising_unexpected_exception(self):
+        client = TotalExpertClient("http://te.invalid", "test", "test", breaker=self.breaker)
+        with mock.patch.object(client.session, "request", side_effect=ValueError("bad URL")):
+            with self.assertRaises(ValueError):
+                client._send("/v1/contacts")
+        self.assertProbeReleased()
+
+    def test_async_probe_raising_unexpected_exception(self):
+        for error in (aiohttp.ClientPayloadError("truncated body"), asyncio.CancelledError()):
+            with self.subTest(type(error).__name__):
+                self.setUp()
+                client = AsyncTotalExpertClient("http://te.invalid", "test", "test", breaker=self.breaker)
+                session = mock.Mock()
+                session.request.side_effect = error
+                with mock.patch.object(client, "_get_session", return_value=session):
+                    with self.assertRaises(type(error)):
+                        asyncio.run(client._request("/v1/contacts"))
+                self.assertProbeReleased()
+
+
+class TotalExpertClientTests(SimpleTestCase):
+    """The pooled client against a local fake Total Expert API."""
+
+    def setUp(self):
+        self.server = FakeTotalExpertServer().start()
+        self.addCleanup(self.server.stop)
+        self.client = TotalExpertClient(self.server.url, "test", "test")
+        self.addCleanup(self.client.close)
+
+    def test_calls_share_one_connection_and_token(self):
+        for _ in range(3):
+            self.client.create_contact({"first_name": "Jane"})
+        self.client.sms_opt_in({"phone_number": "5550100"})
+
+        self.assertEqual(len(self.server.connections), 1)
+        self.assertEqual(self.server.tokens_issued, 1)
+        self.assertEqual(self.server.requests, {"/v1/token": 1, "/v1/contacts": 3, "/v1/sms/opt-in": 1})
+
+    def test_rejected_token_is_refreshed_once(self):
+        self.client.create_contact({"first_name": "Jane"})
+        self.server.revoke_tokens()
+
+        self.assertEqual(self.client.create_contact({"first_name": "Jane"}), {"id": 2})
+        self.assertEqual(self.server.tokens_issued, 2)
+        self.assertEqual(self.server.statuses[401], 1)
+
+    def test_writes_are_not_replayed_after_a_server_error(self):
+        contact_id = self.client.create_contact({"first_name": "Jane"})["id"]
+        self.server.error_rate = 1.0
+
+        # Neither POST nor PATCH is idempotent: a 503 is raised, not retried
+        for call in (
+            lambda: self.client.create_contact({"first_name": "Jane"}),
+            lambda: self.client.update_contact(contact_id, {"first_name": "Jane"}),
+        ):
+            with self.assertRaises(requests.HTTPError) as raised:
+                call()
+            self.assertEqual(raised.exception.response.status_code, 503)
+        self.assertEqual(self.server.requests["/v1/contacts"], 2)
+        self.assertEqual(self.server.requests["/v1/contacts/{id}"], 1)
+
+    def test_unknown_contact_raises_404(self):
+        self.client.get_access_token()
+
+        with self.assertRaises(requests.HTTPError) as raised:
+            self.client.update_contact(999, {"first_name": "Jane"})
+
+        self.assertEqual(raised.exception.response.status_code, 404)
+
+    def test_silent_server_times_out(self):
+        # Accepts connections (into the backlog) but never answers
+        with socket.create_server(("127.0.0.1", 0)) as listener:
+            host, port = listener.getsockname()
+            client = TotalExpertClient(f"http://{host}:{port}", "test", "test", read_timeout=0.2)
+            self.addCleanup(client.close)
+
+            with self.assertRaises(requests.Timeout):
+                client.create_contact({"first_name": "Jane"})
+
+
+class QueueListenerHandlerTests(SimpleTestCase):
+    def make_logger(self, handler):
+        logger = logging.getLogger(f"leads.tests.{self._testMethodName}")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        return logger
+
+    def test_args_are_rendered_when_logged(self):
+        stream = io.StringIO()
+        handler = QueueListenerHandler(stream)
+        handler.setFormatter(JsonFormatter())
+        logger = self.make_logger(handler)
+
+        payload = {"lo_slug": "john-smith", "email": "jane@example.com"}
+        logger.info("Webform payload received: %s", PayloadSummary(payload))
+        payload["lo_slug"] = "changed-later"
+        handler.close()  # Flushes the queue
+
+        message = json.loads(stream.getvalue())["message"]
+        self.assertIn("lo_slug='john-smith'", message)
+        self.assertNotIn("jane@example.com", message)
+
+    def test_full_queue_drops_and_counts(self):
+        handler = QueueListenerHandler(io.StringIO(), maxsize=1)
+        handler._listener.stop()  # Nothing drains the queue
+        self.addCleanup(handler.target.close)
+        logger = self.make_logger(handler)
+        before = REGISTRY.get_sample_value("log_records_dropped_total") or 0
+
+        for i in range(3):
+            logger.info("record %s", i)
+
+        self.assertEqual(REGISTRY.get_sample_value("log_records_dropped_total") - before, 2)
+
+
+class FakeMessage:
+    def __init__(self, submission_id, attempt=0, action="sync_to_crm"):
+        self.body = json.dumps({"submission_id": str(submission_id), "action": action, "attempt": attempt})
+
+    def __str__(self):
+        return self.body
+
+
+class FakeReceiver:
+    def __init__(self):
+        self.completed = 0
+        self.abandoned = 0
+        self.threads = set()  # threads that settled messages
+
+    def complete_message(self, message):
+        self.completed += 1
+        self.threads.add(threading.get_ident())
+
+    def abandon_message(self, message):
+        self.abandoned += 1
+        self.threads.add(threading.get_ident())
+
+
+class FakeSender:
+    def __init__(self):
+        self.scheduled = []  # (decoded body, enqueue time)
+        self.error = None
+
+    def schedule_messages(self, message, schedule_time_utc):
+        if self.error is not None:
+            raise self.error
+        self.scheduled.append((json.loads(str(message)), schedule_time_utc))
+
+
+def http_error(status, retry_after=None):
+    """A requests.HTTPError as raised by TotalExpertClient for `status`."""
+    response = requests.Response()
+    response.status_code = status
+    response._content = b'{"error": "test"}'
+    if retry_after is not None:
+        response.headers["Retry-After"] = str(retry_after)
+    return requests.HTTPError(response=response)
+
+
+class WorkerBatchQueryTests(TestCase):
+    """
+    SQL statements per received batch in the worker (see
+    benchmarks/bench_worker_batch.py): one SELECT for the leads and one for
+    the contact index, then one bulk UPDATE and one contact index upsert,
+    however many messages the batch holds.
+    """
+
+    BATCH_SIZE = 20
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = FakeTotalExpertServer().start()
+        cls.addClassCleanup(cls.server.stop)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.loan_officer = LoanOfficer.objects.create(
+            slug="john-smith", first_name="John", last_name="Smith", te_owner_id="TE_1"
+        )
+
+    def setUp(self):
+        te_client = TotalExpertClient(self.server.url, "test", "test")
+        self.addCleanup(te_client.close)
+        patcher = mock.patch.object(process_leads, "te_client", te_client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def queue_leads(self):
+        submissions = LeadSubmission.objects.bulk_create(
+            LeadSubmission(
+                loan_officer=self.loan_officer,
+                first_name="Test",
+                email=f"lead{i}@example.com",
+                phone="5550100",
+                status=LeadStatus.QUEUED,
+            )
+            for i in range(self.BATCH_SIZE)
+        )
+        return [FakeMessage(submission.id) for submission in submissions]
+
+    def assertBatchQueries(self, budget):
+        messages = self.queue_leads()
+        receiver = FakeReceiver()
+        with CaptureQueriesContext(connection) as queries:
+            process_leads.process_batch(receiver, None, messages, None)
+
+        statements = [
+            query["sql"] for query in queries.captured_queries
+            if query["sql"].split(None, 1)[0].upper() not in TRANSACTION_STATEMENTS
+        ]
+        self.assertEqual(len(statements), budget, "\n".join(statements))
+        self.assertEqual(receiver.completed, self.BATCH_SIZE)
+        self.assertEqual(
+            LeadSubmission.objects.filter(status=LeadStatus.SYNCED).count(), self.BATCH_SIZE
+        )
+
+    def test_batch_query_budget(self):
+        with mock.patch.object(process_leads, "TE_CONTACT_INDEX", "update"):
+            self.assertBatchQueries(4)
+
+    def test_batch_query_budget_without_contact_index(self):
+        # No index lookup and no upsert: the leads SELECT and the bulk UPDATE
+        with mock.patch.object(process_leads, "TE_CONTACT_INDEX", "off"):
+            self.assertBatchQueries(2)
+
+
+class WorkerTestMixin:
+    """
+    Runs process_leads.process_batch on FakeMessages, with Total Expert
+    replaced by a mock whose create_contact returns contact 101.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.loan_officer = LoanOfficer.objects.create(
+            slug="john-smith", first_name="John", last_name="Smith", te_owner_id="TE_1"
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.te_client = mock.Mock(spec=TotalExpertClient)
+        self.te_client.create_contact.return_value = {"id": 101}
+        for name, value in (("te_client", self.te_client), ("TE_CONTACT_INDEX", "off")):
+            patcher = mock.patch.object(process_leads, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.receiver = FakeReceiver()
+
+    def create_leads(self, count, **fields):
+        fields = {"first_name": "Test", "phone": "5550100", "status": LeadStatus.QUEUED, **fields}
+        return LeadSubmission.objects.bulk_create(
+            LeadSubmission(loan_officer=self.loan_officer, email=f"lead{i}@example.com", **fields)
+            for i in range(count)
+        )
+
+    def process(self, messages, sender=None, pool=None, stage=process_leads.CONTACT_STAGE):
+        process_leads.process_batch(self.receiver, sender, messages, pool, stage)
+
+
+class WorkerThreadPoolTests(WorkerTestMixin, TestCase):
+    """With a pool, leads sync on pool threads and messages settle on the receiving thread."""
+
+    def test_pool_syncs_leads_concurrently(self):
+        leads = self.create_leads(4)
+        # Every call waits for the other three: they can only pass together
+        barrier = threading.Barrier(4, timeout=5)
+        sync_threads = set()
+
+        def create_contact(contact_data):
+            sync_threads.add(threading.get_ident())
+            barrier.wait()
+            return {"id": 101}
+
+        self.te_client.create_contact.side_effect = create_contact
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            self.process([FakeMessage(lead.id) for lead in leads], pool=pool)
+
+        self.assertEqual(len(sync_threads), 4)
+        self.assertNotIn(threading.get_ident(), sync_threads)
+        self.assertEqual(self.receiver.threads, {threading.get_ident()})
+        self.assertEqual(self.receiver.completed, 4)
+        self.assertEqual(LeadSubmission.objects.filter(status=LeadStatus.SYNCED, te_contact_id="101").count(), 4)
+
+    def test_missing_lead_is_abandoned_alone(self):
+        lead, = self.create_leads(1)
+        messages = [FakeMessage(lead.id), FakeMessage(uuid.uuid4())]
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            self.process(messages, pool=pool)
+
+        self.assertEqual((self.receiver.completed, self.receiver.abandoned), (1, 1))
+        lead.refresh_from_db()
+        self.assertEqual(lead.status, LeadStatus.SYNCED)
+
+
+class WriteBehindStatusTests(WorkerTestMixin, TestCase):
+    """A batch's status changes are written in one UPDATE before any message is settled."""
+
+    def test_one_update_of_the_status_fields(self):
+        leads = self.create_leads(3)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.process([FakeMessage(lead.id) for lead in leads])
+
+        updates = [query["sql"] for query in queries.captured_queries if query["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 1)
+        self.assertIn("te_contact_id", updates[0])
+        self.assertNotIn("raw_payload", updates[0])
+        self.assertNotIn("user_agent", updates[0])
+
+    def test_status_is_stored_before_messages_complete(self):
+        leads = self.create_leads(2)
+        stored = []
+        self.receiver.complete_message = lambda message: stored.append(
+            LeadSubmission.objects.get(id=json.loads(str(message))["submission_id"]).status
+        )
+
+        self.process([FakeMessage(lead.id) for lead in leads])
+
+        self.assertEqual(stored, [LeadStatus.SYNCED, LeadStatus.SYNCED])
+
+    def test_failed_write_abandons_the_batch(self):
+        leads = self.create_leads(3)
+
+        with mock.patch.object(LeadSubmission.objects, "bulk_update", side_effect=DatabaseError("gone away")):
+            self.process([FakeMessage(lead.id) for lead in leads])
+
+        self.assertEqual((self.receiver.completed, self.receiver.abandoned), (0, 3))
+        self.assertFalse(LeadSubmission.objects.exclude(status=LeadStatus.QUEUED).exists())
+
+
+class RetryBackoffTests(WorkerTestMixin, TestCase):
+    """Failed syncs are rescheduled with backoff until a permanent error or the last attempt."""
+
+    def setUp(self):
+        super().setUp()
+        for name, value in (
+            ("WORKER_MAX_ATTEMPTS", 3),
+            ("WORKER_RETRY_BASE_SECONDS", 30),
+            ("WORKER_RETRY_MAX_SECONDS", 3600),
+        ):
+            patcher = mock.patch.object(process_leads, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.sender = FakeSender()
+
+    def sync(self, attempt=0, error=None):
+        lead, = self.create_leads(1)
+        self.te_client.create_contact.side_effect = error
+        self.process([FakeMessage(lead.id, attempt=attempt)], sender=self.sender)
+        lead.refresh_from_db()
+        return lead
+
+    def test_is_final_attempt(self):
+        self.assertEqual([process_leads.is_final_attempt(attempt) for attempt in range(3)], [False, False, True])
+        for status in (400, 403, 404, 422):
+            self.assertTrue(process_leads.is_final_attempt(0, status), status)
+        for status in (401, 408, 429, 500, 503):
+            self.assertFalse(process_leads.is_final_attempt(0, status), status)
+
+    def test_retry_delay_doubles_up_to_the_cap(self):
+        with mock.patch.object(process_leads.random, "uniform", side_effect=lambda low, high: high):
+            self.assertEqual([process_leads.retry_delay(attempt) for attempt in (1, 2, 3, 20)], [30, 60, 120, 3600])
+            self.assertEqual(process_leads.retry_delay(1, retry_after=900), 900)
+        # Jitter: anywhere from half the delay up to all of it
+        for _ in range(50):
+            self.assertTrue(15 <= process_leads.retry_delay(1) <= 30)
+
+    def test_transient_error_reschedules_the_next_attempt(self):
+        before = timezone.now()
+        lead = self.sync(error=http_error(503))
+
+        (body, enqueue_at), = self.sender.scheduled
+        self.assertEqual(body, {"submission_id": str(lead.id), "action": "sync_to_crm", "attempt": 1})
+        self.assertTrue(before + timedelta(seconds=15) <= enqueue_at <= timezone.now() + timedelta(seconds=30))
+        self.assertEqual(self.receiver.completed, 1)
+        self.assertEqual((lead.status, lead.attempt_count), (LeadStatus.QUEUED, 1))
+        self.assertIn("503", lead.last_error)
+
+    def test_retry_after_is_the_minimum_delay(self):
+        before = timezone.now()
+        self.sync(error=http_error(429, retry_after=900))
+
+        (_, enqueue_at), = self.sender.scheduled
+        self.assertGreaterEqual(enqueue_at, before + timedelta(seconds=900))
+
+    def test_last_attempt_marks_the_lead_failed(self):
+        lead = self.sync(attempt=2, error=http_error(503))
+
+        self.assertEqual(self.sender.scheduled, [])
+        self.assertEqual(self.receiver.completed, 1)
+        self.assertEqual(lead.status, LeadStatus.FAILED)
+
+    def test_permanent_error_fails_at_once(self):
+        lead = self.sync(error=http_error(400))
+
+        self.assertEqual(self.sender.scheduled, [])
+        self.assertEqual((lead.status, lead.attempt_count), (LeadStatus.FAILED, 1))
+
+    def test_open_circuit_does_not_use_an_attempt(self):
+        lead = self.sync(attempt=1, error=CircuitOpenError("Total Expert circuit is open"))
+
+        (body, _), = self.sender.scheduled
+        self.assertEqual(body["attempt"], 1)
+        self.assertEqual((lead.status, lead.attempt_count), (LeadStatus.QUEUED, 0))
+
+    def test_failed_reschedule_abandons_the_message(self):
+        self.sender.error = ServiceBusConnectionError(message="Service Bus down")
+        self.sync(error=http_error(503))
+
+        self.assertEqual((self.receiver.completed, self.receiver.abandoned), (0, 1))
+
+
+class SmsOptInStageTests(FakeServiceBusMixin, WorkerTestMixin, TestCase):
+    """Contact sync only queues SMS opt-ins; the SMS stage sends them with its own retries."""
+
+    def sms_stage(self, lead, attempt=0, sender=None):
+        self.process(
+            [FakeMessage(lead.id, attempt=attempt, action="sms_opt_in")], sender=sender, stage=process_leads.SMS_STAGE
+        )
+        lead.refresh_from_db()
+        return lead
+
+    def test_contact_stage_queues_opted_in_leads(self):
+        opted_in, = self.create_leads(1, ok_to_call=True)
+        not_asked, = self.create_leads(1, ok_to_call=False)
+        no_phone, = self.create_leads(1, ok_to_call=True, phone="")
+
+        self.process([FakeMessage(lead.id) for lead in (opted_in, not_asked, no_phone)])
+
+        self.te_client.sms_opt_in.assert_not_called()
+        self.assertEqual(
+            self.queued_payloads("webform-leads-sms"),
+            [{"submission_id": str(opted_in.id), "action": "sms_opt_in", "attempt": 0}],
+        )
+        statuses = dict(LeadSubmission.objects.values_list("id", "sms_status"))
+        self.assertEqual(statuses[opted_in.id], SmsStatus.PENDING)
+        self.assertEqual(statuses[not_asked.id], SmsStatus.NOT_REQUESTED)
+        self.assertEqual(statuses[no_phone.id], SmsStatus.SKIPPED)
+
+    def test_failed_sms_queue_send_leaves_opt_in_pending(self):
+        lead, = self.create_leads(1, ok_to_call=True)
+        self.transport.error_rate = 1.0
+
+        self.process([FakeMessage(lead.id)])
+
+        lead.refresh_from_db()
+        self.assertEqual((lead.status, lead.sms_status), (LeadStatus.SYNCED, SmsStatus.PENDING))
+        self.assertEqual(self.receiver.completed, 1)
+
+    def test_sms_stage_opts_in_pending_lead(self):
+        lead, = self.create_leads(1, status=LeadStatus.SYNCED, sms_status=SmsStatus.PENDING)
+
+        lead = self.sms_stage(lead)
+
+        self.te_client.sms_opt_in.assert_called_once_with(
+            {"phone_number": "5550100", "user": {"external_id": "TE_1"}, "status": "OPTED_IN"}
+        )
+        self.assertEqual(lead.sms_status, SmsStatus.OPTED_IN)
+        self.assertIsNotNone(lead.sms_opted_in_at)
+        self.assertEqual(self.receiver.completed, 1)
+
+    def test_sms_stage_reschedules_failures(self):
+        lead, = self.create_leads(1, status=LeadStatus.SYNCED, sms_status=SmsStatus.PENDING)
+        self.te_client.sms_opt_in.side_effect = http_error(503)
+        sender = FakeSender()
+
+        lead = self.sms_stage(lead, sender=sender)
+
+        (body, _), = sender.scheduled
+        self.assertEqual(body, {"submission_id": str(lead.id), "action": "sms_opt_in", "attempt": 1})
+        self.assertEqual((lead.sms_status, lead.sms_attempt_count), (SmsStatus.PENDING, 1))
+        # The contact's own status is left alone
+        self.assertEqual((lead.status, lead.attempt_count), (LeadStatus.SYNCED, 0))
+
+    def test_sms_stage_last_attempt_fails(self):
+        lead, = self.create_leads(1, status=LeadStatus.SYNCED, sms_status=SmsStatus.PENDING)
+        self.te_client.sms_opt_in.side_effect = http_error(503)
+
+        with mock.patch.object(process_leads, "WORKER_MAX_ATTEMPTS", 3):
+            lead = self.sms_stage(lead, attempt=2)
+
+        self.assertEqual(lead.sms_status, SmsStatus.FAILED)
+        self.assertEqual(self.receiver.completed, 1)
+
+    def test_sms_stage_skips_leads_not_pending(self):
+        lead, = self.create_leads(1, status=LeadStatus.SYNCED, sms_status=SmsStatus.OPTED_IN)
+
+        self.sms_stage(lead)
+
+        self.te_client.sms_opt_in.assert_not_called()
+        self.assertEqual(self.receiver.completed, 1)
+
+
+class DeadLetterDrainTests(FakeServiceBusMixin, SimpleTestCase):
+    """servicebus.drain_dead_letters and `requeue_leads --dead-letter`."""
+
+    def dead_letter(self, count):
+        ids = [str(uuid.uuid4()) for _ in range(count)]
+        self.transport.dead_letter_queue("webform-leads").put(
+            [servicebus.build_lead_message(submission_id, attempt=7) for submission_id in ids]
+        )
+        return ids
+
+    def test_drain_moves_messages_back_onto_the_queue(self):
+        ids = self.dead_letter(3)
+
+        moved = servicebus.drain_dead_letters(batch_size=2, max_wait_time=0)
+
+        self.assertEqual(moved, 3)
+        self.assertEqual(
+            self.queued_payloads(),
+            [{"submission_id": submission_id, "action": "sync_to_crm", "attempt": 7} for submission_id in ids],
+        )
+        dead_letters = self.transport.dead_letter_queue("webform-leads")
+        self.assertEqual((len(dead_letters), dead_letters.completed), (0, 3))
+
+    def test_failed_resend_completes_nothing(self):
+        self.dead_letter(2)
+        self.transport.error_rate = 1.0
+
+        with self.assertRaises(ServiceBusConnectionError):
+            servicebus.drain_dead_letters(max_wait_time=0)
+
+        self.assertEqual(self.transport.dead_letter_queue("webform-leads").completed, 0)
+
+    def test_command_stops_after_max_messages(self):
+        self.dead_letter(3)
+        stdout = io.StringIO()
+
+        call_command("requeue_leads", "--dead-letter", "--max-messages", "2", stdout=stdout)
+
+        self.assertIn("Moved 2 dead-lettered message(s)", stdout.getvalue())
+        self.assertEqual(len(self.queued_payloads()), 2)
+        self.assertEqual(len(self.transport.dead_letter_queue("webform-leads")), 1)
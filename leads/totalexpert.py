@@ -0,0 +1,333 @@
+"""
+Total Expert CRM API client.
+
+All calls go through one pooled, keep-alive requests.Session, so a synced
+lead reuses open TCP+TLS connections instead of paying a handshake per
+call. Every request has explicit connect/read timeouts. Connection
+failures are retried at the transport level for every method; read
+failures and 5xx/429 responses only for idempotent methods, so a
+POST /v1/contacts is never replayed after it may have been processed.
+
+Calls are paced by an optional shared RateLimiter and guarded by an
+optional CircuitBreaker (leads.te_resilience).
+
+Access tokens come from leads.te_tokens (single-flight, refreshed ahead of
+expiry, optionally shared across processes). A call rejected with 401 gets
+a fresh token and is sent once more.
+
+AsyncTotalExpertClient is the asyncio equivalent used by the worker's
+asyncio mode, on a pooled aiohttp session with the same timeouts and
+retry rules.
+"""
+
+import time
+import asyncio
+import logging
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import metrics
+from .te_resilience import parse_retry_after
+from .te_tokens import TokenCache, AsyncTokenCache
+
+logger = logging.getLogger(__name__)
+
+
+def _bearer(access_token):
+    return {"Authorization": f"Bearer {access_token}"}
+
+
+class _GuardedClient:
+    """Rate limiter / circuit breaker bookkeeping shared by both clients."""
+
+    limiter = None
+    breaker = None
+
+    def _record_response(self, status, retry_after):
+        if status == 429:
+            # Throttled, but up: the limiter backs off, the breaker counts it as alive
+            if self.limiter is not None:
+                self.limiter.record_throttled(parse_retry_after(retry_after))
+            if self.breaker is not None:
+                self.breaker.record_success()
+        elif status >= 500:
+            self._record_failure()
+        else:
+            if self.limiter is not None:
+                self.limiter.record_success()
+            if self.breaker is not None:
+                self.breaker.record_success()
+
+    def _record_failure(self):
+        if self.breaker is not None:
+            self.breaker.record_failure()
+
+
+class TotalExpertClient(_GuardedClient):
+    """
+    Pooled HTTP client for the Total Expert API.
+
+    Args:
+        base_url: API root, e.g. https://api.totalexpert.net
+        client_id / client_secret: OAuth client credentials
+        pool_size: Max keep-alive connections kept open to the API
+        connect_timeout / read_timeout: Seconds, applied to every request
+        max_retries: Transport-level retries (see module docstring)
+        backoff_factor: Exponential backoff between retries, in seconds
+        token_cache_shared: Share the access token through Django's cache
+        token_refresh_before: Seconds before expiry to refresh the token
+        limiter: Optional te_resilience.RateLimiter shared across threads
+        breaker: Optional te_resilience.CircuitBreaker; raises CircuitOpenError
+            instead of calling while open
+    """
+
+    def __init__(
+        self,
+        base_url,
+        client_id,
+        client_secret,
+        pool_size=10,
+        connect_timeout=3.05,
+        read_timeout=15,
+        max_retries=3,
+        backoff_factor=0.5,
+        token_cache_shared=False,
+        token_refresh_before=600,
+        limiter=None,
+        breaker=None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.timeout = (connect_timeout, read_timeout)
+        self.limiter = limiter
+        self.breaker = breaker
+        self.tokens = TokenCache(
+            self._request_token, shared=token_cache_shared, refresh_before=token_refresh_before
+        )
+
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,  # excludes POST
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Accept": "application/json"})
+
+    def close(self):
+        """Close pooled connections."""
+        self.session.close()
+
+    def _send(self, path, method="POST", **kwargs):
+        if self.breaker is not None:
+            self.breaker.before_call()
+        if self.limiter is not None:
+            self.limiter.acquire()
+        started = time.perf_counter()
+        recorded = False
+        try:
+            response = self.session.request(method, f"{self.base_url}{path}", timeout=self.timeout, **kwargs)
+            metrics.observe_te_call(path, response.status_code, time.perf_counter() - started)
+            recorded = True
+            self._record_response(response.status_code, response.headers.get("Retry-After"))
+            return response
+        finally:
+            if not recorded:
+                # Any exception counts as a failure, so a half-open probe is always resolved
+                metrics.observe_te_call(path, None, time.perf_counter() - started)
+                self._record_failure()
+
+    def _request_token(self):
+        try:
+            response = self._send(
+                "/v1/token",
+                data={
+                    "grant_type": "client_credentials",
+                    "client_id": self.client_id,
+                    "client_secret": self.client_secret,
+                },
+                headers={"Content-Type": "application/x-www-form-urlencoded"}
+            )
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            logger.error("Failed to get Total Expert access token: %s", e)
+            raise
+
+    def get_access_token(self):
+        """Get a Total Expert OAuth access token (see leads.te_tokens)."""
+        return self.tokens.get()
+
+    def _authorized_request(self, path, payload, method="POST"):
+        access_token = self.tokens.get()
+        response = self._send(path, method, json=payload, headers=_bearer(access_token))
+        if response.status_code == 401:
+            logger.warning("Total Expert rejected the access token, refreshing")
+            access_token = self.tokens.invalidate(access_token)
+            response = self._send(path, method, json=payload, headers=_bearer(access_token))
+        response.raise_for_status()
+        return response
+
+    def create_contact(self, contact_data):
+        """Create/update a contact. Returns the decoded JSON response."""
+        return self._authorized_request("/v1/contacts", contact_data).json()
+
+    def update_contact(self, contact_id, contact_data):
+        """Update an existing contact by its Total Expert id. Returns the decoded JSON response."""
+        return self._authorized_request(f"/v1/contacts/{contact_id}", contact_data, method="PATCH").json()
+
+    def sms_opt_in(self, payload):
+        """Record an SMS opt-in for a phone number."""
+        self._authorized_request("/v1/sms/opt-in", payload)
+
+
+class AsyncTotalExpertClient(_GuardedClient):
+    """
+    Pooled asyncio HTTP client for the Total Expert API.
+
+    Same arguments as TotalExpertClient; pool_size caps the open connections
+    shared by every in-flight request. The session is created lazily, inside
+    the running event loop. Failed calls raise aiohttp.ClientResponseError
+    with the response body as its message.
+
+    Only connection failures are retried: every call is a POST, and
+    anything past the connect may already have been processed.
+    """
+
+    def __init__(
+        self,
+        base_url,
+        client_id,
+        client_secret,
+        pool_size=100,
+        connect_timeout=3.05,
+        read_timeout=15,
+        max_retries=3,
+        backoff_factor=0.5,
+        token_cache_shared=False,
+        token_refresh_before=600,
+        limiter=None,
+        breaker=None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.limiter = limiter
+        self.breaker = breaker
+        self.tokens = AsyncTokenCache(
+            self._request_token, shared=token_cache_shared, refresh_before=token_refresh_before
+        )
+        self.pool_size = pool_size
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=self.timeout,
+                headers={"Accept": "application/json"},
+            )
+        return self._session
+
+    async def close(self):
+        """Close pooled connections."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _request(self, path, method="POST", **kwargs):
+        """Send a request and return the decoded JSON body (None if empty)."""
+        session = self._get_session()
+        attempt = 0
+        while True:
+            if self.breaker is not None:
+                self.breaker.before_call()
+            if self.limiter is not None:
+                await self.limiter.aacquire()
+            started = time.perf_counter()
+            recorded = False
+            try:
+                async with session.request(method, f"{self.base_url}{path}", **kwargs) as response:
+                    body = await response.text()
+                    metrics.observe_te_call(path, response.status, time.perf_counter() - started)
+                    recorded = True
+                    self._record_response(response.status, response.headers.get("Retry-After"))
+                    if response.status >= 400:
+                        raise aiohttp.ClientResponseError(
+                            response.request_info,
+                            response.history,
+                            status=response.status,
+                            message=body,
+                            headers=response.headers,
+                        )
+                    return await response.json(content_type=None) if body else None
+            except aiohttp.ClientConnectorError:
+                # Nothing was sent, so this is safe to retry even for POST
+                if attempt >= self.max_retries:
+                    raise
+            finally:
+                if not recorded:
+                    # Any exception (connection errors, timeouts, payload errors,
+                    # cancellation) counts as a failure, so a half-open probe
+                    # is always resolved
+                    metrics.observe_te_call(path, None, time.perf_counter() - started)
+                    self._record_failure()
+            await asyncio.sleep(self.backoff_factor * (2 ** attempt))
+            attempt += 1
+
+    async def _request_token(self):
+        try:
+            return await self._request(
+                "/v1/token",
+                data={
+                    "grant_type": "client_credentials",
+                    "client_id": self.client_id,
+                    "client_secret": self.client_secret,
+                },
+            )
+        except Exception as e:
+            logger.error("Failed to get Total Expert access token: %s", e)
+            raise
+
+    async def get_access_token(self):
+        """Get a Total Expert OAuth access token (see leads.te_tokens)."""
+        return await self.tokens.get()
+
+    async def _authorized_request(self, path, payload, method="POST"):
+        access_token = await self.tokens.get()
+        try:
+            return await self._request(path, method, json=payload, headers=_bearer(access_token))
+        except aiohttp.ClientResponseError as e:
+            if e.status != 401:
+                raise
+        logger.warning("Total Expert rejected the access token, refreshing")
+        access_token = await self.tokens.invalidate(access_token)
+        return await self._request(path, method, json=payload, headers=_bearer(access_token))
+
+    async def create_contact(self, contact_data):
+        """Create/update a contact. Returns the decoded JSON response."""
+        return await self._authorized_request("/v1/contacts", contact_data)
+
+    async def update_contact(self, contact_id, contact_data):
+        """Update an existing contact by its Total Expert id. Returns the decoded JSON response."""
+        return await self._authorized_request(f"/v1/contacts/{contact_id}", contact_data, method="PATCH")
+
+    async def sms_opt_in(self, payload):
+        """Record an SMS opt-in for a phone number."""
+        await self._authorized_request("/v1/sms/opt-in", payload)
@@ -1,10 +1,18 @@
 """
 URL configuration for leads app.
 """
+from django.conf import settings
 from django.urls import path
-from .views import webform_lead, health_check
+from .views import webform_lead, webform_lead_async, webform_lead_batch, health_check, prometheus_metrics
 
 urlpatterns = [
-    path("api/v1/leads/webform", webform_lead, name="webform_lead"),
+    # Under ASGI the public webform URL is served by the native async view
+    path(
+        "api/v1/leads/webform",
+        webform_lead_async if settings.ASGI_MODE else webform_lead,
+        name="webform_lead",
+    ),
+    path("api/v1/leads/webform/batch", webform_lead_batch, name="webform_lead_batch"),
     path("health", health_check, name="health_check"),
+    path("metrics", prometheus_metrics, name="prometheus_metrics"),
 ]
@@ -2,133 +2,349 @@
 API views for lead submissions.
 """
 
+import hmac
 import json
 import logging
-from django.http import JsonResponse, HttpResponseNotAllowed
-from django.utils import timezone
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, HttpResponseNotAllowed
+from django.db import IntegrityError, transaction
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 
-from core.models import LoanOfficer
-from .models import LeadSubmission, LeadStatus
-from .servicebus import enqueue_lead
+from config import timing
+from config.log import PayloadSummary
+from core.lookups import get_active_loan_officer, get_active_loan_officers, aget_active_loan_officer
+from . import idempotency, metrics
+from .mapping import extract_lead_fields
+from .models import LeadSubmission, LeadStatus, LeadOutbox
 
 logger = logging.getLogger(__name__)
 
 
-@csrf_exempt  # Formidable posts from public pages without CSRF token
-@require_http_methods(["POST"])
-def webform_lead(request):
+def _validate_payload(payload):
     """
-    Receive lead submissions from Formidable webforms.
-    
-    Expected JSON payload:
-    {
-        "lo_slug": "john-smith",  # Required: loan officer slug
-        "first_name": "Jane",
-        "last_name": "Doe",
-        "email": "jane@example.com",
-        "phone": "555-1234",
-        "page_url": "https://directmortgageloans.com/john-smith",
-        "referrer": "https://google.com"
-    }
-    
+    Validate a decoded webform payload.
+
     Returns:
-        201: Lead successfully received and queued
-        400: Invalid request (bad JSON or missing lo_slug)
-        404: Unknown loan officer slug
-        500: Failed to queue lead to Service Bus
+        (lo_slug, None) on success, or (None, (status, error message))
     """
-    
-    # Parse JSON payload
-    try:
-        payload = json.loads(request.body.decode("utf-8") or "{}")
-    except json.JSONDecodeError as e:
-        logger.warning(f"Invalid JSON in request: {e}")
-        return JsonResponse({"error": "Invalid JSON payload"}, status=400)
-    
-    # Get opt in status
-    raw_opt_in = payload.get("comm_opt_in", "")
-    ok_to_email = raw_opt_in is not None and raw_opt_in != ""
-    ok_to_call = ok_to_email
+    if not isinstance(payload, dict):
+        logger.warning("Request payload is not a JSON object")
+        return None, (400, "Invalid JSON payload")
 
     # Extract and validate lo_slug
-    lo_slug = (payload.get("lo_slug") or "").strip().lower()
+    lo_slug = payload.get("lo_slug")
+    if lo_slug is not None and not isinstance(lo_slug, str):
+        logger.warning("Request lo_slug is not a string")
+        return None, (400, "lo_slug must be a string")
+    lo_slug = (lo_slug or "").strip().lower()
     if not lo_slug:
         logger.warning("Request missing lo_slug")
-        return JsonResponse({"error": "lo_slug is required"}, status=400)
-    # DEBUG: Log the actual payload received
-    logger.info(f"WEBHOOK PAYLOAD RECEIVED: {payload}")
+        return None, (400, "lo_slug is required")
 
-    # Find the loan officer
-    try:
-        loan_officer = LoanOfficer.objects.get(slug__iexact=lo_slug, is_active=True)
-    except LoanOfficer.DoesNotExist:
-        logger.warning(f"Unknown or inactive loan officer slug: {lo_slug}")
-        return JsonResponse({"error": f"Unknown loan officer: {lo_slug}"}, status=404)
-    
-    # Extract request metadata
+    return lo_slug, None
+
+
+def _parse_webform(request):
+    """
+    Parse and validate a webform request.
+
+    Returns:
+        (lo_slug, payload, None) on success, or (None, None, error JsonResponse)
+    """
+    # Parse JSON payload
+    with timing.phase("parse"):
+        try:
+            payload = json.loads(request.body.decode("utf-8") or "{}")
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            logger.warning("Invalid JSON in request: %s", e)
+            return None, None, JsonResponse({"error": "Invalid JSON payload"}, status=400)
+
+        lo_slug, error = _validate_payload(payload)
+    if error:
+        status, message = error
+        return None, None, JsonResponse({"error": message}, status=status)
+    # Log a PII-free summary, never the payload itself
+    logger.info("Webform payload received: %s", PayloadSummary(payload))
+
+    return lo_slug, payload, None
+
+
+def _unknown_loan_officer(lo_slug):
+    logger.warning("Unknown or inactive loan officer slug: %s", lo_slug)
+    return JsonResponse({"error": f"Unknown loan officer: {lo_slug}"}, status=404)
+
+
+def _request_metadata(request):
+    """Return (ip_address, user_agent) for the submitting client."""
     ip_address = request.META.get("HTTP_X_FORWARDED_FOR", "").split(",")[0].strip()
     if not ip_address:
         ip_address = request.META.get("REMOTE_ADDR")
     
     user_agent = request.META.get("HTTP_USER_AGENT", "")
-    
-    # Create the lead submission
-    submission = LeadSubmission.objects.create(
+    return ip_address or None, user_agent
+
+
+def _build_submission(payload, loan_officer, ip_address, user_agent):
+    """Build an unsaved LeadSubmission from a validated payload."""
+    return LeadSubmission(
         loan_officer=loan_officer,
-        source="webform",
-        page_url=(payload.get("page_url") or "").strip()[:200],  # Limit to field max_length
-        referrer=(payload.get("referrer") or "").strip()[:200],
-        ip_address=ip_address or None,
+        ip_address=ip_address,
         user_agent=user_agent,
-        first_name=(payload.get("first_name") or "").strip(),
-        last_name=(payload.get("last_name") or "").strip(),
-        email=(payload.get("email") or "").strip(),
-        phone=(payload.get("phone") or "").strip(),
-        ok_to_email=ok_to_email,
-        ok_to_call=ok_to_call,
         raw_payload=payload,
         status=LeadStatus.RECEIVED,
+        # Form fields, opt-in flags and source per leads/form_mappings.py
+        **extract_lead_fields(payload),
     )
+
+
+def _create_submission(request, lo_slug, payload, loan_officer):
+    """
+    Create the lead submission and its outbox entry in one transaction.
+    The relay_lead_outbox command sends it to Service Bus and marks it QUEUED.
+
+    Duplicates (same idempotency key) are not written again.
+
+    Returns:
+        (submission id, created)
+    """
+    with timing.phase("dedup"):
+        key = idempotency.idempotency_key(request, lo_slug, payload)
+        existing_id = idempotency.lookup(key) if key else None
+    if existing_id:
+        logger.info("Duplicate submission for lead %s, skipping", existing_id)
+        return existing_id, False
+
+    submission = _build_submission(payload, loan_officer, *_request_metadata(request))
+    submission.idempotency_key = key
+
+    try:
+        with timing.phase("insert"), metrics.DB_INSERT_SECONDS.time(), transaction.atomic():
+            submission.save(force_insert=True)
+            LeadOutbox.objects.create(submission=submission)
+    except IntegrityError:
+        # Another process stored the same key first
+        existing_id = None
+        if key:
+            existing_id = LeadSubmission.objects.filter(idempotency_key=key).values_list("id", flat=True).first()
+        if existing_id is None:
+            raise
+        idempotency.remember(key, existing_id)
+        logger.info("Duplicate submission for lead %s, skipping", existing_id)
+        return existing_id, False
+
+    if key:
+        idempotency.remember(key, submission.id)
     
-    logger.info(f"Created lead submission {submission.id} for LO {loan_officer.slug}")
-    
-    # Attempt to enqueue to Service Bus
-    if enqueue_lead(str(submission.id)):
-        # Successfully queued
-        submission.status = LeadStatus.QUEUED
-        submission.queued_at = timezone.now()
-        submission.save(update_fields=["status", "queued_at"])
-        
-        logger.info(f"Lead {submission.id} successfully queued to Service Bus")
-        
+    metrics.count_outcome("webform", LeadStatus.RECEIVED)
+    logger.info("Created lead submission %s for LO %s", submission.id, loan_officer.slug)
+    return submission.id, True
+
+
+def _parse_batch(request):
+    """
+    Decode a batch request body into a list of items.
+
+    Accepts a JSON array, or NDJSON (one payload per line) when the
+    Content-Type is application/x-ndjson. NDJSON lines that are not valid
+    JSON become None so they can be reported per item.
+
+    Returns:
+        List of decoded payloads, or None if the body is not a valid batch
+    """
+    try:
+        body = request.body.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+
+    if request.content_type in ("application/x-ndjson", "application/jsonl"):
+        items = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except json.JSONDecodeError:
+                items.append(None)
+        return items
+
+    try:
+        items = json.loads(body or "[]")
+    except json.JSONDecodeError:
+        return None
+    return items if isinstance(items, list) else None
+
+
+def _received_response(submission_id, created):
+    if not created:
         return JsonResponse(
             {
                 "success": True,
-                "id": str(submission.id),
-                "status": "queued",
-                "message": "Lead received and queued for processing"
+                "id": str(submission_id),
+                "status": "duplicate",
+                "message": "Lead already received"
             },
-            status=201
+            status=200
         )
-    else:
-        # Failed to queue - keep as RECEIVED for manual retry
-        submission.attempt_count += 1
-        submission.last_error = "Failed to enqueue to Service Bus"
-        submission.save(update_fields=["attempt_count", "last_error"])
-        
-        logger.error(f"Failed to queue lead {submission.id} to Service Bus")
-        
+
+    return JsonResponse(
+        {
+            "success": True,
+            "id": str(submission_id),
+            "status": "received",
+            "message": "Lead received and queued for processing"
+        },
+        status=201
+    )
+
+
+@csrf_exempt  # Formidable posts from public pages without CSRF token
+@metrics.track_view("webform_lead")
+@require_http_methods(["POST"])
+def webform_lead(request):
+    """
+    Receive lead submissions from Formidable webforms.
+    
+    Expected JSON payload:
+    {
+        "lo_slug": "john-smith",  # Required: loan officer slug
+        "first_name": "Jane",
+        "last_name": "Doe",
+        "email": "jane@example.com",
+        "phone": "555-1234",
+        "page_url": "https://directmortgageloans.com/john-smith",
+        "referrer": "https://google.com"
+    }
+    
+    Honors an Idempotency-Key header; without one, the same lo_slug + email
+    + phone within LEAD_DEDUP_WINDOW seconds counts as a duplicate.
+    
+    Returns:
+        200: Duplicate submission, original id returned and nothing written
+        201: Lead successfully received (queued to Service Bus by the outbox relay)
+        400: Invalid request (bad JSON, missing or non-string lo_slug)
+        404: Unknown loan officer slug
+    """
+    lo_slug, payload, error = _parse_webform(request)
+    if error:
+        return error
+
+    # Find the loan officer
+    with timing.phase("lo_lookup"):
+        loan_officer = get_active_loan_officer(lo_slug)
+    if loan_officer is None:
+        return _unknown_loan_officer(lo_slug)
+    
+    submission_id, created = _create_submission(request, lo_slug, payload, loan_officer)
+    return _received_response(submission_id, created)
+
+
+@csrf_exempt  # Formidable posts from public pages without CSRF token
+@metrics.track_view("webform_lead")
+@require_http_methods(["POST"])
+async def webform_lead_async(request):
+    """
+    Native async version of webform_lead for ASGI deployments.
+
+    Same payload and responses as webform_lead. Loan officer lookups are
+    served from the slug cache without leaving the event loop; the insert
+    runs through sync_to_async because transaction.atomic() is sync-only.
+    """
+    lo_slug, payload, error = _parse_webform(request)
+    if error:
+        return error
+
+    # Find the loan officer
+    with timing.phase("lo_lookup"):
+        loan_officer = await aget_active_loan_officer(lo_slug)
+    if loan_officer is None:
+        return _unknown_loan_officer(lo_slug)
+
+    submission_id, created = await sync_to_async(_create_submission)(request, lo_slug, payload, loan_officer)
+    return _received_response(submission_id, created)
+
+
+@csrf_exempt
+@metrics.track_view("webform_lead_batch")
+@require_http_methods(["POST"])
+def webform_lead_batch(request):
+    """
+    Receive many lead submissions in one request (backfills, partner feeds).
+
+    Body is a JSON array of webform payloads, or NDJSON with
+    Content-Type: application/x-ndjson. Every item is validated with the same
+    rules as webform_lead. Valid items are inserted with one bulk_create plus
+    their outbox entries in a single transaction; the outbox relay sends them
+    to Service Bus in batches.
+
+    Returns:
+        200: Per-item results, in request order:
+             {"index": 0, "status": 201, "id": "...", "success": true}
+             {"index": 1, "status": 400, "error": "lo_slug is required"}
+        400: Body is not a JSON array / NDJSON stream
+        413: More than LEAD_BATCH_MAX_ITEMS items
+    """
+    with timing.phase("parse"):
+        items = _parse_batch(request)
+    if items is None:
+        logger.warning("Invalid batch payload")
+        return JsonResponse({"error": "Expected a JSON array or NDJSON stream"}, status=400)
+
+    if len(items) > settings.LEAD_BATCH_MAX_ITEMS:
         return JsonResponse(
-            {
-                "error": "Failed to queue lead for processing",
-                "id": str(submission.id),
-                "status": "received"
-            },
-            status=500
+            {"error": f"Batch too large (max {settings.LEAD_BATCH_MAX_ITEMS} items)"},
+            status=413
         )
 
+    results = [None] * len(items)
+    valid = []  # (index, lo_slug, payload)
+    for index, payload in enumerate(items):
+        lo_slug, error = _validate_payload(payload)
+        if error:
+            status, message = error
+            results[index] = {"index": index, "status": status, "error": message}
+        else:
+            valid.append((index, lo_slug, payload))
+
+    # Resolve every slug at once
+    with timing.phase("lo_lookup"):
+        loan_officers = get_active_loan_officers({lo_slug for _, lo_slug, _ in valid})
+    ip_address, user_agent = _request_metadata(request)
+
+    submissions = []
+    for index, lo_slug, payload in valid:
+        loan_officer = loan_officers.get(lo_slug)
+        if loan_officer is None:
+            results[index] = {"index": index, "status": 404, "error": f"Unknown loan officer: {lo_slug}"}
+            continue
+        submission = _build_submission(payload, loan_officer, ip_address, user_agent)
+        submissions.append(submission)
+        results[index] = {"index": index, "status": 201, "success": True, "id": str(submission.id)}
+
+    if submissions:
+        with timing.phase("insert"), transaction.atomic():
+            LeadSubmission.objects.bulk_create(submissions)
+            LeadOutbox.objects.bulk_create(
+                [LeadOutbox(submission=submission) for submission in submissions]
+            )
+        metrics.count_outcome("webform", LeadStatus.RECEIVED, len(submissions))
+
+    logger.info(
+        "Batch received %d lead(s): %d created, %d rejected",
+        len(items), len(submissions), len(items) - len(submissions),
+    )
+
+    return JsonResponse(
+        {
+            "received": len(items),
+            "created": len(submissions),
+            "rejected": len(items) - len(submissions),
+            "results": results,
+        },
+        status=200
+    )
+
 
 @require_http_methods(["GET"])
 def health_check(request):
@@ -136,3 +352,20 @@ def health_check(request):
     Simple health check endpoint for Azure monitoring.
     """
     return JsonResponse({"status": "healthy", "service": "dml-marketing-middleware"})
+
+
+@require_http_methods(["GET"])
+def prometheus_metrics(request):
+    """
+    Prometheus scrape endpoint (see leads/metrics.py).
+
+    Requires "Authorization: Bearer <METRICS_TOKEN>". Without a
+    METRICS_TOKEN the endpoint does not exist (404): this app is public.
+    """
+    token = settings.METRICS_TOKEN
+    if not token:
+        return HttpResponse(status=404)
+    supplied = request.headers.get("Authorization", "").encode()
+    if not hmac.compare_digest(supplied, f"Bearer {token}".encode()):
+        return HttpResponse(status=401)
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
@@ -26,6 +26,9 @@ python -V
 echo "Running migrations..."
 python manage.py migrate --noinput
 
+# Create the cache table (no-op unless CACHE_BACKEND=db)
+python manage.py createcachetable
+
 # Create superuser if environment variables are set
 if [ -n "${DJANGO_CREATE_SUPERUSER:-}" ] && [ "${DJANGO_CREATE_SUPERUSER}" = "1" ]; then
   echo "Checking for superuser..."
@@ -47,18 +50,59 @@ fi
 # Display database connection info (without password)
 python manage.py shell -c "from django.conf import settings; db = settings.DATABASES['default']; print(f\"Database: {db['ENGINE']} @ {db['HOST']}:{db['PORT']}/{db['NAME']}\")"
 
-# Start worker in background
-echo "Starting Lead Processing Worker..."
-python workers/process_leads.py &
+# Prometheus metrics of the gunicorn workers and the outbox relay are kept
+# here and summed by /metrics; start each deploy from an empty directory
+export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus-metrics}"
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
+# Start worker supervisor in background: runs the contact and SMS stage
+# workers, restarts crashed ones, and drains them on SIGTERM. The SMS stage
+# (WORKER_SMS_PROCESSES, default 1) needs the SERVICEBUS_SMS_QUEUE_NAME queue
+# (default webform-leads-sms) to exist; set WORKER_SMS_PROCESSES=0 without it
+echo "Starting Lead Processing Workers..."
+python workers/supervisor.py &
+WORKER_PID=$!
+
+# Start outbox relay in background (sends received leads to Service Bus)
+echo "Starting Lead Outbox Relay..."
+python manage.py relay_lead_outbox &
+RELAY_PID=$!
 
 # Collect static files (needed for Jazzmin CSS/JS)
 python manage.py collectstatic --noinput
 
-# Start Gunicorn in foreground
-echo "Starting Gunicorn..."
-exec gunicorn config.wsgi:application \
-  --bind 0.0.0.0:8000 \
-  --workers 2 \
-  --timeout 120 \
-  --access-logfile - \
-  --error-logfile -
\ No newline at end of file
+# Start Gunicorn
+if [ "${DJANGO_ASGI:-0}" = "1" ]; then
+  echo "Starting Gunicorn (ASGI, uvicorn workers)..."
+  gunicorn config.asgi:application \
+    --config config/gunicorn_conf.py \
+    --worker-class uvicorn.workers.UvicornWorker \
+    --bind 0.0.0.0:8000 \
+    --workers 2 \
+    --timeout 120 \
+    --access-logfile - \
+    --error-logfile - &
+else
+  echo "Starting Gunicorn..."
+  gunicorn config.wsgi:application \
+    --config config/gunicorn_conf.py \
+    --bind 0.0.0.0:8000 \
+    --workers 2 \
+    --timeout 120 \
+    --access-logfile - \
+    --error-logfile - &
+fi
+WEB_PID=$!
+
+# The platform sends SIGTERM to this script only: pass it on so Gunicorn
+# finishes its requests and the workers settle their in-flight messages
+trap 'kill -TERM "$WEB_PID" "$WORKER_PID" "$RELAY_PID" 2>/dev/null || true' TERM INT
+
+wait "$WEB_PID" || true
+
+# Gunicorn is stopping or gone: stop the background processes too and wait
+# for the workers to drain
+kill -TERM "$WORKER_PID" "$RELAY_PID" 2>/dev/null || true
+wait "$WORKER_PID" || true
+wait "$WEB_PID" || true
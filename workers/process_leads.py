@@ -6,29 +6,48 @@ import os
 import sys
 import time
 import json
+import uuid
+import random
+import signal
+import asyncio
 import logging
-from datetime import datetime
-from django.db import connection
+import threading
+from collections import namedtuple
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.db import close_old_connections
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Django setup
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+# Persistent DB connections are for the worker only; the web app closes its
+# connection after each request unless MYSQL_CONN_MAX_AGE says otherwise
+os.environ["MYSQL_CONN_MAX_AGE"] = os.getenv("WORKER_CONN_MAX_AGE", "60")
 import django
 django.setup()
 
+from asgiref.sync import sync_to_async
 from django.utils import timezone
-from azure.servicebus import ServiceBusClient
-from leads.models import LeadSubmission, LeadStatus
+from azure.servicebus import AutoLockRenewer, ServiceBusClient
+from azure.servicebus.aio import (
+    AutoLockRenewer as AsyncAutoLockRenewer,
+    ServiceBusClient as AsyncServiceBusClient,
+)
+from config import timing
+from leads import contact_index, metrics
+from leads.models import LeadSubmission, LeadStatus, SmsStatus
+from leads.servicebus import build_lead_message, build_sms_message, enqueue_sms_opt_ins
+from leads.te_resilience import CircuitBreaker, CircuitOpenError, RateLimiter, parse_retry_after
+from leads.totalexpert import TotalExpertClient, AsyncTotalExpertClient
+import aiohttp
 import requests
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+# Logging is configured by django.setup() from settings.LOGGING: records are
+# queued and written by a background thread (config.log), so log I/O never
+# blocks message processing.
+logger = logging.getLogger("workers.process_leads")
 
 # Total Expert configuration
 TE_CLIENT_ID = os.getenv("TE_CLIENT_ID", "")
@@ -38,239 +57,1021 @@ TE_API_URL = os.getenv("TE_API_URL", "https://api.totalexpert.net")
 # Service Bus configuration
 SERVICEBUS_CONNECTION_STRING = os.getenv("SERVICEBUS_CONNECTION_STRING", "")
 SERVICEBUS_QUEUE_NAME = os.getenv("SERVICEBUS_QUEUE_NAME", "webform-leads")
+SERVICEBUS_SMS_QUEUE_NAME = os.getenv("SERVICEBUS_SMS_QUEUE_NAME", "webform-leads-sms")
 
-# Cache for access token
-_access_token = None
-_token_expires_at = None
+# Worker configuration
+# "contacts" (default) syncs leads to Total Expert; "sms" records SMS opt-ins
+WORKER_STAGE = os.getenv("WORKER_STAGE", "contacts").strip().lower()
+# "threads" (default) or "asyncio"
+WORKER_MODE = os.getenv("WORKER_MODE", "threads").strip().lower()
+# threads mode: WORKER_CONCURRENCY > 1 processes each received batch on a thread pool.
+# asyncio mode: maximum number of leads in flight at once.
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "1"))
+# How long AutoLockRenewer keeps renewing a message lock while it is processed
+WORKER_LOCK_RENEWAL_SECONDS = int(os.getenv("WORKER_LOCK_RENEWAL_SECONDS", "300"))
+# Failed syncs are rescheduled with exponential backoff (base * 2^n, jittered,
+# capped) until WORKER_MAX_ATTEMPTS, then the lead is marked FAILED
+WORKER_MAX_ATTEMPTS = int(os.getenv("WORKER_MAX_ATTEMPTS", "8"))
+WORKER_RETRY_BASE_SECONDS = float(os.getenv("WORKER_RETRY_BASE_SECONDS", "30"))
+WORKER_RETRY_MAX_SECONDS = float(os.getenv("WORKER_RETRY_MAX_SECONDS", "3600"))
+# Longest one receive waits for messages; also how long a shutdown request
+# can go unnoticed by an idle worker
+WORKER_RECEIVE_WAIT_SECONDS = float(os.getenv("WORKER_RECEIVE_WAIT_SECONDS", "5"))
+# asyncio mode: after SIGTERM, seconds to let in-flight leads finish before
+# abandoning the rest (keep below the supervisor's WORKER_SHUTDOWN_TIMEOUT)
+WORKER_DRAIN_SECONDS = float(os.getenv("WORKER_DRAIN_SECONDS", "45"))
 
+# Total Expert HTTP client tuning
+TE_POOL_SIZE = int(os.getenv("TE_POOL_SIZE", str(max(10, WORKER_CONCURRENCY))))
+TE_CONNECT_TIMEOUT = float(os.getenv("TE_CONNECT_TIMEOUT", "3.05"))
+TE_READ_TIMEOUT = float(os.getenv("TE_READ_TIMEOUT", "15"))
+TE_MAX_RETRIES = int(os.getenv("TE_MAX_RETRIES", "3"))
+# Share one access token across processes via Django's cache (needs CACHE_BACKEND=db)
+TE_TOKEN_CACHE_SHARED = os.getenv("TE_TOKEN_CACHE_SHARED", "0") == "1"
+# Refresh the access token in the background this many seconds before it expires
+TE_TOKEN_REFRESH_SECONDS = int(os.getenv("TE_TOKEN_REFRESH_SECONDS", "600"))
+# Total Expert calls per second for this process (halved on each 429, then
+# recovers); 0 = no cap, only pause for Retry-After on 429. Not shared between
+# processes: N supervised workers can send N times this rate
+TE_RATE_LIMIT = float(os.getenv("TE_RATE_LIMIT", "0"))
+TE_RATE_BURST = int(os.getenv("TE_RATE_BURST", "0")) or None
+# Consecutive failures that open the circuit, and seconds before a probe is sent
+TE_BREAKER_THRESHOLD = int(os.getenv("TE_BREAKER_THRESHOLD", "5"))
+TE_BREAKER_RESET_SECONDS = float(os.getenv("TE_BREAKER_RESET_SECONDS", "30"))
+# Leads matching a contact already synced for the same LO (by email/phone):
+# "update" PATCHes the known contact, "skip" reuses it without calling Total
+# Expert, "off" always creates
+TE_CONTACT_INDEX = os.getenv("TE_CONTACT_INDEX", "update").strip().lower()
+# Only trust contact index entries synced within this many days
+TE_CONTACT_INDEX_MAX_AGE = timedelta(days=float(os.getenv("TE_CONTACT_INDEX_MAX_AGE_DAYS", "30")))
+# Seconds between limiter/breaker debug log lines
+WORKER_METRICS_INTERVAL = int(os.getenv("WORKER_METRICS_INTERVAL", "60"))
+# Port of the Prometheus metrics listener (0 = off); the supervisor serves
+# its workers' metrics itself and starts them with 0
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "9200"))
+# Profile every Nth batch with cProfile (0 = off), written to PROFILE_DIR.
+# With WORKER_CONCURRENCY > 1 the pool threads are not in the profile.
+WORKER_PROFILE_SAMPLE_RATE = int(os.getenv("WORKER_PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/profiles")
+
+# Shared by every thread/task in this process
+te_limiter = RateLimiter(rate=TE_RATE_LIMIT, burst=TE_RATE_BURST)
+te_breaker = CircuitBreaker(failure_threshold=TE_BREAKER_THRESHOLD, reset_timeout=TE_BREAKER_RESET_SECONDS)
+
+# Every Total Expert call goes through this pooled, keep-alive client
+te_client = TotalExpertClient(
+    TE_API_URL,
+    TE_CLIENT_ID,
+    TE_CLIENT_SECRET,
+    pool_size=TE_POOL_SIZE,
+    connect_timeout=TE_CONNECT_TIMEOUT,
+    read_timeout=TE_READ_TIMEOUT,
+    max_retries=TE_MAX_RETRIES,
+    token_cache_shared=TE_TOKEN_CACHE_SHARED,
+    token_refresh_before=TE_TOKEN_REFRESH_SECONDS,
+    limiter=te_limiter,
+    breaker=te_breaker,
+)
+
+_metrics_logged_at = 0.0
+
+messages_in_flight = metrics.MESSAGES_IN_FLIGHT.labels(WORKER_STAGE)
+
+batch_profiler = timing.Profiler(sample_rate=WORKER_PROFILE_SAMPLE_RATE, directory=PROFILE_DIR)
+
+# Set by SIGTERM/SIGINT: stop receiving, finish and settle the messages in
+# flight, then exit. Checked by the receive loops.
+shutdown_requested = threading.Event()
 
-def get_te_access_token():
-    """Get Total Expert OAuth access token."""
-    global _access_token, _token_expires_at
-    
-    # Return cached token if still valid
-    if _access_token and _token_expires_at and datetime.now() < _token_expires_at:
-        return _access_token
-    
-    logger.info("Requesting new Total Expert access token...")
-    
-    try:
-        response = requests.post(
-            f"{TE_API_URL}/v1/token",
-            data={
-                "grant_type": "client_credentials",
-                "client_id": TE_CLIENT_ID,
-                "client_secret": TE_CLIENT_SECRET,
-            },
-            headers={"Content-Type": "application/x-www-form-urlencoded"}
-        )
-        response.raise_for_status()
-        
-        data = response.json()
-        _access_token = data["access_token"]
-        expires_in = data.get("expires_in", 3600)
-        _token_expires_at = datetime.now() + timezone.timedelta(seconds=expires_in - 300)  # 5 min buffer
-        
-        logger.info("Successfully obtained Total Expert access token")
-        return _access_token
-        
-    except Exception as e:
-        logger.error(f"Failed to get Total Expert access token: {e}")
-        raise
 
+def request_shutdown(signum, frame=None):
+    """
+    Signal handler: ask the receive loop to drain and stop.
 
-def sms_opt_in(submission, access_token):
+    Only sets the event: logging from a signal handler can deadlock on a
+    handler lock the interrupted thread already holds. The receive loop
+    logs once it sees the request.
     """
-    Opt a contact into SMS communications via Total Expert.
+    shutdown_requested.set()
 
-    Called after successful contact creation, only when:
-      - submission.ok_to_call is True (lead checked the opt-in box)
-      - submission.phone is non-empty
 
-    Uses the LO's te_owner_id as the owning user (external_id).
-    Failure here is non-blocking — contact creation already succeeded.
+def log_te_metrics():
+    """
+    Debug aid: log rate limiter, circuit breaker and contact index state at
+    most every WORKER_METRICS_INTERVAL seconds. The same values are exported
+    as Prometheus metrics (leads/metrics.py).
     """
+    global _metrics_logged_at
+
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    now = time.monotonic()
+    if now - _metrics_logged_at < WORKER_METRICS_INTERVAL:
+        return
+    _metrics_logged_at = now
+    logger.debug(
+        "Total Expert limiter=%s breaker=%s contacts=%s",
+        te_limiter.snapshot(), te_breaker.snapshot(), contact_index.stats.snapshot()
+    )
+
+
+def receive_limit(max_message_count):
+    """Messages to receive next: just one (the probe) while the circuit is half-open."""
+    if te_breaker.current_state() == CircuitBreaker.HALF_OPEN:
+        return 1
+    return max_message_count
+
+
+def sms_skip_reason(submission):
+    """Why an opted-in lead's SMS opt-in cannot be sent, or None if it can."""
     if not submission.phone:
-        logger.info(f"Lead {submission.id} has no phone number, skipping SMS opt-in")
+        return "Lead has no phone number"
+    if not submission.loan_officer.te_owner_id:
+        return "LO has no te_owner_id"
+    return None
+
+
+def build_sms_opt_in_payload(submission):
+    """Build the SMS opt-in request; the LO's te_owner_id is the owning user (external_id)."""
+    return {
+        "phone_number": submission.phone,
+        "user": {
+            "external_id": submission.loan_officer.te_owner_id
+        },
+        "status": "OPTED_IN"
+    }
+
+
+def request_sms_opt_in(submission):
+    """
+    Mark a just-synced lead's SMS opt-in PENDING (not saved); it is queued
+    to the SMS stage once the batch's status is written.
+
+    Only when the lead checked the opt-in box (ok_to_call), has a phone
+    number and its LO has a te_owner_id; otherwise it is SKIPPED.
+    """
+    if not submission.ok_to_call:
+        logger.info("Lead %s did not opt in to SMS, skipping opt-in call", submission.id)
+        return
+    if submission.sms_status == SmsStatus.OPTED_IN:
         return
 
-    lo_external_id = submission.loan_officer.te_owner_id
-    if not lo_external_id:
-        logger.warning(f"Lead {submission.id}: LO has no te_owner_id, skipping SMS opt-in")
+    reason = sms_skip_reason(submission)
+    if reason:
+        logger.warning("Lead %s: %s, skipping SMS opt-in", submission.id, reason)
+        submission.sms_status = SmsStatus.SKIPPED
+        submission.sms_last_error = reason
         return
+    submission.sms_status = SmsStatus.PENDING
 
-    logger.info(f"Sending SMS opt-in for lead {submission.id} (LO external_id: {lo_external_id})...")
 
-    try:
-        payload = {
-            "phone_number": submission.phone,
-            "user": {
-                "external_id": lo_external_id
+def build_contact_data(submission):
+    """Build the Total Expert contact payload for a submission."""
+    return {
+        # contact's name and contact info
+        "first_name": submission.first_name,
+        "last_name": submission.last_name,
+        "email": submission.email,
+        "phone_cell": submission.phone,
+        # main source
+        "source": "Your LO Website Lead",
+        # opt in to comms status
+        "ok_to_email": submission.ok_to_email,
+        "ok_to_call": submission.ok_to_call,
+        # owner assignment
+        "owner": {
+            "external_id": submission.loan_officer.te_owner_id,
+            "email": submission.loan_officer.email
+        },
+        # custom fields to inject
+        "custom": [
+            {
+                "field_name": "lead_source_1",
+                "value": "Web"
+            },
+            {
+                "field_name": "lead_source_2",
+                "value": "Formidable LO Bio Page Form"
             },
-            "status": "OPTED_IN"
-        }
-
-        response = requests.post(
-            f"{TE_API_URL}/v1/sms/opt-in",
-            json=payload,
-            headers={
-                "Authorization": f"Bearer {access_token}",
-                "Content-Type": "application/json"
+            {
+                "field_name": "website_lead_info",
+                "value": "Your LO Website Lead"
             }
-        )
-        response.raise_for_status()
+        ]
+    }
 
-        logger.info(f"SMS opt-in successful for lead {submission.id}")
 
-    except requests.HTTPError as e:
-        # Non-blocking: log the error but do not affect the synced status
-        logger.error(
-            f"SMS opt-in HTTP error for lead {submission.id}: "
-            f"{e.response.status_code} - {e.response.text}"
-        )
+# Fields written back after a sync attempt; everything else (raw_payload,
+# user_agent, ...) is left alone.
+STATUS_FIELDS = ["status", "te_contact_id", "synced_at", "attempt_count", "last_error", "sms_status", "sms_last_error"]
+
+
+def flush_status_updates(submissions):
+    """
+    Write the status fields of every synced/failed submission in one
+    bulk_update, then record the contacts Total Expert confirmed in the
+    contact index.
+    """
+    if not submissions:
+        return
+    with timing.phase("status_update"):
+        LeadSubmission.objects.bulk_update(submissions, STATUS_FIELDS)
+    metrics.record_outcomes("worker", [submission.status for submission in submissions])
+
+    confirmed = [submission for submission in submissions if getattr(submission, "te_contact_confirmed", False)]
+    if confirmed and TE_CONTACT_INDEX != "off":
+        try:
+            contact_index.remember(confirmed)
+        except Exception as e:
+            # Only an optimization: the leads themselves are stored
+            logger.warning("Failed to update contact index for %s lead(s): %s", len(confirmed), e)
 
+
+def pending_sms_opt_ins(submissions):
+    """Ids of just-synced leads whose SMS opt-in is PENDING."""
+    return [
+        submission.id for submission in submissions
+        if submission.status == LeadStatus.SYNCED and submission.sms_status == SmsStatus.PENDING
+    ]
+
+
+def queue_sms_opt_ins(submissions):
+    """
+    Send the SMS stage a message for each just-synced lead with a PENDING
+    opt-in. A failed send is logged, not raised: the contact is synced, and
+    the opt-ins stay PENDING for `manage.py requeue_leads --sms`.
+    """
+    pending = pending_sms_opt_ins(submissions)
+    if not pending:
+        return
+    try:
+        with timing.phase("enqueue"):
+            enqueue_sms_opt_ins(pending)
+        logger.info("Queued %s SMS opt-in(s)", len(pending))
     except Exception as e:
-        logger.error(f"SMS opt-in unexpected error for lead {submission.id}: {e}")
+        logger.error("Failed to queue %s SMS opt-in(s), left pending: %s", len(pending), e)
+
+
+def flush_contact_updates(submissions):
+    """Contact stage flush: write the batch's status fields, then queue its SMS opt-ins."""
+    flush_status_updates(submissions)
+    queue_sms_opt_ins(submissions)
+
+
+def mark_synced(submission, te_contact_id, confirmed=True):
+    """
+    Set the synced status fields on a submission (not saved).
+
+    confirmed: Total Expert returned te_contact_id for this lead (False when
+    it was reused from the contact index without a call).
+    """
+    submission.status = LeadStatus.SYNCED
+    submission.te_contact_id = str(te_contact_id)
+    submission.synced_at = timezone.now()
+    submission.last_error = ""
+    submission.te_contact_confirmed = confirmed
+
+
+def known_contact(submission):
+    """The fresh contact index match set on a submission at load time, or None."""
+    return getattr(submission, "known_te_contact_id", None)
+
+
+def upsert_contact(submission):
+    """
+    Create the lead's contact in Total Expert, or update the contact it
+    already has (see TE_CONTACT_INDEX).
+
+    Returns:
+        (te_contact_id, whether Total Expert was called)
+    """
+    contact_data = build_contact_data(submission)
+    te_contact_id = known_contact(submission)
+    if te_contact_id:
+        if TE_CONTACT_INDEX == "skip":
+            logger.info("Lead %s matches Total Expert contact %s, skipping create", submission.id, te_contact_id)
+            return te_contact_id, False
+        try:
+            result = te_client.update_contact(te_contact_id, contact_data)
+            logger.info("Lead %s matches Total Expert contact %s, updated it", submission.id, te_contact_id)
+            return result.get("id") or te_contact_id, True
+        except requests.HTTPError as e:
+            if e.response.status_code != 404:
+                raise
+            contact_index.stats.record_stale()
+            logger.info("Total Expert contact %s is gone, creating a new one for lead %s", te_contact_id, submission.id)
+
+    result = te_client.create_contact(contact_data)
+    return result.get("id") or result.get("contactId"), True
+
+
+def mark_failed(submission, error_msg):
+    """Set the terminal failed status fields on a submission (not saved)."""
+    logger.error("Failed to sync lead %s: %s", submission.id, error_msg)
+    submission.status = LeadStatus.FAILED
+    submission.attempt_count += 1
+    submission.last_error = error_msg[:500]  # Truncate if too long
+
+
+def mark_retrying(submission, error_msg):
+    """Record a failed attempt on a lead that will be retried (not saved)."""
+    logger.warning("Sync attempt %s failed for lead %s, will retry: %s", submission.attempt_count + 1, submission.id, error_msg)
+    submission.status = LeadStatus.QUEUED
+    submission.attempt_count += 1
+    submission.last_error = error_msg[:500]
 
 
-def sync_lead_to_total_expert(submission):
-    """Sync a lead submission to Total Expert CRM."""
-    logger.info(f"Syncing lead {submission.id} to Total Expert...")
+# What to do with a message once its lead has been processed
+COMPLETE = "complete"  # synced, already synced, or terminally failed
+RETRY = "retry"  # transient failure: reschedule with backoff, then complete
+ABANDON = "abandon"  # unreadable message or missing lead: let Service Bus redeliver
+
+# retry_after: minimum delay asked for by Total Expert (Retry-After)
+# attempted: False when the lead was never sent (circuit open), so the
+#            retry does not use up an attempt
+SyncResult = namedtuple("SyncResult", ["action", "submission", "retry_after", "attempted"], defaults=(None, 0.0, True))
+
+# 4xx statuses that can succeed on a later attempt
+RETRYABLE_STATUSES = {401, 408, 425, 429}
+
+
+def is_permanent_status(status):
+    """Whether a Total Expert error status will fail again however often it is retried."""
+    return 400 <= status < 500 and status not in RETRYABLE_STATUSES
+
+
+def is_final_attempt(attempt, status=None):
+    """Whether a failed attempt should not be retried: a permanent 4xx, or the last allowed attempt."""
+    return (status is not None and is_permanent_status(status)) or attempt + 1 >= WORKER_MAX_ATTEMPTS
+
+
+def record_failure(submission, attempt, error_msg, status=None, retry_after=0.0):
+    """
+    Record a failed sync attempt.
+
+    Permanent 4xx errors, and the last allowed attempt, mark the lead FAILED
+    and complete its message; anything else is rescheduled.
+    """
+    if is_final_attempt(attempt, status):
+        mark_failed(submission, error_msg)
+        return SyncResult(COMPLETE, submission)
+    mark_retrying(submission, error_msg)
+    return SyncResult(RETRY, submission, retry_after)
+
+
+def sync_lead_to_total_expert(submission, attempt=0):
+    """
+    Sync a lead submission to Total Expert CRM.
+
+    Only sets the status fields; the caller writes them with
+    flush_status_updates() before settling the message.
+
+    Returns:
+        SyncResult
+    """
+    logger.info("Syncing lead %s to Total Expert...", submission.id)
     
     try:
-        # Get access token
-        access_token = get_te_access_token()
-        
-        # Prepare contact data
-        contact_data = {
-            # contact's name and contact info
-            "first_name": submission.first_name,
-            "last_name": submission.last_name,
-            "email": submission.email,
-            "phone_cell": submission.phone,
-            # main source
-            "source": "Your LO Website Lead",
-            # opt in to comms status
-            "ok_to_email": submission.ok_to_email,
-            "ok_to_call": submission.ok_to_call,
-            # owner assignment
-            "owner": {
-                "external_id": submission.loan_officer.te_owner_id,
-                "email": submission.loan_officer.email
-            },
-            # custom fields to inject
-            "custom": [
-                {
-                    "field_name": "lead_source_1",
-                    "value": "Web"
-                },
-                {
-                    "field_name": "lead_source_2",
-                    "value": "Formidable LO Bio Page Form"
-                },
-                {
-                    "field_name": "website_lead_info",
-                    "value": "Your LO Website Lead"
-                }
-            ]
-        }
-        
         # Create/update contact in Total Expert
-        response = requests.post(
-            f"{TE_API_URL}/v1/contacts",
-            json=contact_data,
-            headers={
-                "Authorization": f"Bearer {access_token}",
-                "Content-Type": "application/json"
-            }
-        )
-        response.raise_for_status()
-        
-        result = response.json()
-        te_contact_id = result.get("id") or result.get("contactId")
+        te_contact_id, confirmed = upsert_contact(submission)
         
         # Update submission status
-        submission.status = LeadStatus.SYNCED
-        submission.te_contact_id = str(te_contact_id)
-        submission.synced_at = timezone.now()
-        submission.last_error = ""
-        submission.save()
+        mark_synced(submission, te_contact_id, confirmed)
         
-        logger.info(f"Successfully synced lead {submission.id} to Total Expert (contact ID: {te_contact_id})")
+        logger.info("Successfully synced lead %s to Total Expert (contact ID: %s)", submission.id, te_contact_id)
 
-        # -------------------------------------------------------
-        # SMS opt-in: only if the lead explicitly opted in
-        # -------------------------------------------------------
-        if submission.ok_to_call:
-            sms_opt_in(submission, access_token)
-        else:
-            logger.info(f"Lead {submission.id} did not opt in to SMS, skipping opt-in call")
-        # -------------------------------------------------------
+        # SMS opt-in runs as its own stage (WORKER_STAGE=sms), off this path
+        request_sms_opt_in(submission)
 
-        return True
+        return SyncResult(COMPLETE, submission)
         
-    except requests.HTTPError as e:
-        error_msg = f"Total Expert API error: {e.response.status_code} - {e.response.text}"
-        logger.error(f"Failed to sync lead {submission.id}: {error_msg}")
-        
-        submission.status = LeadStatus.FAILED
-        submission.attempt_count += 1
-        submission.last_error = error_msg[:500]  # Truncate if too long
-        submission.save()
+    except CircuitOpenError:
+        # Never sent: leave the lead as it is and retry later
+        logger.warning("Total Expert circuit open, lead %s not sent", submission.id)
+        return SyncResult(RETRY, attempted=False)
         
-        return False
+    except requests.HTTPError as e:
+        return record_failure(
+            submission,
+            attempt,
+            f"Total Expert API error: {e.response.status_code} - {e.response.text}",
+            status=e.response.status_code,
+            retry_after=parse_retry_after(e.response.headers.get("Retry-After"), 0.0),
+        )
         
     except Exception as e:
-        error_msg = f"Unexpected error: {str(e)}"
-        logger.error(f"Failed to sync lead {submission.id}: {error_msg}")
-        
-        submission.status = LeadStatus.FAILED
-        submission.attempt_count += 1
-        submission.last_error = error_msg[:500]
-        submission.save()
-        
-        return False
+        return record_failure(submission, attempt, f"Unexpected error: {str(e)}")
 
 
-def process_message(message):
-    """Process a single Service Bus message."""
-    connection.close()
+def parse_message(message):
+    """
+    Read a lead message.
+
+    Returns:
+        (submission id as a UUID or None, attempt number)
+    """
     try:
-        # Parse message body
         message_body = json.loads(str(message))
         submission_id = message_body.get("submission_id")
-        
         if not submission_id:
             logger.warning("Message missing submission_id")
-            return False
+            return None, 0
+        return uuid.UUID(str(submission_id)), int(message_body.get("attempt") or 0)
+    except (ValueError, TypeError, AttributeError) as e:
+        logger.warning("Invalid message body: %s", e)
+        return None, 0
+
+
+def parse_batch(messages):
+    """Parse a received batch into [(message, submission id or None, attempt)]."""
+    return [(message, *parse_message(message)) for message in messages]
+
+
+def submissions_query(ids):
+    """
+    Queryset loading a batch's submissions and their loan officers in one query.
+    The contact payload needs the loan officer, and asyncio mode cannot lazy-load it.
+    """
+    return LeadSubmission.objects.select_related("loan_officer").filter(id__in=ids)
+
+
+def load_submissions(parsed):
+    """
+    Load every submission of a parsed batch in one query, keyed by id, and
+    look their contacts up in the contact index (one more query).
+    """
+    ids = {submission_id for _, submission_id, _ in parsed if submission_id}
+    if not ids:
+        return {}
+    submissions = {submission.id: submission for submission in submissions_query(ids)}
+    if TE_CONTACT_INDEX != "off":
+        contact_index.annotate_known_contacts(list(submissions.values()), TE_CONTACT_INDEX_MAX_AGE)
+    return submissions
+
+
+def process_submission(submission_id, submission, attempt=0):
+    """
+    Sync one prefetched submission (None if it is not in the database).
+
+    Returns:
+        SyncResult; its submission (if any) has status fields to write
+    """
+    try:
+        if not submission_id:
+            return SyncResult(ABANDON)
         
-        logger.info(f"Processing message for submission {submission_id}")
+        logger.info("Processing message for submission %s (attempt %s)", submission_id, attempt)
         
-        # Get submission from database
-        try:
-            submission = LeadSubmission.objects.get(id=submission_id)
-        except LeadSubmission.DoesNotExist:
-            logger.error(f"Submission {submission_id} not found in database")
-            return False
+        if submission is None:
+            logger.error("Submission %s not found in database", submission_id)
+            return SyncResult(ABANDON)
         
         # Skip if already synced
         if submission.status == LeadStatus.SYNCED:
-            logger.info(f"Submission {submission_id} already synced, skipping")
-            return True
+            logger.info("Submission %s already synced, skipping", submission_id)
+            return SyncResult(COMPLETE)
         
         # Sync to Total Expert
-        return sync_lead_to_total_expert(submission)
+        return sync_lead_to_total_expert(submission, attempt)
         
     except Exception as e:
-        logger.error(f"Error processing message: {e}", exc_info=True)
-        return False
+        logger.error("Error processing message: %s", e, exc_info=True)
+        return SyncResult(ABANDON)
+
+
+def process_in_pool(process, submission_id, submission, attempt):
+    """Run a stage's process function on a pool thread, which keeps its own connection."""
+    # Drops the thread's connection if it is past CONN_MAX_AGE or broke
+    # earlier; otherwise it is reused after a health check.
+    close_old_connections()
+    return process(submission_id, submission, attempt)
+
+
+def retry_delay(attempt, retry_after=0.0):
+    """
+    Seconds before retry number `attempt` (1-based): exponential backoff
+    with jitter, capped at WORKER_RETRY_MAX_SECONDS, never below retry_after.
+    """
+    delay = min(WORKER_RETRY_MAX_SECONDS, WORKER_RETRY_BASE_SECONDS * 2 ** (attempt - 1))
+    return max(retry_after, random.uniform(delay / 2, delay))
+
+
+def retry_message(submission_id, attempt, retry_after, build_message=build_lead_message):
+    """Build the rescheduled copy of a lead message. Returns (message, enqueue time)."""
+    delay = retry_delay(attempt, retry_after)
+    logger.info("Rescheduling lead %s in %.0fs (attempt %s)", submission_id, delay, attempt)
+    return build_message(str(submission_id), attempt=attempt), timezone.now() + timedelta(seconds=delay)
+
+
+def settle_message(receiver, sender, message, submission_id, attempt, result, build_message=build_lead_message):
+    """
+    Settle a processed message. Must be called from the receiving thread.
+
+    A retried lead is rescheduled as a new message first; the original is
+    completed only once that copy is safely on the queue.
+    """
+    if result.action == RETRY:
+        try:
+            next_attempt = attempt + 1 if result.attempted else attempt
+            sender.schedule_messages(*retry_message(submission_id, next_attempt, result.retry_after, build_message))
+        except Exception as e:
+            logger.error("Failed to reschedule lead %s: %s", submission_id, e)
+            receiver.abandon_message(message)
+            logger.warning("Message abandoned, will retry")
+            return
+
+    if result.action == ABANDON:
+        # Abandon the message (will retry later)
+        receiver.abandon_message(message)
+        logger.warning("Message abandoned, will retry")
+    else:
+        # Complete the message (remove from queue)
+        receiver.complete_message(message)
+        logger.info("Message completed successfully")
+
+
+# ---------------------------------------------------------------------------
+# SMS opt-in stage (WORKER_STAGE=sms)
+#
+# The contact stage marks opted-in leads PENDING and queues them on
+# SERVICEBUS_SMS_QUEUE_NAME. This stage records the opt-ins in Total Expert
+# with its own consumer, concurrency and retry/backoff, so contact sync
+# never waits on the SMS endpoint.
+# ---------------------------------------------------------------------------
+
+# Fields written back after an SMS opt-in attempt
+SMS_FIELDS = ["sms_status", "sms_attempt_count", "sms_last_error", "sms_opted_in_at"]
+
+
+def record_sms_failure(submission, attempt, error_msg, status=None, retry_after=0.0):
+    """Record a failed SMS opt-in attempt; same retry rules as record_failure."""
+    submission.sms_attempt_count += 1
+    submission.sms_last_error = error_msg[:500]
+    if is_final_attempt(attempt, status):
+        logger.error("SMS opt-in failed for lead %s: %s", submission.id, error_msg)
+        submission.sms_status = SmsStatus.FAILED
+        return SyncResult(COMPLETE, submission)
+    logger.warning("SMS opt-in attempt %s failed for lead %s, will retry: %s", submission.sms_attempt_count, submission.id, error_msg)
+    return SyncResult(RETRY, submission, retry_after)
+
+
+def opt_in_sms(submission, attempt=0):
+    """
+    Record a lead's SMS opt-in in Total Expert.
+
+    Returns:
+        SyncResult
+    """
+    logger.info("Sending SMS opt-in for lead %s (LO external_id: %s)...", submission.id, submission.loan_officer.te_owner_id)
+
+    try:
+        te_client.sms_opt_in(build_sms_opt_in_payload(submission))
+
+    except CircuitOpenError:
+        logger.warning("Total Expert circuit open, SMS opt-in for lead %s not sent", submission.id)
+        return SyncResult(RETRY, attempted=False)
+
+    except requests.HTTPError as e:
+        return record_sms_failure(
+            submission,
+            attempt,
+            f"SMS opt-in HTTP error: {e.response.status_code} - {e.response.text}",
+            status=e.response.status_code,
+            retry_after=parse_retry_after(e.response.headers.get("Retry-After"), 0.0),
+        )
+
+    except Exception as e:
+        return record_sms_failure(submission, attempt, f"Unexpected error: {str(e)}")
+
+    submission.sms_status = SmsStatus.OPTED_IN
+    submission.sms_opted_in_at = timezone.now()
+    submission.sms_last_error = ""
+    logger.info("SMS opt-in successful for lead %s", submission.id)
+    return SyncResult(COMPLETE, submission)
+
+
+def load_sms_submissions(parsed):
+    """Load every submission of a parsed SMS batch in one query, keyed by id."""
+    ids = {submission_id for _, submission_id, _ in parsed if submission_id}
+    if not ids:
+        return {}
+    return {submission.id: submission for submission in submissions_query(ids)}
+
+
+def process_sms_submission(submission_id, submission, attempt=0):
+    """SMS stage counterpart of process_submission."""
+    try:
+        if not submission_id:
+            return SyncResult(ABANDON)
+
+        logger.info("Processing SMS opt-in for submission %s (attempt %s)", submission_id, attempt)
+
+        if submission is None:
+            logger.error("Submission %s not found in database", submission_id)
+            return SyncResult(ABANDON)
+
+        # Already opted in, or requeued after it was skipped
+        if submission.sms_status != SmsStatus.PENDING:
+            logger.info("SMS opt-in for submission %s is %s, skipping", submission_id, submission.sms_status)
+            return SyncResult(COMPLETE)
+
+        return opt_in_sms(submission, attempt)
+
+    except Exception as e:
+        logger.error("Error processing SMS message: %s", e, exc_info=True)
+        return SyncResult(ABANDON)
+
+
+def flush_sms_updates(submissions):
+    """Write the SMS fields of every processed submission in one bulk_update."""
+    if submissions:
+        with timing.phase("status_update"):
+            LeadSubmission.objects.bulk_update(submissions, SMS_FIELDS)
+        metrics.record_outcomes("sms", [submission.sms_status for submission in submissions])
+
+
+# How a worker stage loads a batch's submissions, processes one, writes
+# their fields back and builds its rescheduled messages
+Stage = namedtuple("Stage", ["load", "process", "flush", "build_message"])
+
+CONTACT_STAGE = Stage(load_submissions, process_submission, flush_contact_updates, build_lead_message)
+SMS_STAGE = Stage(load_sms_submissions, process_sms_submission, flush_sms_updates, build_sms_message)
+STAGES = {"contacts": CONTACT_STAGE, "sms": SMS_STAGE}
+
+
+def process_batch(receiver, sender, messages, pool, stage=CONTACT_STAGE):
+    """
+    Process a received batch and settle every message.
+
+    All of the batch's submissions, with their loan officers, are loaded in
+    one query up front. With a pool, leads are then synced concurrently by
+    the pool threads (each with its own Django DB connection).
+
+    Status changes are written with a single bulk_update once every lead
+    has been processed, and only then are messages settled (on this, the
+    receiving thread): completed, rescheduled with backoff through `sender`,
+    or abandoned. If the write fails, the whole batch is abandoned so no
+    message is completed without its status stored.
+
+    `stage` selects the contact sync (default) or the SMS opt-in stage.
+    """
+    close_old_connections()
+    parsed = parse_batch(messages)
+    try:
+        with timing.phase("load"):
+            submissions = stage.load(parsed)
+    except Exception as e:
+        logger.error("Failed to load submissions for batch: %s", e, exc_info=True)
+        abandon_all(receiver, messages)
+        return
+
+    results = []  # (message, submission id, attempt, SyncResult)
+    with timing.phase("sync"):
+        if pool is None:
+            for message, submission_id, attempt in parsed:
+                result = stage.process(submission_id, submissions.get(submission_id), attempt)
+                results.append((message, submission_id, attempt, result))
+        else:
+            futures = {
+                pool.submit(process_in_pool, stage.process, submission_id, submissions.get(submission_id), attempt): (message, submission_id, attempt)
+                for message, submission_id, attempt in parsed
+            }
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error("Error handling message: %s", e, exc_info=True)
+                    result = SyncResult(ABANDON)
+                results.append((*futures[future], result))
+
+    updated = [result.submission for *_, result in results if result.submission is not None]
+    try:
+        stage.flush(updated)
+    except Exception as e:
+        logger.error("Failed to write status for %s lead(s): %s", len(updated), e, exc_info=True)
+        abandon_all(receiver, messages)
+        return
+
+    with timing.phase("settle"):
+        for message, submission_id, attempt, result in results:
+            try:
+                settle_message(receiver, sender, message, submission_id, attempt, result, stage.build_message)
+            except Exception as e:
+                logger.error("Error settling message: %s", e, exc_info=True)
+
+
+def abandon_all(receiver, messages):
+    """Abandon every message of a batch, logging (not raising) failures."""
+    for message in messages:
+        try:
+            receiver.abandon_message(message)
+        except Exception as e:
+            logger.error("Error abandoning message: %s", e)
+
+
+# ---------------------------------------------------------------------------
+# asyncio mode (WORKER_MODE=asyncio)
+#
+# One event loop keeps up to WORKER_CONCURRENCY leads in flight, with
+# Service Bus receives, Total Expert calls and lock renewal all async.
+# ORM calls go through Django's async API, which runs them one at a time on
+# a single sync thread; they are short next to the Total Expert round trip.
+# ---------------------------------------------------------------------------
+
+async def async_upsert_contact(te, submission):
+    """Async version of upsert_contact."""
+    contact_data = build_contact_data(submission)
+    te_contact_id = known_contact(submission)
+    if te_contact_id:
+        if TE_CONTACT_INDEX == "skip":
+            logger.info("Lead %s matches Total Expert contact %s, skipping create", submission.id, te_contact_id)
+            return te_contact_id, False
+        try:
+            result = await te.update_contact(te_contact_id, contact_data)
+            logger.info("Lead %s matches Total Expert contact %s, updated it", submission.id, te_contact_id)
+            return (result or {}).get("id") or te_contact_id, True
+        except aiohttp.ClientResponseError as e:
+            if e.status != 404:
+                raise
+            contact_index.stats.record_stale()
+            logger.info("Total Expert contact %s is gone, creating a new one for lead %s", te_contact_id, submission.id)
+
+    result = await te.create_contact(contact_data)
+    return result.get("id") or result.get("contactId"), True
+
+
+async def async_sync_lead_to_total_expert(te, submission, attempt=0):
+    """Async version of sync_lead_to_total_expert."""
+    logger.info("Syncing lead %s to Total Expert...", submission.id)
+
+    try:
+        te_contact_id, confirmed = await async_upsert_contact(te, submission)
+
+        mark_synced(submission, te_contact_id, confirmed)
+
+        logger.info("Successfully synced lead %s to Total Expert (contact ID: %s)", submission.id, te_contact_id)
+
+        request_sms_opt_in(submission)
+
+        return SyncResult(COMPLETE, submission)
+
+    except CircuitOpenError:
+        # Never sent: leave the lead as it is and retry later
+        logger.warning("Total Expert circuit open, lead %s not sent", submission.id)
+        return SyncResult(RETRY, attempted=False)
+
+    except aiohttp.ClientResponseError as e:
+        return record_failure(
+            submission,
+            attempt,
+            f"Total Expert API error: {e.status} - {e.message}",
+            status=e.status,
+            retry_after=parse_retry_after((e.headers or {}).get("Retry-After"), 0.0),
+        )
+
+    except Exception as e:
+        return record_failure(submission, attempt, f"Unexpected error: {str(e)}")
+
+
+async def async_load_submissions(parsed):
+    """Async version of load_submissions."""
+    ids = {submission_id for _, submission_id, _ in parsed if submission_id}
+    if not ids:
+        return {}
+    submissions = {submission.id: submission async for submission in submissions_query(ids)}
+    if TE_CONTACT_INDEX != "off":
+        await sync_to_async(contact_index.annotate_known_contacts)(list(submissions.values()), TE_CONTACT_INDEX_MAX_AGE)
+    return submissions
+
+
+async def async_process_submission(te, submission_id, submission, attempt=0):
+    """Async version of process_submission."""
+    try:
+        if not submission_id:
+            return SyncResult(ABANDON)
+
+        logger.info("Processing message for submission %s (attempt %s)", submission_id, attempt)
+
+        if submission is None:
+            logger.error("Submission %s not found in database", submission_id)
+            return SyncResult(ABANDON)
+
+        if submission.status == LeadStatus.SYNCED:
+            logger.info("Submission %s already synced, skipping", submission_id)
+            return SyncResult(COMPLETE)
+
+        return await async_sync_lead_to_total_expert(te, submission, attempt)
+
+    except Exception as e:
+        logger.error("Error processing message: %s", e, exc_info=True)
+        return SyncResult(ABANDON)
+
+
+async def async_settle_message(receiver, sender, message, submission_id, attempt, result):
+    """Async version of settle_message."""
+    if result.action == RETRY:
+        try:
+            next_attempt = attempt + 1 if result.attempted else attempt
+            await sender.schedule_messages(*retry_message(submission_id, next_attempt, result.retry_after))
+        except Exception as e:
+            logger.error("Failed to reschedule lead %s: %s", submission_id, e)
+            await receiver.abandon_message(message)
+            logger.warning("Message abandoned, will retry")
+            return
+
+    if result.action == ABANDON:
+        await receiver.abandon_message(message)
+        logger.warning("Message abandoned, will retry")
+    else:
+        await receiver.complete_message(message)
+        logger.info("Message completed successfully")
+
+
+async def async_queue_sms_opt_ins(sms_sender, submissions):
+    """Async version of queue_sms_opt_ins, sending through the loop's own SMS queue sender."""
+    pending = pending_sms_opt_ins(submissions)
+    if not pending:
+        return
+    try:
+        await sms_sender.send_messages([build_sms_message(str(submission_id)) for submission_id in pending])
+        logger.info("Queued %s SMS opt-in(s)", len(pending))
+    except Exception as e:
+        logger.error("Failed to queue %s SMS opt-in(s), left pending: %s", len(pending), e)
+
+
+async def async_settle_finished(receiver, sender, sms_sender, in_flight, timeout):
+    """
+    Wait up to `timeout` seconds (None = until one finishes) for in-flight
+    leads, write the finished leads' status fields in one bulk_update, queue
+    their SMS opt-ins through `sms_sender`, then settle their messages.
+
+    Settlement stays in the receive loop, never in the lead tasks, so the
+    receiver is only used by one coroutine at a time.
+    """
+    done, _ = await asyncio.wait(in_flight, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    if not done:
+        return
+
+    results = [(*in_flight.pop(task), task.result()) for task in done]
+    messages_in_flight.set(len(in_flight))
+
+    updated = [result.submission for *_, result in results if result.submission is not None]
+    try:
+        await sync_to_async(flush_status_updates)(updated)
+    except Exception as e:
+        logger.error("Failed to write status for %s lead(s): %s", len(updated), e, exc_info=True)
+        results = [(message, submission_id, attempt, SyncResult(ABANDON)) for message, submission_id, attempt, _ in results]
+    else:
+        await async_queue_sms_opt_ins(sms_sender, updated)
+
+    for message, submission_id, attempt, result in results:
+        try:
+            await async_settle_message(receiver, sender, message, submission_id, attempt, result)
+        except Exception as e:
+            logger.error("Error settling message: %s", e, exc_info=True)
+
+
+async def async_start_batch(te, receiver, renewer, messages, in_flight):
+    """Load a received batch's submissions in one query and start a task per lead."""
+    parsed = parse_batch(messages)
+    try:
+        submissions = await async_load_submissions(parsed)
+    except Exception as e:
+        logger.error("Failed to load submissions for batch: %s", e, exc_info=True)
+        for message in messages:
+            await receiver.abandon_message(message)
+        return
+
+    for message, submission_id, attempt in parsed:
+        renewer.register(receiver, message)
+        task = asyncio.create_task(async_process_submission(te, submission_id, submissions.get(submission_id), attempt))
+        in_flight[task] = (message, submission_id, attempt)
+    messages_in_flight.set(len(in_flight))
+
+
+async def async_pause(seconds):
+    """asyncio.sleep that returns early once shutdown is requested."""
+    deadline = time.monotonic() + seconds
+    while not shutdown_requested.is_set():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        await asyncio.sleep(min(remaining, 1))
+
+
+async def async_drain(receiver, sender, sms_sender, in_flight):
+    """
+    After a shutdown request: settle the leads still in flight as they
+    finish, then cancel and abandon any still running after
+    WORKER_DRAIN_SECONDS so Service Bus redelivers them straight away
+    instead of after their lock expires.
+    """
+    if in_flight:
+        logger.info("Draining %s lead(s) in flight...", len(in_flight))
+    deadline = time.monotonic() + WORKER_DRAIN_SECONDS
+    while in_flight:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        await async_settle_finished(receiver, sender, sms_sender, in_flight, remaining)
+
+    if not in_flight:
+        return
+    logger.warning("Abandoning %s lead(s) still in flight after %ss", len(in_flight), WORKER_DRAIN_SECONDS)
+    for task in in_flight:
+        task.cancel()
+    await asyncio.gather(*in_flight, return_exceptions=True)
+    for message, *_ in in_flight.values():
+        try:
+            await receiver.abandon_message(message)
+        except Exception as e:
+            logger.error("Error abandoning message: %s", e)
+    in_flight.clear()
+    messages_in_flight.set(0)
+
+
+async def run_async_worker():
+    """Receive loop for WORKER_MODE=asyncio."""
+    te = AsyncTotalExpertClient(
+        TE_API_URL,
+        TE_CLIENT_ID,
+        TE_CLIENT_SECRET,
+        pool_size=TE_POOL_SIZE,
+        connect_timeout=TE_CONNECT_TIMEOUT,
+        read_timeout=TE_READ_TIMEOUT,
+        max_retries=TE_MAX_RETRIES,
+        token_cache_shared=TE_TOKEN_CACHE_SHARED,
+        token_refresh_before=TE_TOKEN_REFRESH_SECONDS,
+        limiter=te_limiter,
+        breaker=te_breaker,
+    )
+    renewer = AsyncAutoLockRenewer(max_lock_renewal_duration=WORKER_LOCK_RENEWAL_SECONDS)
+    in_flight = {}  # task -> (message, submission_id, attempt)
+
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, request_shutdown, signum)
+
+    async with AsyncServiceBusClient.from_connection_string(SERVICEBUS_CONNECTION_STRING) as client:
+        async with client.get_queue_receiver(queue_name=SERVICEBUS_QUEUE_NAME) as receiver, \
+                client.get_queue_sender(queue_name=SERVICEBUS_QUEUE_NAME) as sender, \
+                client.get_queue_sender(queue_name=SERVICEBUS_SMS_QUEUE_NAME) as sms_sender:
+            logger.info("Connected to Service Bus, waiting for messages...")
+
+            try:
+                while not shutdown_requested.is_set():
+                    try:
+                        log_te_metrics()
+
+                        # Total Expert is down: stop taking messages until the breaker probes
+                        pause = te_breaker.seconds_until_probe()
+                        if pause:
+                            if in_flight:
+                                await async_settle_finished(receiver, sender, sms_sender, in_flight, min(pause, 1))
+                            else:
+                                logger.warning("Total Expert circuit open, pausing receive for %.0fs", pause)
+                                await async_pause(pause)
+                            continue
+
+                        free = receive_limit(WORKER_CONCURRENCY - len(in_flight))
+                        if free <= 0:
+                            # Wake at least every second to notice a shutdown request
+                            await async_settle_finished(receiver, sender, sms_sender, in_flight, 1)
+                            continue
+
+                        # Poll briefly while leads are in flight so finished ones get settled
+                        messages = await receiver.receive_messages(
+                            max_message_count=free,
+                            max_wait_time=1 if in_flight else WORKER_RECEIVE_WAIT_SECONDS,
+                        )
+
+                        if messages:
+                            logger.info("Received %s message(s), %s in flight", len(messages), len(in_flight))
+                            await sync_to_async(close_old_connections)()
+                            await async_start_batch(te, receiver, renewer, messages, in_flight)
+
+                        if in_flight:
+                            await async_settle_finished(receiver, sender, sms_sender, in_flight, 0)
+
+                    except Exception as e:
+                        logger.error("Worker error: %s", e, exc_info=True)
+                        await async_pause(5)  # Wait before retrying
+
+                logger.info("Received shutdown request, draining in-flight messages...")
+                await async_drain(receiver, sender, sms_sender, in_flight)
+            finally:
+                await renewer.close()
+                await te.close()
+    logger.info("Worker stopped")
 
 
 def main():
     """Main worker loop."""
     logger.info("Starting Lead Processing Worker...")
-    logger.info(f"Service Bus Queue: {SERVICEBUS_QUEUE_NAME}")
-    logger.info(f"Total Expert API: {TE_API_URL}")
+    queue_name = SERVICEBUS_SMS_QUEUE_NAME if WORKER_STAGE == "sms" else SERVICEBUS_QUEUE_NAME
+    logger.info("Stage: %s, Service Bus Queue: %s", WORKER_STAGE, queue_name)
+    logger.info("Total Expert API: %s", TE_API_URL)
+    logger.info("Mode: %s, concurrency: %s", WORKER_MODE, WORKER_CONCURRENCY)
     
     if not SERVICEBUS_CONNECTION_STRING:
         logger.error("SERVICEBUS_CONNECTION_STRING not configured")
@@ -280,47 +1081,103 @@ def main():
         logger.error("Total Expert credentials not configured")
         sys.exit(1)
     
+    if WORKER_STAGE not in STAGES:
+        logger.error("Unknown WORKER_STAGE: %s", WORKER_STAGE)
+        sys.exit(1)
+    stage = STAGES[WORKER_STAGE]
+    
+    if WORKER_METRICS_PORT:
+        try:
+            metrics.start_listener(WORKER_METRICS_PORT)
+            logger.info("Serving metrics on port %s", WORKER_METRICS_PORT)
+        except OSError as e:
+            logger.warning("Metrics listener not started on port %s: %s", WORKER_METRICS_PORT, e)
+    
+    if WORKER_MODE == "asyncio":
+        if stage is not CONTACT_STAGE:
+            logger.error("WORKER_STAGE=%s only runs with WORKER_MODE=threads", WORKER_STAGE)
+            sys.exit(1)
+        try:
+            asyncio.run(run_async_worker())
+        except KeyboardInterrupt:
+            logger.info("Shutting down worker...")
+        return
+    
+    if WORKER_MODE != "threads":
+        logger.error("Unknown WORKER_MODE: %s", WORKER_MODE)
+        sys.exit(1)
+    
+    # Thread pool for concurrent mode; None keeps the original sequential loop
+    pool = ThreadPoolExecutor(max_workers=WORKER_CONCURRENCY, thread_name_prefix="lead-sync") if WORKER_CONCURRENCY > 1 else None
+    # Keeps message locks alive while slow Total Expert syncs are in flight
+    renewer = AutoLockRenewer(max_lock_renewal_duration=WORKER_LOCK_RENEWAL_SECONDS)
+    batch_size = max(10, WORKER_CONCURRENCY)
+    
+    # SIGTERM (deploys, the supervisor) and Ctrl-C let the current batch finish and settle
+    signal.signal(signal.SIGTERM, request_shutdown)
+    signal.signal(signal.SIGINT, request_shutdown)
+    
     # Connect to Service Bus
     with ServiceBusClient.from_connection_string(SERVICEBUS_CONNECTION_STRING) as client:
-        with client.get_queue_receiver(queue_name=SERVICEBUS_QUEUE_NAME) as receiver:
+        with client.get_queue_receiver(queue_name=queue_name) as receiver, \
+                client.get_queue_sender(queue_name=queue_name) as sender:
             logger.info("Connected to Service Bus, waiting for messages...")
             
-            while True:
-                try:
-                    # Receive messages (wait up to 60 seconds)
-                    messages = receiver.receive_messages(max_message_count=10, max_wait_time=60)
-                    
-                    if not messages:
-                        logger.debug("No messages received, continuing...")
-                        continue
-                    
-                    logger.info(f"Received {len(messages)} message(s)")
-                    
-                    for message in messages:
+            try:
+                while not shutdown_requested.is_set():
+                    try:
+                        log_te_metrics()
+
+                        # Total Expert is down: stop taking messages until the breaker probes
+                        pause = te_breaker.seconds_until_probe()
+                        if pause:
+                            logger.warning("Total Expert circuit open, pausing receive for %.0fs", pause)
+                            shutdown_requested.wait(pause)
+                            continue
+                        
+                        # Receive messages (short waits so a shutdown request is seen promptly)
+                        messages = receiver.receive_messages(
+                            max_message_count=receive_limit(batch_size),
+                            max_wait_time=WORKER_RECEIVE_WAIT_SECONDS,
+                        )
+                        
+                        if not messages:
+                            logger.debug("No messages received, continuing...")
+                            continue
+                        
+                        logger.info("Received %s message(s)", len(messages))
+                        
+                        for message in messages:
+                            renewer.register(receiver, message)
+                        
+                        # Runs to completion even if SIGTERM arrives meanwhile: every
+                        # message of the batch is settled before the loop checks again
+                        messages_in_flight.set(len(messages))
                         try:
-                            success = process_message(message)
-                            
-                            if success:
-                                # Complete the message (remove from queue)
-                                receiver.complete_message(message)
-                                logger.info("Message completed successfully")
-                            else:
-                                # Abandon the message (will retry later)
-                                receiver.abandon_message(message)
-                                logger.warning("Message abandoned, will retry")
-                                
-                        except Exception as e:
-                            logger.error(f"Error handling message: {e}", exc_info=True)
-                            receiver.abandon_message(message)
-                    
-                except KeyboardInterrupt:
-                    logger.info("Shutting down worker...")
-                    break
-                    
-                except Exception as e:
-                    logger.error(f"Worker error: {e}", exc_info=True)
-                    time.sleep(5)  # Wait before retrying
+                            with timing.measure() as timings, \
+                                    batch_profiler.profile(f"batch-{WORKER_STAGE}", batch_profiler.should_sample()):
+                                process_batch(receiver, sender, messages, pool, stage)
+                        finally:
+                            messages_in_flight.set(0)
+                        timing.log_timings("Processed batch", timings, stage=WORKER_STAGE, messages=len(messages))
+                        
+                    except KeyboardInterrupt:
+                        logger.info("Shutting down worker...")
+                        break
+                        
+                    except Exception as e:
+                        logger.error("Worker error: %s", e, exc_info=True)
+                        shutdown_requested.wait(5)  # Wait before retrying
+
+                if shutdown_requested.is_set():
+                    logger.info("Received shutdown request, draining in-flight messages...")
+            finally:
+                renewer.close()
+                if pool is not None:
+                    pool.shutdown(wait=True)
+                te_client.close()
+    logger.info("Worker stopped")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
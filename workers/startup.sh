@@ -10,5 +10,8 @@ python --version
 echo "Installing dependencies..."
 pip install -r workers/requirements.txt
 
-echo "Starting worker process..."
-exec python workers/process_leads.py
\ No newline at end of file
+# The supervisor also runs WORKER_SMS_PROCESSES (default 1) SMS-stage workers,
+# which need the SERVICEBUS_SMS_QUEUE_NAME queue (default webform-leads-sms).
+# Create it before deploying, or set WORKER_SMS_PROCESSES=0.
+echo "Starting worker supervisor..."
+exec python workers/supervisor.py
\ No newline at end of file
@@ -0,0 +1,189 @@
+"""
+Supervisor for the lead processing workers.
+
+Runs WORKER_PROCESSES contact-stage workers (default: one per CPU) and
+WORKER_SMS_PROCESSES SMS-stage workers, each its own
+`python workers/process_leads.py` process, and restarts any that exit with
+exponential backoff.
+
+On SIGTERM or SIGINT every worker is sent SIGTERM: it stops receiving,
+finishes and settles the messages it holds, and exits. Workers still
+running after WORKER_SHUTDOWN_TIMEOUT seconds are killed.
+
+With WORKER_METRICS_PORT set, the workers write their Prometheus metrics to
+WORKER_METRICS_DIR and the supervisor serves the sum of them on that port.
+
+Usage:
+    python workers/supervisor.py
+"""
+
+import os
+import sys
+import time
+import shutil
+import signal
+import logging
+import subprocess
+
+from prometheus_client import CollectorRegistry, multiprocess, start_http_server
+
+logger = logging.getLogger("workers.supervisor")
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "process_leads.py")
+
+# Contact-stage worker processes (0 or unset = one per CPU)
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "0")) or os.cpu_count() or 1
+# SMS-stage worker processes (0 = none). They need the SERVICEBUS_SMS_QUEUE_NAME
+# queue (default webform-leads-sms) to exist in the Service Bus namespace
+WORKER_SMS_PROCESSES = int(os.getenv("WORKER_SMS_PROCESSES", "1"))
+# Delay before restarting a worker that exited: doubles with each consecutive
+# crash up to the max, and resets once a worker stays up WORKER_RESTART_STABLE_SECONDS
+WORKER_RESTART_BASE_SECONDS = float(os.getenv("WORKER_RESTART_BASE_SECONDS", "1"))
+WORKER_RESTART_MAX_SECONDS = float(os.getenv("WORKER_RESTART_MAX_SECONDS", "60"))
+WORKER_RESTART_STABLE_SECONDS = float(os.getenv("WORKER_RESTART_STABLE_SECONDS", "60"))
+# Seconds workers get to drain after SIGTERM before they are killed
+WORKER_SHUTDOWN_TIMEOUT = float(os.getenv("WORKER_SHUTDOWN_TIMEOUT", "60"))
+# Port serving every worker's Prometheus metrics (0 = off), and the directory
+# the workers write them to (emptied at startup)
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "9200"))
+WORKER_METRICS_DIR = os.getenv("WORKER_METRICS_DIR", "/tmp/lead-worker-metrics")
+
+_stop_signal = None  # Set by request_stop
+
+
+def request_stop(signum, frame=None):
+    """
+    Signal handler: stop restarting workers and drain them.
+
+    Only records the signal: logging from a signal handler can deadlock on
+    a handler lock the interrupted code already holds. main() logs it.
+    """
+    global _stop_signal
+
+    _stop_signal = signum
+
+
+def restart_delay(failures):
+    """Backoff before restarting a worker that has exited `failures` times in a row."""
+    return min(WORKER_RESTART_MAX_SECONDS, WORKER_RESTART_BASE_SECONDS * 2 ** (failures - 1))
+
+
+class WorkerSlot:
+    """One supervised worker process and its restart state."""
+
+    def __init__(self, stage, index):
+        self.stage = stage
+        self.name = f"{stage}-{index}"
+        self.process = None
+        self.started_at = 0.0
+        self.failures = 0
+        self.restart_at = 0.0  # monotonic time the next start is due
+
+    def start(self):
+        env = dict(os.environ, WORKER_STAGE=self.stage, WORKER_METRICS_PORT="0")
+        # Never the web app's metrics directory, which /metrics would then include
+        env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+        if WORKER_METRICS_PORT:
+            env["PROMETHEUS_MULTIPROC_DIR"] = WORKER_METRICS_DIR
+        if self.stage == "sms":
+            # The SMS stage only runs in threads mode
+            env["WORKER_MODE"] = "threads"
+        self.process = subprocess.Popen([sys.executable, WORKER_SCRIPT], env=env)
+        self.started_at = time.monotonic()
+        logger.info("Started worker %s (pid %s)", self.name, self.process.pid)
+
+    def check(self):
+        """Start the worker when due; if it has exited, schedule its restart."""
+        now = time.monotonic()
+        if self.process is None:
+            if now >= self.restart_at:
+                self.start()
+            return
+
+        code = self.process.poll()
+        if code is None:
+            return
+
+        if WORKER_METRICS_PORT:
+            # Drop its in-flight gauge; its counters stay in the totals
+            multiprocess.mark_process_dead(self.process.pid, WORKER_METRICS_DIR)
+        if now - self.started_at >= WORKER_RESTART_STABLE_SECONDS:
+            self.failures = 0
+        self.failures += 1
+        delay = restart_delay(self.failures)
+        self.process = None
+        self.restart_at = now + delay
+        logger.error("Worker %s exited with code %s, restarting in %.1fs", self.name, code, delay)
+
+    def terminate(self):
+        if self.process is None:
+            return
+        try:
+            self.process.send_signal(signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    def wait(self, deadline):
+        """Wait for the worker to drain until `deadline`, then kill it."""
+        if self.process is None:
+            return
+        try:
+            code = self.process.wait(timeout=max(0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            logger.warning("Worker %s did not drain in %.0fs, killing it", self.name, WORKER_SHUTDOWN_TIMEOUT)
+            self.process.kill()
+            self.process.wait()
+        else:
+            logger.info("Worker %s stopped with code %s", self.name, code)
+        self.process = None
+
+
+def serve_metrics():
+    """Start from an empty WORKER_METRICS_DIR and serve its sum on WORKER_METRICS_PORT."""
+    shutil.rmtree(WORKER_METRICS_DIR, ignore_errors=True)
+    os.makedirs(WORKER_METRICS_DIR)
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=WORKER_METRICS_DIR)
+    try:
+        start_http_server(WORKER_METRICS_PORT, registry=registry)
+        logger.info("Serving worker metrics on port %s", WORKER_METRICS_PORT)
+    except OSError as e:
+        logger.warning("Metrics listener not started on port %s: %s", WORKER_METRICS_PORT, e)
+
+
+def shutdown(slots):
+    """SIGTERM every worker, then wait for them to drain."""
+    for slot in slots:
+        slot.terminate()
+    deadline = time.monotonic() + WORKER_SHUTDOWN_TIMEOUT
+    for slot in slots:
+        slot.wait(deadline)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="{levelname} {asctime} {module} {message}", style="{")
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    if WORKER_METRICS_PORT:
+        serve_metrics()
+
+    slots = [WorkerSlot("contacts", index) for index in range(WORKER_PROCESSES)]
+    slots += [WorkerSlot("sms", index) for index in range(WORKER_SMS_PROCESSES)]
+    logger.info("Supervising %s contact and %s SMS worker(s)", WORKER_PROCESSES, WORKER_SMS_PROCESSES)
+    if WORKER_SMS_PROCESSES:
+        logger.info("SMS workers consume queue %s, which must exist",
+                    os.getenv("SERVICEBUS_SMS_QUEUE_NAME", "webform-leads-sms"))
+
+    try:
+        while _stop_signal is None:
+            for slot in slots:
+                slot.check()
+            time.sleep(0.5)
+        logger.info("Received %s, stopping workers...", signal.Signals(_stop_signal).name)
+    finally:
+        shutdown(slots)
+    logger.info("All workers stopped")
+
+
+if __name__ == "__main__":
+    main()